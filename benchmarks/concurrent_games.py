@@ -0,0 +1,103 @@
+""" Load test for GameManager under concurrent submissions, the way Starlette's thread pool calls it.
+
+Both players of every game submit each turn at the same moment. Every turn must be resolved
+exactly once; lost or duplicate resolutions are reported as failures.
+
+    python -m benchmarks.concurrent_games --games 2000 --turns 10
+    python -m benchmarks.concurrent_games --backend sqlite --games 200
+"""
+import argparse
+import random
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from src.entities.entities import Factions, FleeDecision
+from src.entities.request_models import CreateGameRequest, JoinGameRequest, SubmitMoveRequest, SubmitLostRequest
+from src.game_service import GameManager
+from src.game_store import InMemoryGameStore, SqliteGameStore
+from src.state_manager import MOVE_RECEIVED, DECISION_RECEIVED
+
+WAITING_MESSAGES = {MOVE_RECEIVED, DECISION_RECEIVED}
+TAILED_FIRST = "Waiting for the tailed player to move first"
+
+
+def submit(service: GameManager, game_id: str, faction: Factions, lost: bool, move_index: int):
+    if lost:
+        return service.submit_lost_decision(SubmitLostRequest(
+            game_id=game_id, faction=faction, decision=FleeDecision.CHASE
+        ))
+    return service.submit_move(SubmitMoveRequest(game_id=game_id, faction=faction, move_index=move_index))
+
+
+def play_game(service: GameManager, requests: ThreadPoolExecutor, game_id: str, turns: int, seed: int):
+    """ Plays ``turns`` turns, both submissions racing each other. Returns the number of bad turns. """
+    rng = random.Random(seed)
+    creator = rng.choice(list(Factions))
+    service.create_game(CreateGameRequest(game_id=game_id, player_name="first", faction=creator.value))
+    service.join_game(JoinGameRequest(game_id=game_id, player_name="second"))
+
+    bad_turns = 0
+    for _ in range(turns):
+        if game_id not in service.store:
+            break
+
+        lost = service.get_current_page(game_id) == 223
+        pending = {faction: rng.randrange(26) for faction in Factions}
+        resolutions = 0
+
+        while pending:
+            futures = {
+                faction: requests.submit(submit, service, game_id, faction, lost, move_index)
+                for faction, move_index in pending.items()
+            }
+            wait(futures.values())
+            for faction, future in futures.items():
+                message = future.result()["message"]
+                if message == TAILED_FIRST:
+                    continue
+                pending.pop(faction)
+                if message not in WAITING_MESSAGES:
+                    resolutions += 1
+
+        if resolutions != 1:
+            bad_turns += 1
+
+    return bad_turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--request-threads", type=int, default=40, help="Starlette's default thread pool size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    args = parser.parse_args()
+
+    # Switch threads far more often than usual to shake out races
+    sys.setswitchinterval(1e-6)
+    if args.backend == "sqlite":
+        store = SqliteGameStore(os.path.join(tempfile.mkdtemp(), "games.sqlite3"))
+    else:
+        store = InMemoryGameStore()
+    service = GameManager(store)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.request_threads) as requests, ThreadPoolExecutor(args.games) as players:
+        games = [
+            players.submit(play_game, service, requests, f"game-{idx}", args.turns, args.seed + idx)
+            for idx in range(args.games)
+        ]
+        bad_turns = sum(game.result() for game in games)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.games} concurrent games on the {args.backend} store, {args.turns} turns each, in {elapsed:.1f}s")
+    print(f"turns resolved other than exactly once: {bad_turns}")
+    sys.exit(1 if bad_turns else 0)
+
+
+if __name__ == "__main__":
+    main()
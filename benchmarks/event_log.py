@@ -0,0 +1,110 @@
+""" Append throughput and recovery time of the game log.
+
+Request threads append move entries as fast as they can while the flusher batches them into
+fsyncs; then a server's worth of games is played through GameManager and rebuilt from the log.
+
+    python -m benchmarks.event_log --entries 200000 --threads 8 --games 100000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.entities.entities import Factions
+from src.entities.request_models import CreateGameRequest, JoinGameRequest, SubmitMoveRequest
+from src.game_log import GameLog, MOVE
+from src.game_service import GameManager
+
+
+def directory_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def append_throughput(directory: str, entries: int, threads: int, sync_interval: float):
+    log = GameLog(directory, sync_interval=sync_interval, snapshot_every=entries * 2)
+    log.recover()
+    log.start(lambda: iter(()))
+    per_thread = entries // threads
+
+    def append(thread: int):
+        for idx in range(per_thread):
+            log.append({"type": MOVE, "game_id": f"game-{thread}-{idx % 1000}", "version": idx,
+                        "faction": Factions.ALLIES.value, "move_index": idx % 26})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(append, range(threads)))
+    log.close()
+    elapsed = time.perf_counter() - start
+
+    written = per_thread * threads
+    print(f"appended {written} entries from {threads} threads in {elapsed:.2f}s "
+          f"({written / elapsed:,.0f} entries/s, {directory_size(directory) / written:.0f} bytes/entry, synced)")
+
+
+def play(service: GameManager, games: int, turns: int, seed: int):
+    rng = random.Random(seed)
+    for idx in range(games):
+        game_id = f"game-{idx}"
+        creator = rng.choice(list(Factions))
+        service.create_game(CreateGameRequest(game_id=game_id, player_name="first", faction=creator.value))
+        service.join_game(JoinGameRequest(game_id=game_id, player_name="second"))
+
+    for _ in range(turns):
+        for idx in range(games):
+            for faction in Factions:
+                try:
+                    service.submit_move(SubmitMoveRequest(game_id=f"game-{idx}", faction=faction,
+                                                          move_index=rng.randrange(26)))
+                except Exception:
+                    # Ended or lost games; the log only has to reproduce whatever state they reached
+                    break
+
+
+def recovery_time(directory: str, games: int, turns: int, snapshot_every: int, seed: int):
+    service = GameManager(log=GameLog(directory, snapshot_every=snapshot_every))
+    service.start()
+    start = time.perf_counter()
+    play(service, games, turns, seed)
+    elapsed = time.perf_counter() - start
+    service.close()
+    expected = dict(service.store.states())
+
+    log = GameLog(directory, snapshot_every=snapshot_every)
+    start = time.perf_counter()
+    recovered = log.recover()
+    recovery = time.perf_counter() - start
+
+    matches = sum(game.to_state() == expected.get(game_id) for game_id, game in recovered.items())
+    print(f"played {games} games for {turns} turns in {elapsed:.1f}s, log and snapshot "
+          f"{directory_size(directory) / 2 ** 20:.1f} MiB")
+    print(f"recovered {len(recovered)} of {len(expected)} live games in {recovery:.2f}s, {matches} identical")
+    return matches == len(expected) == len(recovered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--sync-interval", type=float, default=0.01)
+    parser.add_argument("--games", type=int, default=100000, help="Games played for the recovery run, 0 to skip")
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--snapshot-every", type=int, default=500000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        append_throughput(os.path.join(directory, "append"), args.entries, args.threads, args.sync_interval)
+        if args.games and not recovery_time(os.path.join(directory, "recovery"), args.games, args.turns,
+                                            args.snapshot_every, args.seed):
+            raise SystemExit("recovered games differ from the live ones")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+""" Memory held per live game by the in-memory store.
+
+Creates and joins games, plays a few turns in each so their states vary, and reports the bytes
+allocated per game (tracemalloc) and the resident set growth.
+
+    python -m benchmarks.game_memory --games 100000
+"""
+import argparse
+import gc
+import random
+import resource
+import time
+import tracemalloc
+
+from src.entities.entities import Factions
+from src.entities.request_models import CreateGameRequest, JoinGameRequest, SubmitMoveRequest
+from src.game_service import GameManager
+from src.page_manager import warm_page_cache
+
+
+def max_rss() -> int:
+    """ Peak resident set size in bytes; Linux reports it in KiB. """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def populate(service: GameManager, games: int, turns: int, seed: int, prefix: str = "game"):
+    rng = random.Random(seed)
+    for idx in range(games):
+        game_id = f"{prefix}-{idx}"
+        creator = rng.choice(list(Factions))
+        service.create_game(CreateGameRequest(game_id=game_id, player_name=f"pilot-{idx}", faction=creator.value))
+        service.join_game(JoinGameRequest(game_id=game_id, player_name=f"rival-{idx}"))
+
+        # An odd number of submissions leaves some games with a move pending
+        for _ in range(turns * 2 + 1):
+            faction = rng.choice(list(Factions))
+            try:
+                service.submit_move(SubmitMoveRequest(game_id=game_id, faction=faction, move_index=rng.randrange(26)))
+            except Exception:
+                # The game ended
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Shared, per-process data is not part of any game's cost
+    warm_page_cache()
+    service = GameManager()
+    populate(service, 1, args.turns, args.seed, prefix="warmup")
+
+    gc.collect()
+    rss_before = max_rss()
+    tracemalloc.start()
+    start = time.perf_counter()
+    populate(service, args.games, args.turns, args.seed)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    live = len(service.store.games) - 1
+    print(f"{live} live games of {args.games} created in {elapsed:.1f}s")
+    print(f"allocated: {allocated / live:.0f} bytes per game, {allocated / 2 ** 20:.1f} MiB in total "
+          "(game ids and player names included)")
+    print(f"peak RSS growth: {(max_rss() - rss_before) / 2 ** 20:.1f} MiB, includes tracemalloc's own bookkeeping")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+""" Load test of the HTTP API: simulated player pairs play full games against the FastAPI app, in process.
+
+Every pair creates a game, joins it and plays it through /submit-move and /submit-lost-decision,
+then starts another, until the run's time is up. Requests go through httpx's ASGI transport
+straight into the app, so routing, validation, serialization and Starlette's thread pool are all
+exercised without a network. Latencies are measured by the client and so include time spent
+waiting for the event loop and the thread pool. The players share the server's process and CPU,
+so compare runs with each other rather than with a production server.
+
+The app is configured from the environment as the server would be (AOA_STATE_BACKEND, the event
+log, the reaper). Give several pair counts to find where /submit-move's p99 starts to climb.
+Results, one entry per level, are written as JSON for comparing runs.
+
+    python -m benchmarks.load_test --pairs 10 50 100 200 --duration 20
+    python -m benchmarks.load_test --pairs 100 --think-ms 500 --output load.json
+    AOA_STATE_BACKEND=sqlite AOA_SQLITE_PATH=/tmp/load.sqlite3 python -m benchmarks.load_test --pairs 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import time
+from collections import defaultdict
+from statistics import mean
+from typing import Dict, List, Optional
+
+import httpx
+
+from src.entities.entities import Factions, FleeDecision
+from src.page_table import LOST_PAGE
+from src.state_manager import DECISION_RECEIVED, MOVE_RECEIVED
+
+TAILED_FIRST = "Waiting for the tailed player to move first"
+
+
+class Recorder:
+    """ Latency and outcome of every request, by endpoint. """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.turns = 0
+        self.games = 0
+
+    async def post(self, client: httpx.AsyncClient, path: str, body: dict) -> Optional[dict]:
+        """ The response body, or None if the request failed. """
+        start = time.perf_counter()
+        try:
+            response = await client.post(path, json=body)
+        except httpx.HTTPError:
+            response = None
+        self.latencies[path].append(time.perf_counter() - start)
+
+        if response is None or response.status_code != 200:
+            self.errors[path] += 1
+            return None
+        return response.json()
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """ Nearest-rank percentile of already sorted values. """
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+async def play_game(client: httpx.AsyncClient, recorder: Recorder, game_id: str, rng: random.Random,
+                    think: float, deadline: float):
+    """ Plays one game to its end, or until the deadline. Both players submit each turn at about the same time. """
+    creator = rng.choice(list(Factions))
+    if await recorder.post(client, "/create-game",
+                           {"game_id": game_id, "player_name": "first", "faction": creator.value}) is None:
+        return
+    if await recorder.post(client, "/join-game", {"game_id": game_id, "player_name": "second"}) is None:
+        return
+    recorder.games += 1
+
+    async def submit(faction: Factions, lost: bool) -> Optional[dict]:
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+        if lost:
+            decision = FleeDecision.CHASE if rng.random() < 0.8 else FleeDecision.FLEE
+            return await recorder.post(client, "/submit-lost-decision",
+                                       {"game_id": game_id, "faction": faction.value, "decision": decision.value})
+        return await recorder.post(client, "/submit-move",
+                                   {"game_id": game_id, "faction": faction.value, "move_index": rng.randrange(26)})
+
+    page = 170
+    while time.perf_counter() < deadline:
+        pending = set(Factions)
+        resolution = None
+        while pending:
+            ordered = list(pending)
+            results = await asyncio.gather(*(submit(faction, page == LOST_PAGE) for faction in ordered))
+            for faction, result in zip(ordered, results):
+                if result is None:
+                    # Failed requests are counted; a game left half-played is abandoned
+                    return
+                if result["message"] == TAILED_FIRST:
+                    continue
+                pending.discard(faction)
+                if result["message"] not in (MOVE_RECEIVED, DECISION_RECEIVED):
+                    resolution = result
+
+        recorder.turns += 1
+        if resolution is None or resolution.get("game_end"):
+            return
+        page = resolution.get("new_page", page)
+
+
+async def run_pair(client: httpx.AsyncClient, recorder: Recorder, prefix: str, seed: int, think: float,
+                   deadline: float):
+    rng = random.Random(seed)
+    games = 0
+    while time.perf_counter() < deadline:
+        await play_game(client, recorder, f"{prefix}-{games}", rng, think, deadline)
+        games += 1
+
+
+async def run_level(app, pairs: int, duration: float, think: float, seed: int) -> dict:
+    """ Runs ``pairs`` pairs for ``duration`` seconds. Returns the level's results. """
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        prefix = f"load-{os.getpid()}-{pairs}"
+        await asyncio.gather(*(run_pair(client, recorder, f"{prefix}-{pair}", seed + pair, think, deadline)
+                               for pair in range(pairs)))
+        elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for path, latencies in sorted(recorder.latencies.items()):
+        ordered = sorted(latencies)
+        endpoints[path] = {
+            "requests": len(ordered),
+            "errors": recorder.errors[path],
+            "error_rate": recorder.errors[path] / len(ordered),
+            "mean_ms": mean(ordered) * 1000,
+            "p50_ms": percentile(ordered, 0.50) * 1000,
+            "p95_ms": percentile(ordered, 0.95) * 1000,
+            "p99_ms": percentile(ordered, 0.99) * 1000,
+            "max_ms": ordered[-1] * 1000,
+        }
+
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {
+        "pairs": pairs,
+        "elapsed_s": elapsed,
+        "requests": total,
+        "requests_per_s": total / elapsed,
+        "turns_per_s": recorder.turns / elapsed,
+        "games_started": recorder.games,
+        "error_rate": sum(recorder.errors.values()) / total if total else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def print_level(level: dict):
+    print(f"{level['pairs']} pairs: {level['requests_per_s']:.0f} requests/s, {level['turns_per_s']:.0f} turns/s, "
+          f"{level['games_started']} games, error rate {level['error_rate']:.2%}")
+    for path, endpoint in level["endpoints"].items():
+        print(f"  {path:22} n={endpoint['requests']:<7} p50 {endpoint['p50_ms']:7.2f}  p95 {endpoint['p95_ms']:7.2f}  "
+              f"p99 {endpoint['p99_ms']:7.2f} ms  errors {endpoint['error_rate']:.2%}")
+
+
+async def run_levels(pair_counts: List[int], duration: float, think: float, seed: int) -> List[dict]:
+    from src import controller
+
+    # The transport sends no lifespan events, so start and stop the app as the server would
+    async with controller.app.router.lifespan_context(controller.app):
+        levels = []
+        for pairs in pair_counts:
+            level = await run_level(controller.app, pairs, duration, think, seed)
+            print_level(level)
+            levels.append(level)
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, nargs="+", default=[50], help="Concurrent player pairs, one level each")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean delay before each submission")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test.json")
+    args = parser.parse_args()
+
+    levels = asyncio.run(run_levels(args.pairs, args.duration, args.think_ms / 1000, args.seed))
+    result = {
+        "config": {"duration_s": args.duration, "think_ms": args.think_ms, "seed": args.seed,
+                   "backend": os.environ.get("AOA_STATE_BACKEND", "memory"), "python": platform.python_version()},
+        "levels": levels,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(result, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
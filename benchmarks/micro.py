@@ -0,0 +1,318 @@
+""" Microbenchmarks of the engine's hot paths, checked against a stored baseline.
+
+Each case is timed in short batches with the garbage collector off, alternating with batches of a
+fixed reference workload, and the fastest batch of each is kept since noise only ever adds time.
+Cases are compared with the baseline by their time relative to the reference, which cancels out
+most of the machine getting faster or slower between runs. Cases that change a game put it back
+after every call, so they always measure the same move; the reset is part of the time.
+
+Compare a run with the baseline, failing if any case is still more than ``--threshold`` percent
+slower after ``--attempts`` measurements:
+
+    python -m benchmarks.micro --threshold 25
+
+Record a new baseline after an intended change, or on a new machine:
+
+    python -m benchmarks.micro --save
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from src.entities.entities import Factions, PlayerInfo
+from src.entities.request_models import CreateGameRequest, JoinGameRequest
+from src.game_service import GameManager
+from src.outcome_table import INVALID_PAGE
+from src.page_manager import get_page_manager, warm_page_cache
+from src.page_table import PAGE_COUNT
+from src.state_manager import GameStateManager
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "micro_baseline.json")
+
+# A case takes a number of operations and returns the seconds they took
+Case = Callable[[int], float]
+
+
+def _timed(operation: Callable[[], object]) -> Case:
+    def run(number: int) -> float:
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        return time.perf_counter() - start
+    return run
+
+
+def _new_game() -> GameStateManager:
+    game = GameStateManager(PlayerInfo(player_name="bench", faction=Factions.GERMAN))
+    game.add_opponent("rival")
+    return game
+
+
+def _resolving_moves(game: GameStateManager) -> Tuple[int, int]:
+    """ The first pair of moves from the game's page that leads to an ordinary page. """
+    page = game.current_player_page.page_num
+    for player_move, opponent_move in itertools.product(range(26), repeat=2):
+        if int(game.outcomes[page - 1, player_move, opponent_move]["page"]) not in (INVALID_PAGE, 223):
+            return player_move, opponent_move
+    raise RuntimeError(f"No ordinary outcome from page {page}")
+
+
+def _restorer(game: GameStateManager) -> Callable[[], None]:
+    """ Returns a function that puts the game back as it is now. """
+    fields = [(name, getattr(game, name)) for name in GameStateManager.__slots__ if name != "lock"]
+    health = (game.player.health, game.opponent.health)
+
+    def restore():
+        for name, value in fields:
+            setattr(game, name, value)
+        game.player.health, game.opponent.health = health
+    return restore
+
+
+def load_page() -> Case:
+    manager = get_page_manager(Factions.GERMAN)
+    pages = itertools.cycle(range(1, PAGE_COUNT + 1))
+    return _timed(lambda: manager.load_page(next(pages)))
+
+
+def find_result() -> Case:
+    manager = get_page_manager(Factions.GERMAN)
+    pairs = itertools.cycle(itertools.product(range(1, PAGE_COUNT + 1), range(26)))
+    return _timed(lambda: manager.find_result(*next(pairs)))
+
+
+def submit_move_waiting() -> Case:
+    """ The first move of a turn, which only records it. """
+    game = _new_game()
+    restore = _restorer(game)
+
+    def operation():
+        game.submit_move(Factions.GERMAN, 0)
+        restore()
+    return _timed(operation)
+
+
+def submit_move_resolving() -> Case:
+    """ The second move of a turn, which resolves it. """
+    game = _new_game()
+    player_move, opponent_move = _resolving_moves(game)
+    game.submit_move(Factions.GERMAN, player_move)
+    restore = _restorer(game)
+
+    def operation():
+        game.submit_move(Factions.ALLIES, opponent_move)
+        restore()
+    return _timed(operation)
+
+
+def process_turn() -> Case:
+    game = _new_game()
+    game.moves = tuple((move, None) for move in _resolving_moves(game))
+    restore = _restorer(game)
+
+    def operation():
+        game._process_turn()
+        restore()
+    return _timed(operation)
+
+
+def deal_damage() -> Case:
+    game = _new_game()
+    page = game.current_player_page.page_num
+    outcome = game.outcomes[page - 1, 0, 0]
+
+    def operation():
+        game._deal_damage(outcome)
+        game.player.health = game.opponent.health = 6.0
+    return _timed(operation)
+
+
+def create_game() -> Case:
+    service = GameManager()
+    ids = itertools.count()
+
+    def run(number: int) -> float:
+        requests = [CreateGameRequest(game_id=f"create-{next(ids)}", player_name="bench", faction="german")
+                    for _ in range(number)]
+        start = time.perf_counter()
+        for request in requests:
+            service.create_game(request)
+        return time.perf_counter() - start
+    return run
+
+
+def join_game() -> Case:
+    service = GameManager()
+    ids = itertools.count()
+
+    def run(number: int) -> float:
+        game_ids = [f"join-{next(ids)}" for _ in range(number)]
+        for game_id in game_ids:
+            service.create_game(CreateGameRequest(game_id=game_id, player_name="bench", faction="german"))
+        requests = [JoinGameRequest(game_id=game_id, player_name="rival") for game_id in game_ids]
+        start = time.perf_counter()
+        for request in requests:
+            service.join_game(request)
+        return time.perf_counter() - start
+    return run
+
+
+def _render(content) -> bytes:
+    """ What FastAPI does with a route's return value when the route declares no response model. """
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+
+def json_submit_move() -> Case:
+    game = _new_game()
+    player_move, opponent_move = _resolving_moves(game)
+    game.submit_move(Factions.GERMAN, player_move)
+    result = game.submit_move(Factions.ALLIES, opponent_move)
+    return _timed(lambda: _render(result))
+
+
+def json_list_games() -> Case:
+    service = GameManager()
+    for index in range(50):
+        service.create_game(CreateGameRequest(game_id=f"open-{index}", player_name="bench", faction="german"))
+    result = service.list_available_games(limit=50)
+    return _timed(lambda: _render(result))
+
+
+def json_snapshot() -> Case:
+    """ A changed game's snapshot, which is serialized again on its first request. """
+    game = _new_game()
+
+    def operation():
+        game.version += 1
+        game.snapshot()
+    return _timed(operation)
+
+
+CASES: Dict[str, Callable[[], Case]] = {
+    "PageManager.load_page": load_page,
+    "PageManager.find_result": find_result,
+    "GameStateManager.submit_move (waiting)": submit_move_waiting,
+    "GameStateManager.submit_move (resolving)": submit_move_resolving,
+    "GameStateManager._process_turn": process_turn,
+    "GameStateManager._deal_damage": deal_damage,
+    "GameManager.create_game": create_game,
+    "GameManager.join_game": join_game,
+    "json /submit-move response": json_submit_move,
+    "json /list-games response": json_list_games,
+    "json game snapshot": json_snapshot,
+}
+
+
+def _reference():
+    """ Plain interpreter work that no change to the game touches. """
+    values = {}
+    for number in range(50):
+        values[number] = str(number)
+    return sorted(values.values())
+
+
+REFERENCE = _timed(_reference)
+
+
+def _batch_size(case: Case, batch_time: float) -> int:
+    number = 1
+    while case(number) < batch_time / 10:
+        number *= 10
+    return max(1, int(number * batch_time / max(case(number), 1e-9)))
+
+
+def measure(case: Case, batch_time: float, rounds: int) -> Tuple[float, float]:
+    """
+    Seconds per operation, and that time relative to the reference's: the fastest of ``rounds``
+    batches of each, run alternately so that both see the machine in the same state.
+    """
+    number, reference_number = _batch_size(case, batch_time), _batch_size(REFERENCE, batch_time)
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        times, reference_times = [], []
+        for _ in range(rounds):
+            reference_times.append(REFERENCE(reference_number) / reference_number)
+            times.append(case(number) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return min(times), min(times) / min(reference_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=25.0, help="Percent slowdown that fails the run")
+    parser.add_argument("--batch-time", type=float, default=0.01, help="Seconds per timed batch")
+    parser.add_argument("--rounds", type=int, default=20, help="Batches of each case per measurement")
+    parser.add_argument("--attempts", type=int, default=3,
+                        help="Times a case is measured for the baseline, or before a slowdown counts")
+    parser.add_argument("cases", nargs="*", help="Names of the cases to run, all by default")
+    args = parser.parse_args()
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    # The server warms the page cache at startup, so do the same before timing
+    warm_page_cache()
+
+    stored = {"cases": {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            stored = json.load(baseline_file)
+    baseline = {} if args.save else stored["cases"]
+    if baseline and stored.get("python") != platform.python_version():
+        print(f"Baseline was recorded with Python {stored.get('python')}; comparisons with it are only rough",
+              file=sys.stderr)
+
+    results = {}
+    regressions = []
+    for name in args.cases or CASES:
+        case = CASES[name]()
+        limit = baseline[name]["relative"] * (1 + args.threshold / 100) if name in baseline else None
+        # A slowdown only counts if it lasts, and the baseline gets as many tries
+        measurements = []
+        for _ in range(args.attempts):
+            measurements.append(measure(case, args.batch_time, args.rounds))
+            if limit is not None and min(relative for _, relative in measurements) <= limit:
+                break
+        seconds, relative = min(measurements, key=lambda measurement: measurement[1])
+        results[name] = {"ns": seconds * 1e9, "relative": relative}
+        line = f"{name:42} {seconds * 1e9:10.0f} ns"
+
+        if name in baseline:
+            change = (relative / baseline[name]["relative"] - 1) * 100
+            line += f"  {change:+6.1f}% vs {baseline[name]['ns']:.0f} ns"
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSED"
+        print(line)
+
+    if args.save:
+        with open(args.baseline, "w") as baseline_file:
+            # Cases left out of this run keep their stored timings
+            json.dump({"machine": platform.node(), "python": platform.python_version(),
+                       "cases": {**stored["cases"], **results}}, baseline_file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} case(s) more than {args.threshold:g}% slower than the baseline: "
+              f"{', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
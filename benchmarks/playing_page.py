@@ -0,0 +1,232 @@
+""" Streamlit CPU per interaction on the playing page.
+
+Runs the page under Streamlit's AppTest against an API server started in a subprocess, plays games
+through it, and reports the CPU time the script thread spends per kind of interaction: a move the
+opponent has yet to answer, a move that resolves the turn, the status tick that picks up an
+opponent's move or resolved turn, and an idle tick. That is the CPU a Streamlit server spends
+executing the page, API calls included, without AppTest's own bookkeeping.
+
+Clicks and ticks are run scoped to the page's fragments, as a browser would: the first fragment the
+page registers is taken as the one that ticks, a second as the one holding the move buttons. Point
+``--page`` at an older copy of the page to compare.
+
+    python -m benchmarks.playing_page --rounds 50
+    python -m benchmarks.playing_page --page /tmp/old_playing_page.py
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from functools import partial
+from statistics import mean, median
+from unittest import mock
+
+import requests
+
+from src.entities.entities import Factions
+
+ME, OPPONENT = Factions.GERMAN, Factions.ALLIES
+
+
+class ScriptClock:
+    """ Sums the thread CPU time of every script and fragment execution, reruns included. """
+
+    def __init__(self):
+        from streamlit.runtime.scriptrunner import script_runner
+
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        timed = script_runner.exec_func_with_error_handling
+
+        def exec_timed(func, ctx):
+            start = time.thread_time()
+            try:
+                return timed(func, ctx)
+            finally:
+                with self._lock:
+                    self.elapsed += time.thread_time() - start
+
+        script_runner.exec_func_with_error_handling = exec_timed
+
+    def take(self) -> float:
+        with self._lock:
+            elapsed, self.elapsed = self.elapsed, 0.0
+        return elapsed
+
+
+def start_api(port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.controller:app", "--port", str(port), "--log-level", "warning"]
+    )
+    for _ in range(100):
+        try:
+            requests.get(f"http://localhost:{port}/list-games", timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The API server did not start")
+
+
+class PageDriver:
+    """ One player's session on the page; the opponent plays through the API directly. """
+
+    def __init__(self, page: str, api_url: str):
+        self.clock = ScriptClock()
+        self.page = os.path.abspath(page)
+        self.api_url = api_url
+        self.app = None
+        self.board = None
+        self.games = 0
+
+    def new_game(self):
+        """ Starts a game and opens it in a fresh session, as the lobby would. """
+        from streamlit.testing.v1 import AppTest
+
+        if self.app is not None:
+            self.app.session_state["event_listener"].stopped.set()
+        self.games += 1
+        game_id = f"bench-{os.getpid()}-{self.games}"
+        requests.post(f"{self.api_url}/create-game",
+                      json={"game_id": game_id, "player_name": "bench", "faction": ME.value}).raise_for_status()
+        requests.post(f"{self.api_url}/join-game",
+                      json={"game_id": game_id, "player_name": "rival"}).raise_for_status()
+        self.app = AppTest.from_file(self.page, default_timeout=30)
+        self.app.session_state["game_id"] = game_id
+        self.app.session_state["player_name"] = "bench"
+        self.app.session_state["faction"] = ME.value
+        self.run()
+
+    def _fragments(self):
+        fragments = list(self.app._fragment_storage._fragments)
+        return fragments[0], (fragments[1] if len(fragments) > 1 else None)
+
+    def _scoped(self, fragment_id):
+        """ Makes the next run a fragment-scoped rerun of ``fragment_id``, or a full run for None. """
+        from streamlit.runtime.scriptrunner_utils.script_requests import RerunData
+        from streamlit.testing.v1 import local_script_runner
+
+        if fragment_id is None:
+            return mock.patch.object(local_script_runner, "RerunData", RerunData)
+        return mock.patch.object(local_script_runner, "RerunData",
+                                 partial(RerunData, fragment_id_queue=[fragment_id], is_fragment_scoped_rerun=True))
+
+    def run(self, fragment_id=None) -> float:
+        self.clock.take()
+        with self._scoped(fragment_id):
+            self.app.run()
+        elapsed = self.clock.take()
+        if self._has_moves():
+            self.board = self.app._tree
+        return elapsed
+
+    def _has_moves(self) -> bool:
+        return any(button.key and button.key.startswith("move_") for button in self.app.button)
+
+    def tick(self) -> float:
+        return self.run(self._fragments()[0])
+
+    def click(self, move_index: int) -> float:
+        # AppTest only keeps what the last run drew; a browser still shows the buttons after a tick
+        if not self._has_moves():
+            self.app._tree = self.board
+        self.app.button(key=f"move_{move_index}").click()
+        return self.run(self._fragments()[1])
+
+    def opponent(self, path: str, body: dict) -> dict:
+        response = requests.post(f"{self.api_url}{path}", json={"game_id": self.app.session_state["game_id"],
+                                                                "faction": OPPONENT.value, **body})
+        return response.json() if response.status_code == 200 else {}
+
+    def wait_for_event(self, timeout: float = 2.0) -> bool:
+        listener = self.app.session_state["event_listener"]
+        deadline = time.monotonic() + timeout
+        while listener.events.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not listener.events.empty()
+
+    def game_over(self) -> bool:
+        # Ended games are deleted
+        game_id = self.app.session_state["game_id"]
+        return requests.get(f"{self.api_url}/games/{game_id}/snapshot").status_code == 404
+
+    @property
+    def page_number(self) -> int:
+        return self.app.session_state["page_number"]
+
+
+def play(driver: PageDriver, rounds: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    samples = {"move, opponent to move": [], "move, resolves the turn": [], "tick, opponent moved": [],
+               "tick, turn resolved": [], "tick, idle": []}
+    driver.new_game()
+
+    for _ in range(rounds):
+        samples["tick, idle"].append(driver.tick())
+
+        if driver.page_number == 223:
+            driver.opponent("/submit-lost-decision", {"decision": "chase"})
+            requests.post(f"{driver.api_url}/submit-lost-decision", json={
+                "game_id": driver.app.session_state["game_id"], "faction": ME.value, "decision": "chase"
+            })
+            driver.wait_for_event()
+            driver.run()
+            continue
+
+        def tick():
+            page = driver.page_number
+            elapsed = driver.tick()
+            samples["tick, turn resolved" if driver.page_number != page else "tick, opponent moved"].append(elapsed)
+
+        def click():
+            page = driver.page_number
+            elapsed = driver.click(rng.randrange(26))
+            resolved = driver.page_number != page
+            samples["move, resolves the turn" if resolved else "move, opponent to move"].append(elapsed)
+
+        # Either side may go first, unless it is tailing and has to wait for the other
+        opponent_first = rng.random() < 0.5 and driver.opponent("/submit-move", {"move_index": rng.randrange(26)})
+        if opponent_first:
+            driver.wait_for_event()
+            tick()
+        click()
+        if not opponent_first and driver.opponent("/submit-move", {"move_index": rng.randrange(26)}):
+            driver.wait_for_event()
+            tick()
+
+        if driver.game_over():
+            driver.new_game()
+
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", default="pages/playing_page.py")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    api_url = f"http://localhost:{args.port}"
+    # Read by the page's API client when AppTest first imports it
+    os.environ["AOA_API_URL"] = api_url
+    server = start_api(args.port)
+    try:
+        samples = play(PageDriver(args.page, api_url), args.rounds, args.seed)
+    finally:
+        # Open event streams keep a graceful shutdown waiting
+        server.kill()
+        server.wait()
+
+    print(f"{args.page}: script CPU per interaction in ms")
+    for label, times in samples.items():
+        if times:
+            print(f"  {label:28} n={len(times):<4} median {median(times) * 1000:6.1f}  mean {mean(times) * 1000:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+""" Compares per-turn latency of GameStateManager with and without the shared page cache.
+
+Both runs resolve turns with today's outcome table; only page loading differs, so the gap is what
+the cache saves, not the difference from the engine as it was before the cache.
+
+Run from the repository root:
+
+    python -m benchmarks.turn_latency --turns 20000
+"""
+import argparse
+import random
+import statistics
+import time
+from unittest import mock
+
+from src.entities.entities import Page, DetailedMovement, PlayerInfo, Factions, FleeDecision
+from src.entities.move_defaults import DEFAULT_MOVE_LIST
+from src.page_manager import PageManager, warm_page_cache
+from src.state_manager import GameStateManager
+
+
+def legacy_load_page(self, page_num: int = 170) -> Page:
+    """ The pre-cache behaviour: a freshly validated Page and 26 moves on every call. """
+    table = self.page_table
+    return Page(
+        faction=self.faction,
+        page_num=page_num,
+        distance=table.page_distance(page_num),
+        tail=table.page_tail(page_num),
+        fire=table.page_fire(page_num),
+        moves=[
+            DetailedMovement(next_page=table.next_page(page_num, idx), **default_move.model_dump(exclude_none=True))
+            for idx, default_move in enumerate(DEFAULT_MOVE_LIST)
+        ]
+    )
+
+
+def new_game(rng: random.Random) -> GameStateManager:
+    game = GameStateManager(PlayerInfo(player_name="bench", faction=rng.choice(list(Factions))))
+    game.opponent.name = "rival"
+    return game
+
+
+def play_turn(game: GameStateManager, rng: random.Random):
+    """ Plays one full turn (both submissions, or both lost-state decisions). """
+    if game.current_player_page.page_num == 223:
+        game.submit_lost_state_decision(game.player.faction, FleeDecision.CHASE)
+        return game.submit_lost_state_decision(game.opponent.faction, FleeDecision.CHASE)
+
+    order = [game.player, game.opponent]
+    if game.tailing_player is game.player:
+        order.reverse()
+
+    message = {}
+    for player in order:
+        message = game.submit_move(player.faction, rng.randrange(len(DEFAULT_MOVE_LIST)))
+    return message
+
+
+def measure(turns: int, seed: int):
+    rng = random.Random(seed)
+    game = new_game(rng)
+    samples = []
+
+    while len(samples) < turns:
+        start = time.perf_counter()
+        message = play_turn(game, rng)
+        samples.append(time.perf_counter() - start)
+
+        if message.get("game_end"):
+            game = new_game(rng)
+
+    return samples
+
+
+def report(label: str, samples):
+    ordered = sorted(samples)
+    p50 = ordered[len(ordered) // 2] * 1e6
+    p99 = ordered[int(len(ordered) * 0.99)] * 1e6
+    print(f"{label:>9}: mean {statistics.fmean(samples) * 1e6:8.1f} us  p50 {p50:8.1f} us  p99 {p99:8.1f} us")
+    return statistics.fmean(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with mock.patch.object(PageManager, "load_page", legacy_load_page):
+        uncached = report("uncached", measure(args.turns, args.seed))
+    # The server warms the cache at startup, so do the same before timing
+    warm_page_cache()
+    cached = report("cached", measure(args.turns, args.seed))
+
+    print(f"  speedup: {uncached / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,13 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "")))
 
 import streamlit as st
-import requests
+from src.api_client import ApiError, get_client
 from src.entities.entities import Factions
 
 st.set_page_config(initial_sidebar_state="collapsed")
 
-# API base URL
-API_URL = "http://localhost:8000"  # Change if necessary
+# Pooled, keep-alive connection to the API; set AOA_API_URL to point it elsewhere
+api = get_client()
 
 st.title("Ace of Aces - Start Screen")
 
@@ -22,56 +22,108 @@ if "show_join_modal" not in st.session_state:
 if "show_create_modal" not in st.session_state:
     st.session_state["show_create_modal"] = False
 
+# Back in the lobby, the session stops following the game it left
+listener = st.session_state.pop("event_listener", None)
+if listener is not None:
+    listener.stopped.set()
 
-# Fetch available games
-def fetch_games():
-    response = requests.get(f"{API_URL}/list-games")
-    if response.status_code == 200:
-        return response.json()
-    return []
+# Cursors of the lobby pages visited so far; the last one is the page on screen
+if "lobby_cursors" not in st.session_state:
+    st.session_state["lobby_cursors"] = [None]
+
+
+# Fetch a page of available games
+def fetch_games(cursor=None, faction=None):
+    params = {"cursor": cursor, "faction": faction}
+    try:
+        return api.get_json("/list-games", params={k: v for k, v in params.items() if v})
+    except ApiError:
+        return {"games": [], "next_cursor": None}
 
 
 # Join game function
 def join_game(game_id, player_name):
-    response = requests.post(f"{API_URL}/join-game", json={"game_id": game_id, "player_name": player_name})
-    if response.status_code == 200:
-        data = response.json()
-        st.session_state["game_id"] = game_id
-        st.session_state["player_name"] = player_name
-        st.session_state["faction"] = data["faction"]  # Store faction from response
-        st.switch_page("pages/playing_page.py")
-    else:
-        st.error(response.json().get("detail", "Error joining game"))
+    try:
+        data = api.post_json("/join-game", {"game_id": game_id, "player_name": player_name})
+    except ApiError as error:
+        st.error(error.detail)
+        return
+    st.session_state["game_id"] = game_id
+    st.session_state["player_name"] = player_name
+    st.session_state["faction"] = data["faction"]  # Store faction from response
+    st.switch_page("pages/playing_page.py")
 
 # Create game function
 def create_game(game_id, player_name, faction):
-    response = requests.post(
-        f"{API_URL}/create-game",
-        json={"game_id": game_id, "player_name": player_name, "faction": faction}
-    )
-    if response.status_code == 200:
-        st.session_state["game_id"] = game_id
-        st.session_state["player_name"] = player_name
-        st.session_state["faction"] = faction  # Store faction from input
-        st.switch_page("pages/playing_page.py")
-    else:
-        st.error(response.json().get("detail", "Error creating game"))
+    try:
+        api.post_json("/create-game", {"game_id": game_id, "player_name": player_name, "faction": faction})
+    except ApiError as error:
+        st.error(error.detail)
+        return
+    st.session_state["game_id"] = game_id
+    st.session_state["player_name"] = player_name
+    st.session_state["faction"] = faction  # Store faction from input
+    st.switch_page("pages/playing_page.py")
 
 
 # Display available games
 st.subheader("Available Games")
-games = fetch_games()
-
-if games:
-    for game_id in games:
+faction_filter = st.selectbox(
+    "Opponent flies for:", ["any"] + [v.value for v in Factions], key="lobby_faction",
+    on_change=lambda: st.session_state.update(lobby_cursors=[None])
+)
+page = fetch_games(st.session_state["lobby_cursors"][-1], None if faction_filter == "any" else faction_filter)
+
+if page["games"]:
+    for game in page["games"]:
+        game_id = game["game_id"]
         col1, col2 = st.columns([3, 1])
-        col1.write(f"Game ID: {game_id}")
+        col1.write(f"Game ID: {game_id} ({game['player_name']}, {game['faction']})")
         if col2.button(f"Join Game", key=f"join_{game_id}"):
             st.session_state["show_join_modal"] = True
             st.session_state["selected_game"] = game_id  # Store selected game ID
 else:
     st.write("No available games. Create one!")
 
+col1, col2 = st.columns([1, 1])
+if len(st.session_state["lobby_cursors"]) > 1 and col1.button("Previous page"):
+    st.session_state["lobby_cursors"].pop()
+    st.rerun()
+if page["next_cursor"] and col2.button("Next page"):
+    st.session_state["lobby_cursors"].append(page["next_cursor"])
+    st.rerun()
+
+# Quick match function
+def quick_match(player_name, faction):
+    payload = {"player_name": player_name, **({"faction": faction} if faction != "any" else {})}
+    try:
+        with st.spinner("Looking for an opponent..."):
+            # The server holds the request open for up to a minute while it looks
+            data = api.post_json("/matchmaking", payload, timeout=(3.05, 65))
+    except ApiError as error:
+        st.error(error.detail)
+        return
+
+    if data["status"] != "matched":
+        st.warning("No opponent showed up in time. Try again!")
+        return
+
+    st.session_state["game_id"] = data["game_id"]
+    st.session_state["player_name"] = player_name
+    st.session_state["faction"] = data["faction"]
+    st.switch_page("pages/playing_page.py")
+
+
+# Quick Match
+with st.expander("Quick Match"):
+    match_name = st.text_input("Enter your name:", key="match_player_name")
+    match_faction = st.selectbox("Fly for:", ["any"] + [v.value for v in Factions], key="match_faction")
+    if st.button("Find Opponent"):
+        if match_name.strip():
+            quick_match(match_name, match_faction)
+        else:
+            st.error("Name cannot be empty")
+
 # Create Game Button
 if st.button("Create Game"):
     st.session_state["show_create_modal"] = True  # Open modal
@@ -1,17 +1,28 @@
+import json
+import queue
+import threading
 import time
 
 import streamlit as st
 import requests
-import os
-from PIL import Image
+from src.api_client import ApiError, get_client
+from src.asset_pack import ICON_PATH
+from src.entities.health_status import describe_health
 from src.entities.move_defaults import DEFAULT_MOVE_LIST
+from src.ui_cache import atlas_icons, page_css, page_image_source, ICON_WIDTH, MOVE_KEY
 
 st.set_page_config(initial_sidebar_state="collapsed")
 
-# API and file paths
-API_URL = "http://localhost:8000"  # Update if necessary
-PAGE_IMG_PATH = "data/page_images/{faction}/{faction}_{page_number}.jpg"
-ICON_PATH = "data/icons/moves/m_{index}.jpg"
+# Pooled, keep-alive connection to the API; set AOA_API_URL to point it elsewhere
+api = get_client()
+
+# Move buttons per row: 9, 10 and 7 buttons of equal width
+MOVE_ROWS = (DEFAULT_MOVE_LIST[0:9], DEFAULT_MOVE_LIST[9:19], DEFAULT_MOVE_LIST[19:26])
+# The event listener of a session whose page stopped ticking this long ago, e.g. a closed tab, hangs up
+LISTENER_IDLE_SECONDS = 60
+# And none listens for longer than this, however long the game lasts
+LISTENER_MAX_SECONDS = 4 * 3600
+
 
 # Ensure necessary session data exists
 if "game_id" not in st.session_state or "player_name" not in st.session_state or "faction" not in st.session_state:
@@ -19,48 +30,121 @@ if "game_id" not in st.session_state or "player_name" not in st.session_state or
     st.switch_page("lobby.py")
 
 
-# Fetch current page when entering the playing page
-def fetch_current_page():
-    response = requests.get(f"{API_URL}/get-current-page", params={"game_id": st.session_state["game_id"]})
-    if response.status_code == 200:
-        st.session_state["page_number"] = response.json()
-    else:
-        st.error("Failed to retrieve current page.")
+# Fetch the page number and both players in one call; an unchanged game comes back as an empty 304
+def fetch_snapshot():
+    """ Returns the snapshot if the game changed since the last one. """
+    try:
+        fetched = api.snapshot(st.session_state["game_id"], st.session_state.get("snapshot_etag"))
+    except ApiError as error:
+        if error.status_code == 404:
+            # The game ended, or was evicted
+            st.session_state["game_over"] = st.session_state["game_id"]
+        st.session_state["player_status"] = "Failed to retrieve status."
+        return None
+    if fetched is None:
+        return None
 
+    st.session_state["snapshot_etag"], snapshot = fetched
+    st.session_state["page_number"] = snapshot["page_number"]
 
-# Fetch player status from API
-def fetch_player_status():
-    response = requests.get(
-        f"{API_URL}/get-player-status",
-        params={"game_id": st.session_state["game_id"], "player_name": st.session_state["player_name"]}
-    )
-    if response.status_code == 200:
-        st.session_state["player_status"] = response.json()
-    else:
-        st.session_state["player_status"] = "Failed to retrieve status."
+    me = next(player for player in snapshot["players"] if player["faction"] == st.session_state["faction"])
+    st.session_state["player_status"] = f"{me['name']} ({me['faction']})\n\n{describe_health(me['health'])}"
+    return snapshot
+
+
+class GameEventListener(threading.Thread):
+    """
+    Follows the game's Server-Sent Events stream in the background, so the page never polls. Stops
+    when the game ends, when ``stopped`` is set, or when the page has not called ``touch`` for
+    LISTENER_IDLE_SECONDS; the server's keep-alives wake it up to notice.
+    """
+
+    def __init__(self, game_id):
+        super().__init__(daemon=True)
+        self.game_id = game_id
+        self.events = queue.Queue()
+        self.stopped = threading.Event()
+        # Set when the server does not stream events, so the page polls instead
+        self.unsupported = False
+        self.started_at = self.touched_at = time.monotonic()
+
+    def touch(self):
+        self.touched_at = time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        now = time.monotonic()
+        return now - self.touched_at > LISTENER_IDLE_SECONDS or now - self.started_at > LISTENER_MAX_SECONDS
+
+    def _done(self) -> bool:
+        return self.stopped.is_set() or self.expired
+
+    def run(self):
+        while not self._done():
+            try:
+                # Sits on one connection for the whole game, outside the pool's retries
+                with api.request("GET", f"/games/{self.game_id}/events", stream=True, timeout=(5, 60)) as response:
+                    if response.status_code == 404:
+                        return
+                    if response.status_code == 501:
+                        # Not streamed by a server running several workers
+                        self.unsupported = True
+                        return
+
+                    for line in response.iter_lines(decode_unicode=True):
+                        if self._done():
+                            return
+                        if line.startswith("data:"):
+                            event = json.loads(line[len("data:"):])
+                            self.events.put(event)
+                            if event["type"] == "game_end":
+                                return
+            except (ApiError, requests.RequestException):
+                # Reconnect after a short pause if the server went away
+                time.sleep(1)
+
+    def drain(self):
+        events = []
+        while not self.events.empty():
+            events.append(self.events.get_nowait())
+        return events
+
+
+listener = st.session_state.get("event_listener")
+# A listener that hung up while the session was away is replaced when it comes back
+if listener is None or listener.game_id != st.session_state["game_id"] or listener.expired:
+    if listener is not None:
+        listener.stopped.set()
+    listener = GameEventListener(st.session_state["game_id"])
+    listener.start()
+    st.session_state["event_listener"] = listener
 
 
 # Initialize current page & status if not set
-if "page_number" not in st.session_state:
-    fetch_current_page()
-if "player_status" not in st.session_state:
-    fetch_player_status()
+if "page_number" not in st.session_state or "player_status" not in st.session_state:
+    fetch_snapshot()
 if "last_message" not in st.session_state:
     st.session_state["last_message"] = ""
 
 
+def show_changes():
+    """ Redraws the whole page if the board changed; anything else shows up in the status panel on its own. """
+    if st.session_state["page_number"] != st.session_state.get("shown_page"):
+        st.rerun()
+
+
 # Submit move function (stores last response message)
 def submit_move(move_index):
-    response = requests.post(
-        f"{API_URL}/submit-move",
-        json={
+    try:
+        json_data = api.post_json("/submit-move", {
             "game_id": st.session_state["game_id"],
             "faction": st.session_state["faction"],
             "move_index": move_index,
-        }
-    )
-    if response.status_code == 200:
-        json_data = response.json()
+        })
+    except ApiError as error:
+        st.session_state["last_message"] = error.detail
+        st.error(st.session_state["last_message"])
+    else:
         st.session_state["last_message"] = json_data.get("message", "Move processed.")
 
         # Save new page number only if it exists
@@ -68,114 +152,108 @@ def submit_move(move_index):
             st.session_state["page_number"] = json_data["new_page"]
 
         # Always fetch updated status
-        fetch_player_status()
-
-        # Force Streamlit to re-render and display updated page and status
-        st.rerun()
-
-    else:
-        st.session_state["last_message"] = response.json().get("detail", "Error submitting move.")
-        st.error(st.session_state["last_message"])
+        fetch_snapshot()
+        show_changes()
 
 
 def submit_lost_decision(decision: str):
-    response = requests.post(
-        f"{API_URL}/submit-lost-decision",
-        json={
+    try:
+        data = api.post_json("/submit-lost-decision", {
             "game_id": st.session_state["game_id"],
             "faction": st.session_state["faction"],
             "decision": decision,
-        }
-    )
-    if response.status_code == 200:
-        data = response.json()
-        st.session_state["last_message"] = data.get("message", "Decision submitted.")
-        fetch_current_page()
-        fetch_player_status()
-        st.rerun()
-    else:
-        st.session_state["last_message"] = response.json().get("detail", "Error submitting decision.")
+        })
+    except ApiError as error:
+        st.session_state["last_message"] = error.detail
         st.error(st.session_state["last_message"])
-
-
-# Apply CSS to expand width and fix word wrapping inside buttons
-st.markdown(
-    """
-    <style>
-    .block-container {
-        max-width: 1300px !important;  /* Increase the width */
-    }
-    div.stButton > button {
-        white-space: normal !important;  /* Allow buttons to wrap properly */
-        width: 100% !important;  /* Make buttons expand properly */
-        font-size: 10px !important; /* Ensure text is readable */
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
-
-# Layout: Image + Info Box Side by Side
-col_img, col_info = st.columns([3, 2])  # 2:1 ratio
-
-with col_img:
-    # Load and display the current page image
-    page_img_path = PAGE_IMG_PATH.format(faction=st.session_state["faction"], page_number=st.session_state["page_number"])
-    if os.path.exists(page_img_path):
-        st.image(Image.open(page_img_path), use_container_width=True)
     else:
-        st.warning(f"Page image not found: {page_img_path}")
+        st.session_state["last_message"] = data.get("message", "Decision submitted.")
+        fetch_snapshot()
+        show_changes()
+
+
+# Stops ticking once the game is over
+@st.fragment(run_every=None if st.session_state.get("game_over") == st.session_state["game_id"] else 1)
+def status_panel():
+    """ Player status and the latest message, refreshed from the local event queue (no HTTP) every second. """
+    listener = st.session_state["event_listener"]
+    listener.touch()
+    if listener.unsupported and st.session_state.get("game_over") != st.session_state["game_id"]:
+        # Unchanged games come back as empty 304s
+        snapshot = fetch_snapshot()
+        if snapshot is not None:
+            st.session_state["last_message"] = snapshot["last_message"]
+            show_changes()
+        elif st.session_state.get("game_over") == st.session_state["game_id"]:
+            st.rerun()
+
+    events = [
+        event for event in listener.drain()
+        if event.get("faction") != st.session_state["faction"] or event["type"] == "game_end"
+    ]
+    for event in events:
+        if event["type"] == "tailed_direction":
+            st.session_state["last_message"] = f"Your target is turning {event['direction']}!"
+        elif event["type"] == "opponent_moved":
+            st.session_state["last_message"] = "Your opponent has moved."
+        elif "message" in event:
+            st.session_state["last_message"] = event["message"]
+
+    if events and events[-1]["type"] == "game_end":
+        st.session_state["game_over"] = st.session_state["game_id"]
+        # Rerun the page so the panel is declared without its timer
+        st.rerun()
+    if events:
+        fetch_snapshot()
+        show_changes()
 
-with col_info:
     st.subheader("Player Status")
     st.info(st.session_state["player_status"])
     st.info(st.session_state["last_message"])  # Show the latest status
 
-if st.session_state["page_number"] == 223:
-    st.subheader("You are in a lost state!")
-    st.write("You must decide whether to chase your opponent or flee the scene.")
 
-    col1, col2 = st.columns(2)
-    if col1.button("🚀 Chase"):
-        submit_lost_decision("chase")
-    if col2.button("🏃‍♂️ Flee"):
-        submit_lost_decision("flee")
+@st.fragment
+def move_controls():
+    """ Pressing a button only reruns this fragment, unless the submission changed the board. """
+    if st.session_state["page_number"] == 223:
+        st.subheader("You are in a lost state!")
+        st.write("You must decide whether to chase your opponent or flee the scene.")
 
-else:
-    st.subheader("Select Your Move")
+        col1, col2 = st.columns(2)
+        if col1.button("🚀 Chase"):
+            submit_lost_decision("chase")
+        if col2.button("🏃‍♂️ Flee"):
+            submit_lost_decision("flee")
+        return
 
-    # Define button groups
-    button_groups = [
-        (DEFAULT_MOVE_LIST[0:9], [1] * 9),   # First row (9 buttons, equal width)
-        (DEFAULT_MOVE_LIST[9:19], [1] * 10), # Second row (10 buttons, equal width)
-        (DEFAULT_MOVE_LIST[19:26], [1] * 7)  # Third row (7 buttons, equal width)
-    ]
+    st.subheader("Select Your Move")
+    icons = atlas_icons()
+    for row in MOVE_ROWS:
+        cols = st.columns(len(row))
+        for idx, move in enumerate(row):
+            # The page CSS draws atlas icons above their buttons; only icons missing from it need an element
+            if move.index not in icons:
+                cols[idx].image(ICON_PATH.format(index=move.index), width=ICON_WIDTH)
 
-    # Function to render movement buttons in a row
-    def render_move_buttons(move_group, col_widths):
-        cols = st.columns(col_widths)  # Dynamic column widths
+            # Button with proper wrapping
+            if cols[idx].button(move.name, help=move.description, key=MOVE_KEY.format(index=move.index)):
+                submit_move(move.index)
 
-        for idx, move in enumerate(move_group):
-            move_icon_path = ICON_PATH.format(index=move.index)
 
-            # Load the move icon if available
-            if os.path.exists(move_icon_path):
-                icon_img = Image.open(move_icon_path)
-                cols[idx].image(icon_img, width=50)  # Display move icon
-            else:
-                cols[idx].write("No Icon")
+st.markdown(page_css(), unsafe_allow_html=True)
 
-            # Button with proper wrapping
-            if cols[idx].button(move.name, help=move.description, key=f"move_{move.index}"):
-                submit_move(move.index)
+# Layout: Image + Info Box Side by Side
+col_img, col_info = st.columns([3, 2])  # 2:1 ratio
 
+with col_img:
+    source = page_image_source(st.session_state["faction"], st.session_state["page_number"])
+    st.session_state["shown_page"] = st.session_state["page_number"]
+    if source:
+        st.image(source, use_container_width=True)
+    else:
+        st.warning(f"Page image not found: {st.session_state['faction']} {st.session_state['page_number']}")
 
-    # Render buttons with dividers
-    for i, (group, widths) in enumerate(button_groups):
-        render_move_buttons(group, widths)
+with col_info:
+    status_panel()
 
-st.markdown("### Turn Resolution")
-if st.button("🔄 Refresh Game State"):
-    fetch_current_page()
-    fetch_player_status()
-    st.rerun()
+move_controls()
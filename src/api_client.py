@@ -0,0 +1,88 @@
+""" HTTP client the Streamlit pages share: one pooled keep-alive session per process, with timeouts and retries. """
+import os
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_URL = os.environ.get("AOA_API_URL", "http://localhost:8000")
+# Where the user's browser fetches page images and icons; the API_URL is often only reachable server side
+PUBLIC_ASSET_URL = os.environ.get("AOA_PUBLIC_ASSET_URL")
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (3.05, 10.0)
+
+
+class ApiError(Exception):
+    """ A request that failed; ``status_code`` is None when the server could not be reached at all. """
+
+    def __init__(self, status_code: Optional[int], detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ApiClient:
+    """
+    Every Streamlit session in the process shares one ``requests.Session``, so reruns reuse open
+    connections instead of opening one per call. GETs are retried with backoff on connection errors and
+    on 502/503/504; POSTs change game state, so they are only retried when the connection failed
+    before the request was sent.
+    """
+
+    def __init__(self, base_url: str = API_URL, pool_size: int = 32, retries: int = 3, backoff: float = 0.2,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT, public_url: Optional[str] = PUBLIC_ASSET_URL):
+        self.base_url = base_url.rstrip("/")
+        self.public_url = (public_url or base_url).rstrip("/")
+        self.timeout = timeout
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                      status_forcelist=(502, 503, 504), allowed_methods=frozenset({"GET", "HEAD"}),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, path: str, timeout=None, **kwargs) -> requests.Response:
+        """ The raw response, whatever its status. Raises ApiError if the server could not be reached. """
+        try:
+            return self.session.request(method, self.base_url + path, timeout=timeout or self.timeout, **kwargs)
+        except requests.RequestException as error:
+            raise ApiError(None, "Cannot reach the game server, try again shortly") from error
+
+    @staticmethod
+    def _json(response: requests.Response) -> dict:
+        if response.status_code == 200:
+            return response.json()
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = None
+        raise ApiError(response.status_code, detail if isinstance(detail, str) else f"HTTP {response.status_code}")
+
+    def get_json(self, path: str, params: Optional[dict] = None, **kwargs) -> dict:
+        """ The decoded body of a 200 response; raises ApiError with the server's detail otherwise. """
+        return self._json(self.request("GET", path, params=params, **kwargs))
+
+    def post_json(self, path: str, body: dict, **kwargs) -> dict:
+        return self._json(self.request("POST", path, json=body, **kwargs))
+
+    def snapshot(self, game_id: str, etag: Optional[str] = None) -> Optional[Tuple[str, dict]]:
+        """ The game's ETag and snapshot, or None if it still matches ``etag``. """
+        headers = {"If-None-Match": etag} if etag else {}
+        response = self.request("GET", f"/games/{game_id}/snapshot", headers=headers)
+        if response.status_code == 304:
+            return None
+        return response.headers.get("ETag"), self._json(response)
+
+    def asset_url(self, name: str) -> str:
+        """ The address the browser loads an asset from, not one this process fetches. """
+        return f"{self.public_url}/assets/{name}"
+
+
+@lru_cache(maxsize=None)
+def get_client() -> ApiClient:
+    """ The process-wide client; Streamlit runs every session's script in the same process. """
+    return ApiClient()
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: str) -> str:
+    """ Hex SHA-256 of a file, read in 1 MiB chunks. """
+    digest = hashlib.sha256()
+    with open(path, "rb") as artifact:
+        for chunk in iter(lambda: artifact.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def meta_path(path: str) -> str:
+    """ The JSON sidecar of a build artifact. """
+    return f"{os.path.splitext(path)[0]}.json"
+
+
+def write_meta(path: str, version: int, source_digest: str):
+    """ Records the artifact's version, the digest of the sources it was built from and its checksum. """
+    meta = {"version": version, "source_digest": source_digest, "sha256": file_sha256(path)}
+    with open(meta_path(path), "w") as meta_file:
+        json.dump(meta, meta_file, indent=2)
+
+
+def is_current(path: str, version: int, source_digest: str) -> bool:
+    """ Whether the artifact exists, matches ``version`` and ``source_digest``, and passes its checksum. """
+    if not os.path.exists(path) or not os.path.exists(meta_path(path)):
+        return False
+
+    with open(meta_path(path)) as meta_file:
+        meta = json.load(meta_file)
+
+    if meta.get("version") != version or meta.get("source_digest") != source_digest:
+        logger.warning("Build artifact %s is stale, ignoring it", path)
+        return False
+
+    if meta.get("sha256") != file_sha256(path):
+        logger.warning("Build artifact %s failed its checksum, ignoring it", path)
+        return False
+
+    return True
+
+
+def save_artifact(path: str, array: np.ndarray, version: int, source_digest: str):
+    """ Writes ``array`` as a ``.npy`` file plus a JSON sidecar holding its version and checksums. """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(path, array, allow_pickle=False)
+    write_meta(path, version, source_digest)
+
+
+def load_artifact(path: str, version: int, source_digest: str) -> Optional[np.ndarray]:
+    """
+    Memory-maps a build artifact read-only, so every process on the box shares the same pages.
+    Returns None when the artifact is missing, built from other sources, or fails its checksum.
+    """
+    if not is_current(path, version, source_digest):
+        return None
+    return np.load(path, mmap_mode="r", allow_pickle=False)
@@ -0,0 +1,195 @@
+""" Page images and move icons packed into one memory-mapped file, built by ``python -m src.build pack-assets``. """
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import struct
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.artifacts import file_sha256, is_current, write_meta
+from src.entities.entities import Factions
+from src.page_images import MANIFEST_PATH, VARIANTS_DIR, load_manifest, page_image_sources, variant_name
+from src.page_table import BUILD_DIR, DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+ASSET_PACK_PATH = os.path.join(BUILD_DIR, "assets.pack")
+ASSET_PACK_VERSION = 2
+ICON_PATH = os.path.join(DATA_DIR, "icons", "moves", "m_{index}.jpg")
+ICON_COUNT = 26
+# Icons show 50px wide, so atlas tiles are twice that for high-density screens
+ATLAS_TILE_WIDTH = 100
+MEDIA_TYPES = {"webp": "image/webp", "jpg": "image/jpeg", "png": "image/png"}
+
+# Magic, then the length of the JSON index that follows it; asset offsets count from the end of the index
+HEADER = struct.Struct("<8sQ")
+MAGIC = b"AOAPACK1"
+
+
+def _asset_name(data: bytes, extension: str) -> str:
+    """ Assets are named by their content, so a name always refers to the same bytes. """
+    return f"{hashlib.sha256(data).hexdigest()[:16]}.{extension}"
+
+
+def _page_files(manifest: Optional[dict]) -> Iterable[Tuple[str, int, str, str]]:
+    """ (page key, width, extension, path) of every page image file to pack. """
+    if manifest is None:
+        # Only the original scans, listed as width 0 so any requested width falls back to them
+        for key, path in page_image_sources():
+            yield key, 0, "jpg", path
+        return
+
+    for key, entry in manifest["images"].items():
+        for width in sorted({min(width, entry["width"]) for width in manifest["widths"]}):
+            for extension in manifest["formats"]:
+                yield key, width, extension, os.path.join(VARIANTS_DIR, variant_name(entry["hash"], width, extension))
+
+
+def sources_digest() -> str:
+    """ Digest of what the pack is built from: the page image manifest and the move icons. """
+    digest = hashlib.sha256()
+    for path in [MANIFEST_PATH] + [ICON_PATH.format(index=index) for index in range(ICON_COUNT)]:
+        if os.path.exists(path):
+            digest.update(file_sha256(path).encode())
+    return digest.hexdigest()
+
+
+def _build_icon_atlas(paths: List[str], tile_width: int = ATLAS_TILE_WIDTH, quality: int = 85) -> Tuple[bytes, dict]:
+    """ The icons side by side in one WebP, in ``paths`` order, and the tile geometry needed to crop them. """
+    from PIL import Image
+
+    with Image.open(paths[0]) as first:
+        tile_height = round(first.size[1] * tile_width / first.size[0])
+
+    atlas = Image.new("RGB", (tile_width * len(paths), tile_height), "white")
+    for position, path in enumerate(paths):
+        with Image.open(path) as icon:
+            tile = icon.convert("RGB").resize((tile_width, tile_height), Image.LANCZOS)
+        atlas.paste(tile, (position * tile_width, 0))
+
+    encoded = io.BytesIO()
+    atlas.save(encoded, "WEBP", quality=quality, method=6)
+    return encoded.getvalue(), {"tile_width": tile_width, "tile_height": tile_height}
+
+
+class _PackWriter:
+    def __init__(self):
+        self.blobs: List[bytes] = []
+        self.size = 0
+        self.assets: Dict[str, list] = {}
+
+    def add(self, path: str, extension: str) -> str:
+        """ Adds a file unless identical bytes are packed already. Returns its asset name. """
+        with open(path, "rb") as asset_file:
+            return self.add_bytes(asset_file.read(), extension)
+
+    def add_bytes(self, data: bytes, extension: str) -> str:
+        name = _asset_name(data, extension)
+        if name not in self.assets:
+            self.assets[name] = [self.size, len(data), MEDIA_TYPES[extension]]
+            self.blobs.append(data)
+            self.size += len(data)
+        return name
+
+
+def build_asset_pack(path: str = ASSET_PACK_PATH) -> dict:
+    """
+    Packs the page images (the built variants, or the original scans if there are none) and the move
+    icons, each on its own and as one sprite atlas, into one file: a header, a JSON index of
+    ``name -> [offset, length, media type]``, then the assets back to back. Returns the index.
+    """
+    writer = _PackWriter()
+    pages: Dict[str, Dict[str, Dict[str, str]]] = {}
+    for key, width, extension, file_path in _page_files(load_manifest()):
+        pages.setdefault(key, {}).setdefault(str(width), {})[extension] = writer.add(file_path, extension)
+
+    icon_paths = {index: ICON_PATH.format(index=index) for index in range(ICON_COUNT)}
+    icon_paths = {index: icon_path for index, icon_path in icon_paths.items() if os.path.exists(icon_path)}
+    icons = {str(index): writer.add(icon_path, "jpg") for index, icon_path in icon_paths.items()}
+
+    icon_atlas = None
+    if icon_paths:
+        atlas, geometry = _build_icon_atlas(list(icon_paths.values()))
+        icon_atlas = {"name": writer.add_bytes(atlas, "webp"), "icons": list(icon_paths), **geometry}
+
+    index = {"version": ASSET_PACK_VERSION, "assets": writer.assets, "pages": pages, "icons": icons,
+             "icon_atlas": icon_atlas}
+    encoded = json.dumps(index, separators=(",", ":")).encode()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as pack_file:
+        pack_file.write(HEADER.pack(MAGIC, len(encoded)))
+        pack_file.write(encoded)
+        for blob in writer.blobs:
+            pack_file.write(blob)
+    os.replace(path + ".tmp", path)
+
+    write_meta(path, ASSET_PACK_VERSION, sources_digest())
+    return index
+
+
+class AssetPack:
+    """
+    A read-only view of a built pack. ``get`` returns slices of the mapping, so serving an asset copies
+    nothing and every process on the box shares the same pages.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as pack_file:
+            self._map = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, index_length = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an asset pack")
+        self._base = HEADER.size + index_length
+        index = json.loads(self._view[HEADER.size:self._base].tobytes())
+
+        self.assets: Dict[str, Tuple[int, int, str]] = {name: tuple(entry) for name, entry in index["assets"].items()}
+        self.icons: Dict[int, str] = {int(idx): name for idx, name in index["icons"].items()}
+        # Asset name, tile size and the icon index at each tile position
+        self.icon_atlas: Optional[dict] = index["icon_atlas"]
+        # page key -> [(width, {extension: asset name})], narrowest first
+        self.pages: Dict[str, List[Tuple[int, Dict[str, str]]]] = {
+            key: sorted((int(width), names) for width, names in widths.items())
+            for key, widths in index["pages"].items()
+        }
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.assets
+
+    def get(self, name: str) -> Optional[Tuple[memoryview, str]]:
+        """ The asset's bytes and media type, or None if there is no such asset. """
+        entry = self.assets.get(name)
+        if entry is None:
+            return None
+        offset, length, media_type = entry
+        start = self._base + offset
+        return self._view[start:start + length], media_type
+
+    def page_asset(self, faction: Factions, page_num: int, width: Optional[int] = None,
+                   extension: str = "webp") -> Optional[str]:
+        """
+        Name of the page image at the smallest width covering ``width``, or the largest one, in
+        ``extension`` if it was packed. None if there is no such page.
+        """
+        widths = self.pages.get(f"{faction.value}/{page_num}")
+        if not widths:
+            return None
+        names = next((names for each, names in widths if width is not None and each >= width), widths[-1][1])
+        return names.get(extension) or next(iter(names.values()))
+
+    def icon_asset(self, index: int) -> Optional[str]:
+        return self.icons.get(index)
+
+
+@lru_cache(maxsize=None)
+def get_asset_pack(path: str = ASSET_PACK_PATH) -> Optional[AssetPack]:
+    """ The built pack, mapped once per process. None when it is missing, stale or fails its checksum. """
+    if not is_current(path, ASSET_PACK_VERSION, sources_digest()):
+        logger.warning("No usable asset pack at %s, serving images from loose files", path)
+        return None
+    return AssetPack(path)
@@ -0,0 +1,202 @@
+from enum import IntEnum
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+from src.entities.entities import Factions, FleeDecision
+from src.outcome_table import get_outcome_tables, INVALID_PAGE
+from src.page_table import FACTION_CODES, LOST_PAGE, START_PAGE
+
+PLAYER = 0
+OPPONENT = 1
+UNSET = -1
+STARTING_HEALTH = 6.0
+
+# Decisions are stored as positions in this tuple
+DECISION_CODES = tuple(FleeDecision)
+_FLEE = DECISION_CODES.index(FleeDecision.FLEE)
+
+
+class GameStatus(IntEnum):
+    FREE = 0
+    PLAYING = 1
+    LOST = 2
+    ENDED = 3
+
+
+class Tailing(IntEnum):
+    NONE = 0
+    PLAYER = 1
+    OPPONENT = 2
+
+
+class TurnResult(IntEnum):
+    """ What a resolved game went through; the values mirror GameStateManager's messages. """
+    TURN_RESOLVED = 0
+    INVALID_MOVES = 1
+    LOST_EACH_OTHER = 2
+    PLAYER_WON = 3
+    OPPONENT_WON = 4
+    BOTH_DOWN = 5
+    BOTH_FLED = 6
+    PLAYER_HALF_WIN = 7
+    OPPONENT_HALF_WIN = 8
+    CHASE_RESET = 9
+
+
+GAME_ENDING_RESULTS = np.array([
+    result in (TurnResult.PLAYER_WON, TurnResult.OPPONENT_WON, TurnResult.BOTH_DOWN, TurnResult.BOTH_FLED,
+               TurnResult.PLAYER_HALF_WIN, TurnResult.OPPONENT_HALF_WIN)
+    for result in TurnResult
+])
+
+
+class ResolvedGames(NamedTuple):
+    game_ids: np.ndarray
+    results: np.ndarray
+    pages: np.ndarray
+
+
+class BatchEngine:
+    """
+    Holds many games as parallel arrays and resolves every ready game in one vectorized step.
+
+    Side 0 is the player who created the game, whose book resolves the turn, and side 1 their
+    opponent, exactly as in GameStateManager. Game ids are row numbers; rows of ended games can be
+    handed back with ``release`` and are reused by ``add_games``.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.outcomes = get_outcome_tables()
+        self.status = np.zeros(0, dtype=np.int8)
+        self.creator = np.zeros(0, dtype=np.int8)
+        self.page = np.zeros(0, dtype=np.int16)
+        self.health = np.zeros((0, 2), dtype=np.float32)
+        self.tailing = np.zeros(0, dtype=np.int8)
+        self.moves = np.zeros((0, 2), dtype=np.int8)
+        self.decisions = np.zeros((0, 2), dtype=np.int8)
+        self._grow(capacity)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.status != GameStatus.FREE))
+
+    @property
+    def capacity(self) -> int:
+        return len(self.status)
+
+    def _grow(self, capacity: int):
+        extra = capacity - self.capacity
+        self.status = np.concatenate([self.status, np.full(extra, GameStatus.FREE, dtype=np.int8)])
+        self.creator = np.concatenate([self.creator, np.zeros(extra, dtype=np.int8)])
+        self.page = np.concatenate([self.page, np.full(extra, START_PAGE, dtype=np.int16)])
+        self.health = np.concatenate([self.health, np.full((extra, 2), STARTING_HEALTH, dtype=np.float32)])
+        self.tailing = np.concatenate([self.tailing, np.zeros(extra, dtype=np.int8)])
+        self.moves = np.concatenate([self.moves, np.full((extra, 2), UNSET, dtype=np.int8)])
+        self.decisions = np.concatenate([self.decisions, np.full((extra, 2), UNSET, dtype=np.int8)])
+
+    def add_games(self, creator_factions: Sequence[Factions]) -> np.ndarray:
+        """ Starts one game per entry, each created by the given faction. Returns the new game ids. """
+        creators = np.array([FACTION_CODES.index(faction) for faction in creator_factions], dtype=np.int8)
+        return self.add_games_by_code(creators)
+
+    def add_games_by_code(self, creators: np.ndarray) -> np.ndarray:
+        """ Same as ``add_games`` with creators given as FACTION_CODES positions. """
+        free = np.flatnonzero(self.status == GameStatus.FREE)
+        if len(free) < len(creators):
+            self._grow(max(self.capacity * 2, self.capacity + len(creators) - len(free)))
+            free = np.flatnonzero(self.status == GameStatus.FREE)
+
+        game_ids = free[:len(creators)]
+        self.status[game_ids] = GameStatus.PLAYING
+        self.creator[game_ids] = creators
+        self.page[game_ids] = START_PAGE
+        self.health[game_ids] = STARTING_HEALTH
+        self.tailing[game_ids] = Tailing.NONE
+        self.moves[game_ids] = UNSET
+        self.decisions[game_ids] = UNSET
+        return game_ids
+
+    def release(self, game_ids: np.ndarray):
+        """ Frees the rows of finished games for reuse. """
+        self.status[game_ids] = GameStatus.FREE
+
+    def submit_moves(self, game_ids: np.ndarray, side: int, move_indices: np.ndarray) -> np.ndarray:
+        """ Stores pending moves for one side. Returns a mask of the games that accepted them. """
+        accepted = self.status[game_ids] == GameStatus.PLAYING
+        self.moves[game_ids[accepted], side] = np.asarray(move_indices)[accepted]
+        return accepted
+
+    def submit_decisions(self, game_ids: np.ndarray, side: int, decisions: np.ndarray) -> np.ndarray:
+        """ Stores DECISION_CODES positions for one side of lost games. Returns the accepting mask. """
+        accepted = self.status[game_ids] == GameStatus.LOST
+        self.decisions[game_ids[accepted], side] = np.asarray(decisions)[accepted]
+        return accepted
+
+    def resolve(self) -> ResolvedGames:
+        """ Resolves every game whose two moves, or two lost-state decisions, are in. """
+        moving = np.flatnonzero((self.status == GameStatus.PLAYING) & (self.moves != UNSET).all(axis=1))
+        deciding = np.flatnonzero((self.status == GameStatus.LOST) & (self.decisions != UNSET).all(axis=1))
+
+        moved = self._resolve_turns(moving)
+        decided = self._resolve_lost_states(deciding)
+
+        game_ids = np.concatenate([moving, deciding])
+        return ResolvedGames(game_ids, np.concatenate([moved, decided]), self.page[game_ids].copy())
+
+    def _resolve_turns(self, game_ids: np.ndarray) -> np.ndarray:
+        moves = self.moves[game_ids]
+        outcome = self.outcomes[self.creator[game_ids], self.page[game_ids] - 1, moves[:, PLAYER], moves[:, OPPONENT]]
+        result_page = outcome["page"]
+        self.moves[game_ids] = UNSET
+
+        results = np.full(len(game_ids), TurnResult.TURN_RESOLVED, dtype=np.int8)
+        invalid = result_page == INVALID_PAGE
+        lost = result_page == LOST_PAGE
+        fought = ~invalid & ~lost
+        results[invalid] = TurnResult.INVALID_MOVES
+
+        moved = game_ids[~invalid]
+        self.page[moved] = result_page[~invalid]
+        self.tailing[moved] = np.where(
+            outcome["player_tail"][~invalid], Tailing.PLAYER,
+            np.where(outcome["opponent_tail"][~invalid], Tailing.OPPONENT, Tailing.NONE)
+        )
+
+        lost_ids = game_ids[lost]
+        results[lost] = TurnResult.LOST_EACH_OTHER
+        self.status[lost_ids] = GameStatus.LOST
+        self.decisions[lost_ids] = UNSET
+
+        fought_ids = game_ids[fought]
+        damage = np.stack([outcome["player_damage"][fought], outcome["opponent_damage"][fought]], axis=1)
+        self.health[fought_ids] = np.maximum(0.0, self.health[fought_ids] - damage)
+
+        alive = self.health[fought_ids] > 0
+        fought_results = np.select(
+            [~alive[:, PLAYER] & ~alive[:, OPPONENT], ~alive[:, PLAYER], ~alive[:, OPPONENT]],
+            [TurnResult.BOTH_DOWN, TurnResult.OPPONENT_WON, TurnResult.PLAYER_WON],
+            TurnResult.TURN_RESOLVED
+        )
+        results[fought] = fought_results
+        self.status[fought_ids[GAME_ENDING_RESULTS[fought_results]]] = GameStatus.ENDED
+        return results
+
+    def _resolve_lost_states(self, game_ids: np.ndarray) -> np.ndarray:
+        decisions = self.decisions[game_ids]
+        player_flees = decisions[:, PLAYER] == _FLEE
+        opponent_flees = decisions[:, OPPONENT] == _FLEE
+        self.decisions[game_ids] = UNSET
+
+        results = np.select(
+            [player_flees & opponent_flees, opponent_flees, player_flees],
+            [TurnResult.BOTH_FLED, TurnResult.PLAYER_HALF_WIN, TurnResult.OPPONENT_HALF_WIN],
+            TurnResult.CHASE_RESET
+        ).astype(np.int8)
+
+        chased = game_ids[results == TurnResult.CHASE_RESET]
+        self.page[chased] = START_PAGE
+        # Nobody tails anybody after the restart, which is also what the bot expects of it
+        self.tailing[chased] = Tailing.NONE
+        self.status[chased] = GameStatus.PLAYING
+        self.status[game_ids[GAME_ENDING_RESULTS[results]]] = GameStatus.ENDED
+        return results
@@ -0,0 +1,361 @@
+""" Computer opponent: depth-limited expectimax over the outcome table, played on its own worker threads. """
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from src import metrics
+from src.batch_engine import OPPONENT, PLAYER, STARTING_HEALTH, Tailing
+from src.entities.entities import Direction, FleeDecision
+from src.entities.move_defaults import DEFAULT_MOVE_LIST
+from src.entities.request_models import SubmitLostRequest, SubmitMoveRequest
+from src.outcome_table import INVALID_PAGE, get_outcome_tables
+from src.page_table import FACTION_CODES, LOST_PAGE, MOVE_COUNT, START_PAGE
+from src.state_manager import GameStateManager
+
+logger = logging.getLogger(__name__)
+
+# Seated as the opponent of games created against the bot; humans cannot take this name
+BOT_NAME = "Ace Bot"
+
+# Values are from the bot's side: winning is 1, losing -1. Positions are scored well inside that range
+WIN = 1.0
+HALF_WIN = 0.5
+HEALTH_WEIGHT = 0.6
+TAIL_WEIGHT = 0.15
+
+# Each move's direction, which is all a tailing player learns of the tailed player's move
+DIRECTIONS = tuple(Direction)
+_MOVE_DIRECTIONS = np.array([DIRECTIONS.index(move.direction) for move in DEFAULT_MOVE_LIST])
+# [move, direction] membership, normalized so that multiplying by it averages over each direction's moves
+_BY_DIRECTION = np.stack([_MOVE_DIRECTIONS == index for index in range(len(DIRECTIONS))], axis=1).astype(np.float32)
+_DIRECTION_SHARE = _BY_DIRECTION.sum(axis=0) / MOVE_COUNT
+_BY_DIRECTION /= _BY_DIRECTION.sum(axis=0)
+
+# States searched per batch; the deadline is checked between batches, so this bounds the overrun
+_BATCH = 32
+
+Submission = Union[SubmitMoveRequest, SubmitLostRequest]
+
+BOT_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "aoa_bot_decision_seconds", "Time the bot spent choosing a move or lost-state decision."
+))
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+class TranspositionTable:
+    """ Least recently used search values by state, shared by every bot game in the process. """
+
+    def __init__(self, max_size: int = 200000):
+        self.max_size = max_size
+        self._values: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key: tuple) -> Optional[float]:
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._values.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: float):
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            if len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+
+class Expectimax:
+    """
+    Picks moves for one side of a game by searching the outcome table, with health and tailing.
+
+    Moves are simultaneous, so each turn is a chance node over the opponent's 26 moves, taken as
+    equally likely, except where tailing gives one side information. A tailing bot sees the
+    direction of the opponent's move before choosing; a tailing opponent is assumed to answer the
+    bot's direction with its best move against it. Lost states are valued by the chase-or-flee
+    choice against an opponent who chases with ``chase_probability``.
+
+    Deeper searches run until ``budget`` seconds are spent, keeping the deepest one that finished;
+    depth 1 always finishes. State values are kept in a bounded transposition table, so positions
+    seen in any bot game are not searched again.
+    """
+
+    def __init__(self, side: int = OPPONENT, budget: float = 0.05, max_depth: int = 3,
+                 table: Optional[TranspositionTable] = None, chase_probability: float = 0.5):
+        self.side = side
+        self.budget = budget
+        self.max_depth = max_depth
+        self.table = table if table is not None else TranspositionTable()
+        self.chase_probability = chase_probability
+        self.outcomes = get_outcome_tables()
+        self._bot_tailing = Tailing.PLAYER if side == PLAYER else Tailing.OPPONENT
+        self._opponent_tailing = Tailing.OPPONENT if side == PLAYER else Tailing.PLAYER
+
+    def _score(self, health: np.ndarray, tailing: np.ndarray) -> np.ndarray:
+        """ Static value of positions from their health, ``[..., side]``, and tailing. """
+        lead = (health[..., self.side] - health[..., 1 - self.side]) / STARTING_HEALTH
+        tail = (tailing == self._bot_tailing).astype(np.float32) - (tailing == self._opponent_tailing)
+        return HEALTH_WEIGHT * lead + TAIL_WEIGHT * tail
+
+    def _lost_values(self, health: np.ndarray, reset_value: Optional[np.ndarray] = None) -> Tuple[np.ndarray, ...]:
+        """ Values of chasing and of fleeing when lost; chasing when both chase restarts at page 170. """
+        if reset_value is None:
+            reset_value = self._score(health, np.full(health.shape[:-1], Tailing.NONE))
+        chase = self.chase_probability * reset_value + (1 - self.chase_probability) * HALF_WIN
+        flee = self.chase_probability * -HALF_WIN
+        return chase, np.full_like(chase, flee)
+
+    def _turn_values(self, creator: int, pages: np.ndarray, health: np.ndarray, tailing: np.ndarray, depth: int,
+                     deadline: Optional[float]) -> np.ndarray:
+        """ Value of every move pair from each state, ``[state, bot move, opponent move]``. """
+        cells = self.outcomes[creator, pages - 1]
+        new_pages = cells["page"]
+        damage = np.stack([cells["player_damage"], cells["opponent_damage"]], axis=-1).astype(np.float32)
+        new_health = np.maximum(0.0, health[:, None, None, :] - damage)
+        new_tailing = np.where(cells["player_tail"], Tailing.PLAYER,
+                               np.where(cells["opponent_tail"], Tailing.OPPONENT, Tailing.NONE)).astype(np.int8)
+
+        bot_down = new_health[..., self.side] <= 0
+        opponent_down = new_health[..., 1 - self.side] <= 0
+        invalid = new_pages == INVALID_PAGE
+        lost = new_pages == LOST_PAGE
+        ended = bot_down | opponent_down
+        going_on = ~(invalid | lost | ended)
+
+        # Moves off the edge of the book are chosen again from the same position
+        values = np.broadcast_to(self._score(health, tailing)[:, None, None], new_pages.shape).astype(np.float32)
+        values[ended] = np.where(bot_down & opponent_down, 0.0, np.where(bot_down, -WIN, WIN))[ended]
+        values[lost] = np.maximum(*self._lost_values(new_health[lost]))
+        if depth == 1:
+            values[going_on] = self._score(new_health[going_on], new_tailing[going_on])
+        else:
+            values[going_on] = self._values(creator, new_pages[going_on], new_health[going_on],
+                                            new_tailing[going_on], depth - 1, deadline)
+
+        # [state, player move, opponent move] -> [state, bot move, opponent move]
+        return values if self.side == PLAYER else values.swapaxes(1, 2)
+
+    def _backup(self, values: np.ndarray, tailing: np.ndarray) -> np.ndarray:
+        """ Value of each state to the bot, given its move pair values, by who tails whom. """
+        backed_up = values.mean(axis=2).max(axis=1)
+
+        bot_tailing = tailing == self._bot_tailing
+        if bot_tailing.any():
+            # Best move for each direction the opponent may have taken
+            by_direction = (values[bot_tailing] @ _BY_DIRECTION).max(axis=1)
+            backed_up[bot_tailing] = by_direction @ _DIRECTION_SHARE
+
+        opponent_tailing = tailing == self._opponent_tailing
+        if opponent_tailing.any():
+            backed_up[opponent_tailing] = self._answered(values[opponent_tailing]).max(axis=1)
+        return backed_up
+
+    @staticmethod
+    def _answered(values: np.ndarray) -> np.ndarray:
+        """ Value of each bot move once a tailing opponent answers its direction, ``[state, bot move]``. """
+        # The opponent's best answer to each direction, against the bot's moves in it on average
+        answers = np.einsum("md,smo->sdo", _BY_DIRECTION, values).argmin(axis=2)
+        states = np.arange(len(values))[:, None]
+        return values[states, np.arange(MOVE_COUNT)[None, :], answers[:, _MOVE_DIRECTIONS]]
+
+    @staticmethod
+    def _encode(pages: np.ndarray, health: np.ndarray, tailing: np.ndarray) -> np.ndarray:
+        """ One integer per state: page, then each side's health in half points, then tailing. """
+        half_points = (health * 2).astype(np.int32)
+        return ((pages.astype(np.int32) << 10) | (half_points[:, PLAYER] << 6) | (half_points[:, OPPONENT] << 2)
+                | tailing.astype(np.int32))
+
+    @staticmethod
+    def _decode(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        health = np.stack([(codes >> 6) & 15, (codes >> 2) & 15], axis=1).astype(np.float32) / 2
+        return (codes >> 10).astype(np.int16), health, (codes & 3).astype(np.int8)
+
+    def _values(self, creator: int, pages: np.ndarray, health: np.ndarray, tailing: np.ndarray, depth: int,
+                deadline: Optional[float]) -> np.ndarray:
+        """ Searched values of many states, from the transposition table where it has them. """
+        unique, inverse = np.unique(self._encode(pages, health, tailing), return_inverse=True)
+        keys = [(self.side, creator, depth, code) for code in unique.tolist()]
+
+        values = np.empty(len(unique), dtype=np.float32)
+        missing = []
+        for index, key in enumerate(keys):
+            value = self.table.get(key)
+            if value is None:
+                missing.append(index)
+            else:
+                values[index] = value
+
+        for start in range(0, len(missing), _BATCH):
+            if deadline is not None and time.perf_counter() > deadline:
+                raise _OutOfTime()
+            batch = np.array(missing[start:start + _BATCH])
+            batch_pages, batch_health, batch_tailing = self._decode(unique[batch])
+            move_values = self._turn_values(creator, batch_pages, batch_health, batch_tailing, depth, deadline)
+            values[batch] = self._backup(move_values, batch_tailing)
+            for index in batch.tolist():
+                self.table.put(keys[index], float(values[index]))
+
+        return values[inverse.reshape(-1)]
+
+    def choose_move(self, creator: int, page: int, health: Tuple[float, float], tailing: int,
+                    tailed_direction: Optional[Direction] = None) -> int:
+        """
+        Best move index from the position. ``creator`` is the creator's FACTION_CODES position and
+        ``health`` is by side. A tailing bot passes the direction the opponent just moved in.
+        """
+        deadline = time.perf_counter() + self.budget
+        state = (np.array([page], dtype=np.int16), np.array([health], dtype=np.float32),
+                 np.array([tailing], dtype=np.int8))
+
+        best = 0
+        for depth in range(1, self.max_depth + 1):
+            try:
+                values = self._turn_values(creator, *state, depth, deadline if depth > 1 else None)[0]
+            except _OutOfTime:
+                break
+
+            if tailed_direction is not None:
+                seen = _MOVE_DIRECTIONS == DIRECTIONS.index(tailed_direction)
+                best = int(values[:, seen].mean(axis=1).argmax())
+            elif tailing == self._opponent_tailing:
+                best = int(self._answered(values[None])[0].argmax())
+            else:
+                best = int(values.mean(axis=1).argmax())
+        return best
+
+    def choose_decision(self, creator: int, health: Tuple[float, float]) -> FleeDecision:
+        """
+        Chase or flee when lost, weighing the restart at page 170, where nobody tails, against a
+        half-victory or a loss.
+        """
+        deadline = time.perf_counter() + self.budget
+        health = np.array([health], dtype=np.float32)
+        reset_value = None
+        for depth in range(1, self.max_depth + 1):
+            try:
+                reset_value = self._values(creator, np.array([START_PAGE], dtype=np.int16), health,
+                                           np.array([Tailing.NONE], dtype=np.int8), depth,
+                                           deadline if depth > 1 else None)
+            except _OutOfTime:
+                break
+
+        chase, flee = self._lost_values(health, reset_value)
+        return FleeDecision.CHASE if chase[0] >= flee[0] else FleeDecision.FLEE
+
+
+class BotRunner:
+    """
+    Plays bot games on a few worker threads of its own, so searches never hold up the request
+    thread pool. ``schedule`` asks for a game to be looked at; a game already being played is looked
+    at again once its worker is done rather than by a second worker.
+    """
+
+    def __init__(self, workers: int = 2, budget: float = 0.05, table_size: int = 200000):
+        self.workers = workers
+        self.search = Expectimax(OPPONENT, budget, table=TranspositionTable(table_size))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._play: Optional[Callable[[str], None]] = None
+        # Games being played, and whether they were scheduled again meanwhile
+        self._active: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def start(self, play: Callable[[str], None]):
+        """ Starts the workers; ``play(game_id)`` makes the bot's next submission to the game, if it has one. """
+        self._play = play
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="bot")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def plan(self, game_id: str, game: GameStateManager) -> Optional[Callable[[], Submission]]:
+        """
+        What the bot owes the game, read while its lock is held: None if nothing yet, or a function
+        that searches for the bot's submission once the lock is released and returns its request.
+        """
+        if game.is_open or game.opponent.name != BOT_NAME:
+            return None
+
+        faction = game.opponent.faction
+        creator = FACTION_CODES.index(game.player.faction)
+        health = (game.player.health, game.opponent.health)
+        page = game.current_opponent_page.page_num
+
+        if page == LOST_PAGE:
+            if game.lost_state_decisions[OPPONENT] is not None:
+                return None
+            return lambda: SubmitLostRequest(game_id=game_id, faction=faction,
+                                             decision=self._timed(self.search.choose_decision, creator, health))
+
+        if game.moves[OPPONENT] != game.null_move:
+            return None
+        tailing, direction = Tailing.NONE, None
+        if game.tailing_player is not None:
+            if game.tailing_player.faction == faction:
+                player_move, _ = game.moves[PLAYER]
+                if player_move is None:
+                    # Tailing, so the bot moves once it has seen the direction of the player's move
+                    return None
+                tailing, direction = Tailing.OPPONENT, game.tailed_page.moves[player_move].direction
+            else:
+                tailing = Tailing.PLAYER
+
+        return lambda: SubmitMoveRequest(game_id=game_id, faction=faction, move_index=self._timed(
+            self.search.choose_move, creator, page, health, tailing, direction
+        ))
+
+    def _timed(self, choose: Callable, *args):
+        start = time.perf_counter()
+        choice = choose(*args)
+        BOT_SECONDS.observe(time.perf_counter() - start)
+        return choice
+
+    def schedule(self, game_id: str):
+        with self._lock:
+            if game_id in self._active:
+                self._active[game_id] = True
+                return
+            self._active[game_id] = False
+        self._executor.submit(self._run, game_id)
+
+    def _run(self, game_id: str):
+        while True:
+            try:
+                self._play(game_id)
+            except Exception:
+                logger.exception("Bot failed to play game %s", game_id)
+
+            with self._lock:
+                if not self._active[game_id]:
+                    del self._active[game_id]
+                    return
+                self._active[game_id] = False
+
+
+def bots_from_env() -> Optional[BotRunner]:
+    """ AOA_BOT_WORKERS threads (0 turns bots off) with AOA_BOT_BUDGET_MS per move and AOA_BOT_TABLE_SIZE states. """
+    workers = int(os.environ.get("AOA_BOT_WORKERS", 2))
+    if workers <= 0:
+        return None
+    return BotRunner(
+        workers=workers,
+        budget=float(os.environ.get("AOA_BOT_BUDGET_MS", 50)) / 1000,
+        table_size=int(os.environ.get("AOA_BOT_TABLE_SIZE", 200000)),
+    )
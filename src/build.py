@@ -0,0 +1,86 @@
+""" Build steps for derived game data. Run from the repository root, e.g. ``python -m src.build build-outcomes``. """
+import argparse
+import os
+import time
+
+from src.asset_pack import build_asset_pack, ASSET_PACK_PATH
+from src.outcome_table import save_outcome_tables, verify_outcomes, OUTCOME_TABLE_PATH, INVALID_PAGE
+from src.page_images import build_page_images, variant_sizes, PAGE_IMAGE_PATH, VARIANT_WIDTHS, VARIANTS_DIR
+from src.page_table import compile_books, COMPILED_BOOKS_PATH, FACTION_CODES
+
+
+def build_books(args):
+    books = compile_books(args.output)
+    factions = ", ".join(faction.value for faction in FACTION_CODES)
+    print(f"Compiled {books.shape[1]} pages per book ({factions}, {books.nbytes} bytes) to {args.output}")
+
+
+def build_outcomes(args):
+    start = time.perf_counter()
+    outcomes = save_outcome_tables(args.output)
+    print(f"Wrote {outcomes.size} outcome cells ({outcomes.nbytes} bytes) to {args.output} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    invalid = int((outcomes["page"] == INVALID_PAGE).sum())
+    if invalid:
+        print(f"{invalid} cells lead outside the book and are marked invalid")
+
+    if not args.skip_verify:
+        start = time.perf_counter()
+        checked = verify_outcomes(outcomes)
+        print(f"Verified {checked} cells against PageManager.find_result in {time.perf_counter() - start:.2f}s")
+
+
+def build_images(args):
+    start = time.perf_counter()
+    manifest = build_page_images(tuple(args.widths), args.quality, args.workers)
+    print(f"Built variants of {len(manifest['images'])} page images in {VARIANTS_DIR} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    sources = sum(os.path.getsize(PAGE_IMAGE_PATH.format(faction=key.split("/")[0], page_num=key.split("/")[1]))
+                  for key in manifest["images"])
+    print(f"  originals: {sources / 2 ** 20:.1f} MiB")
+    for label, size in variant_sizes(manifest).items():
+        print(f"  {label}: {size / 2 ** 20:.1f} MiB")
+
+
+def pack_assets(args):
+    start = time.perf_counter()
+    index = build_asset_pack(args.output)
+    print(f"Packed {len(index['assets'])} assets ({len(index['pages'])} pages, {len(index['icons'])} icons, "
+          f"{os.path.getsize(args.output) / 2 ** 20:.1f} MiB) to {args.output} in {time.perf_counter() - start:.2f}s")
+    if index["icon_atlas"]:
+        atlas = index["icon_atlas"]
+        print(f"  icon atlas: {len(atlas['icons'])} tiles of {atlas['tile_width']}x{atlas['tile_height']}px, "
+              f"{index['assets'][atlas['name']][1] / 1024:.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    books_parser = commands.add_parser("compile-books", help="Compile the CSV books for memory-mapping")
+    books_parser.add_argument("--output", default=COMPILED_BOOKS_PATH)
+    books_parser.set_defaults(handler=build_books)
+
+    outcomes_parser = commands.add_parser("build-outcomes", help="Precompute the turn outcome table")
+    outcomes_parser.add_argument("--output", default=OUTCOME_TABLE_PATH)
+    outcomes_parser.add_argument("--skip-verify", action="store_true", help="Skip the cell-by-cell cross-check")
+    outcomes_parser.set_defaults(handler=build_outcomes)
+
+    images_parser = commands.add_parser("build-page-images", help="Resize and recompress the page images")
+    images_parser.add_argument("--widths", type=int, nargs="+", default=list(VARIANT_WIDTHS))
+    images_parser.add_argument("--quality", type=int, default=80)
+    images_parser.add_argument("--workers", type=int, help="Processes to encode with, all CPUs by default")
+    images_parser.set_defaults(handler=build_images)
+
+    pack_parser = commands.add_parser("pack-assets", help="Pack the page images and move icons into one file")
+    pack_parser.add_argument("--output", default=ASSET_PACK_PATH)
+    pack_parser.set_defaults(handler=pack_assets)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,90 @@
-from fastapi import FastAPI
+import hmac
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Request, Header, Query, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import uvicorn
+from src.bot import bots_from_env
 from src.game_service import GameManager
-from src.entities.request_models import CreateGameRequest, JoinGameRequest, SubmitMoveRequest, SubmitLostRequest
+from src.game_log import GameLog, log_from_env
+from src.game_reaper import reaper_from_env
+from src.game_store import GameStore, SqliteGameStore, store_from_env
+from src.entities.entities import Factions
+from src.entities.request_models import (
+    CreateGameRequest, JoinGameRequest, SubmitMoveRequest, SubmitLostRequest, MatchmakingRequest, ProfilingSettings
+)
+from src import metrics, page_images
+from src.asset_pack import get_asset_pack
+from src.page_manager import warm_page_cache
+from src.profiling import ProfiledRoute, ProfilingMiddleware, profiler_from_env
+
+# Asset URLs are named by their content, so what a browser cached never goes stale
+IMMUTABLE = "public, max-age=31536000, immutable"
+# The /admin routes are only served when this is set, to requests carrying it in X-Admin-Token
+ADMIN_TOKEN = os.environ.get("AOA_ADMIN_TOKEN")
+# Matchmaking queues, event streams and bot players live in one process, so they are only served by a single worker
+WORKERS = int(os.environ.get("AOA_WORKERS", 1))
+
+# Created with the app's lifespan, so that importing this module starts no threads
+service: Optional[GameManager] = None
+
+
+def check_workers(store: GameStore, log: Optional[GameLog]):
+    """ Several workers only see each other's games through the SQLite store, and must not share an event log. """
+    if WORKERS > 1 and (not isinstance(store, SqliteGameStore) or log is not None):
+        raise RuntimeError(
+            f"AOA_WORKERS={WORKERS} needs AOA_STATE_BACKEND=sqlite and no AOA_EVENT_LOG_DIR; "
+            "otherwise each worker would keep, or replay, games of its own"
+        )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """ Recovers the games and starts the service's background threads with the app; stops them with it. """
+    global service
+    store, log = store_from_env(), log_from_env()
+    check_workers(store, log)
+    service = GameManager(store, log, reaper_from_env(), bots_from_env() if WORKERS == 1 else None)
+    metrics.watch_service(service)
+    service.start()
+    try:
+        yield
+    finally:
+        service.close()
+
 
 app = FastAPI(
-    title="Ace of Aces API"
+    title="Ace of Aces API",
+    lifespan=lifespan
 )
-service = GameManager()
+# Set before any route is declared
+app.router.route_class = ProfiledRoute
+profiler = profiler_from_env()
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+app.add_middleware(metrics.MetricsMiddleware)
+warm_page_cache()
+assets = get_asset_pack()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def require_single_worker():
+    if WORKERS > 1:
+        raise HTTPException(status_code=501, detail="Only available with a single server worker (AOA_WORKERS=1)")
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    return bool(if_none_match) and (
+        if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+    )
 
 
 @app.post("/create-game")
@@ -15,8 +93,9 @@ def create_game(request: CreateGameRequest):
 
 
 @app.get("/list-games")
-def list_games():
-    return service.list_available_games()
+def list_games(faction: Optional[Factions] = None, created_after: Optional[float] = None, cursor: Optional[str] = None,
+               limit: int = Query(50, ge=1, le=200)):
+    return service.list_available_games(faction, created_after, cursor, limit)
 
 
 @app.post("/join-game")
@@ -44,5 +123,112 @@ def get_player_status(game_id: str, player_name: str):
     return service.get_player_status(game_id, player_name)
 
 
+@app.get("/games/{game_id}/snapshot")
+def game_snapshot(game_id: str, if_none_match: Optional[str] = Header(None)):
+    """ Page, health, tailing and last message in one payload; unchanged polls get an empty 304. """
+    etag, body = service.get_snapshot(game_id)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/games/{game_id}/events", dependencies=[Depends(require_single_worker)])
+async def game_events(game_id: str, request: Request):
+    """ Server-Sent Events stream of the game's state changes, closed once the game ends. """
+    # A query with the SQLite store, so kept off the event loop
+    if not await run_in_threadpool(service.store.__contains__, game_id):
+        raise HTTPException(status_code=404, detail="Game not found")
+
+    return StreamingResponse(
+        service.events.stream(game_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/matchmaking", dependencies=[Depends(require_single_worker)])
+async def matchmaking(request: MatchmakingRequest):
+    """ Pairs the player with the next compatible opponent; answers with status "timeout" if none shows up in time. """
+    service.check_player_name(request.player_name)
+    return await service.matchmaker.find_match(request.player_name, request.faction, request.wait_seconds)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """ Request latencies, game counts and engine timings in the Prometheus text format. """
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+def profiling_status():
+    """ Profiling settings and the profiles and allocation snapshots dumped so far, newest first. """
+    return {**profiler.settings(), "dumps": profiler.dumps()}
+
+
+@app.put("/admin/profiling", dependencies=[Depends(require_admin)])
+def configure_profiling(settings: ProfilingSettings):
+    """ Changes what this worker profiles, until it restarts. """
+    profiler.trace_memory = settings.trace_memory
+    profiler.min_duration = settings.min_duration_ms / 1000
+    profiler.sample_rate = settings.sample_rate
+    return profiler.settings()
+
+
+@app.get("/admin/profiling/dumps/{name}", dependencies=[Depends(require_admin)])
+def profiling_dump(name: str):
+    """ A dumped file: ``.prof`` loads with pstats or snakeviz, ``.tracemalloc`` with tracemalloc.Snapshot.load. """
+    path = profiler.dump_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Dump not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
+@app.get("/assets/{name}")
+def asset(name: str, if_none_match: Optional[str] = Header(None)):
+    """ A page image or icon from the asset pack, by the content-addressed name the pack lists it under. """
+    found = assets.get(name) if assets is not None else None
+    if found is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    data, media_type = found
+    headers = {"ETag": f'"{name}"', "Cache-Control": IMMUTABLE}
+    if _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    # A slice of the mapped pack, handed to the server without copying
+    return Response(content=data, media_type=media_type, headers=headers)
+
+
+@app.get("/page-images/{faction}/{page_num}")
+def page_image(faction: Factions, page_num: int, width: Optional[int] = Query(None, gt=0),
+               format: Optional[str] = Query(None, pattern="^(webp|jpg)$"),
+               accept: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
+    """ The page scan at the smallest built size covering ``width``, as WebP if the client takes it. """
+    extension = format or ("webp" if accept and "image/webp" in accept else "jpg")
+    headers = {"Cache-Control": "public, max-age=86400", "Vary": "Accept"}
+
+    name = assets.page_asset(faction, page_num, width, extension) if assets is not None else None
+    if name is not None:
+        headers["ETag"] = f'"{name}"'
+        if _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        data, media_type = assets.get(name)
+        return Response(content=data, media_type=media_type, headers=headers)
+
+    found = page_images.page_image(faction, page_num, width, extension)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Page image not found")
+
+    path, tag = found
+    headers["ETag"] = f'"{tag}.{extension}"'
+    if _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers)
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Refuse before any worker is started, rather than have each one fail in turn
+    check_workers(store_from_env(), log_from_env())
+    uvicorn.run("src.controller:app", host="0.0.0.0", port=8000, workers=WORKERS)
@@ -1,7 +1,7 @@
 from enum import Enum
-from typing import List, Optional
+from typing import Optional, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from src.entities.move_content import MoveNames, MoveDescriptions
 
@@ -61,6 +61,8 @@ class Direction(str, Enum):
 
 
 class Movement(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     index: int
     next_page: Optional[int] = None
     descent: bool = False
@@ -75,12 +77,14 @@ class DetailedMovement(Movement):
 
 
 class Page(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     faction: Factions
     page_num: int
     distance: Distance
     tail: bool = False
     fire: FireType
-    moves: List[Movement]
+    moves: Tuple[Movement, ...]
 
 
 class PlayerInfo(BaseModel):
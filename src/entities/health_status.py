@@ -12,4 +12,9 @@ PLAYER_HEALTH_DESCRIPTIONS = [
     (1.0, "Pain sears through your side from shrapnel. The plane barely responds."),
     (0.5, "You’re struggling to stay conscious, gripping the stick with numb fingers."),
     (0.0, "Your aircraft spirals out of control, flames licking at the fuselage—this is the end."),
-]
\ No newline at end of file
+]
+
+
+def describe_health(health: float) -> str:
+    """ The first description whose threshold the health reaches. """
+    return next(desc for hp, desc in PLAYER_HEALTH_DESCRIPTIONS if health >= hp)
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 from src.entities.entities import Factions, FleeDecision
 
@@ -13,6 +15,8 @@ class RequestFaction(BaseRequest):
 
 class CreateGameRequest(RequestFaction):
     player_name: str = "Diogo"
+    # Seats the computer opponent straight away instead of waiting for someone to join
+    against_bot: bool = False
 
 
 class JoinGameRequest(BaseRequest):
@@ -25,3 +29,19 @@ class SubmitMoveRequest(RequestFaction):
 
 class SubmitLostRequest(RequestFaction):
     decision: FleeDecision
+
+
+class MatchmakingRequest(BaseModel):
+    player_name: str = "Diogo"
+    # Either side if left out
+    faction: Optional[Factions] = None
+    # How long to wait for an opponent before giving up
+    wait_seconds: float = Field(25.0, gt=0, le=60)
+
+
+class ProfilingSettings(BaseModel):
+    # Fraction of requests profiled; 0 turns profiling off
+    sample_rate: float = Field(0.0, ge=0, le=1)
+    trace_memory: bool = False
+    # Profiles of faster requests are dropped
+    min_duration_ms: float = Field(0.0, ge=0)
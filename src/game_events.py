@@ -0,0 +1,71 @@
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, Set, Tuple
+
+HEARTBEAT_SECONDS = 15.0
+
+# Event types pushed to subscribers of a game
+PLAYER_JOINED = "player_joined"
+OPPONENT_MOVED = "opponent_moved"
+TAILED_DIRECTION = "tailed_direction"
+TURN_RESOLVED = "turn_resolved"
+LOST_STATE = "lost_state"
+LOST_DECISION = "lost_decision"
+GAME_END = "game_end"
+
+
+class GameEventBroker:
+    """
+    Fans out game state changes to Server-Sent Events subscribers.
+
+    ``publish`` is called from the request thread pool while the game's lock is held, so events of
+    one game arrive in order; each subscriber queue lives on the event loop that serves it.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._event_ids = itertools.count(1)
+
+    def publish(self, game_id: str, event_type: str, **data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(game_id, ()))
+
+        if not subscribers:
+            return
+
+        event = {"id": next(self._event_ids), "type": event_type, **data}
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def subscriber_count(self, game_id: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(game_id, ()))
+
+    async def stream(self, game_id: str, is_disconnected: Callable) -> AsyncIterator[str]:
+        """ Yields the game's events in SSE wire format until the game ends or the client leaves. """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[game_id].add(subscriber)
+
+        try:
+            # Tells the client the stream is live before anything happens in the game
+            yield ": connected\n\n"
+            while not await is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscriber[1].get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] == GAME_END:
+                    break
+        finally:
+            with self._lock:
+                self._subscribers[game_id].discard(subscriber)
+                if not self._subscribers[game_id]:
+                    del self._subscribers[game_id]
@@ -0,0 +1,254 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.entities.entities import Factions, FleeDecision, PlayerInfo
+from src.state_manager import GameStateManager
+
+logger = logging.getLogger(__name__)
+
+# Entry types; every entry also carries the game id and the game's version after the action
+CREATE = "create"
+JOIN = "join"
+MOVE = "move"
+DECISION = "decision"
+TURN_RESOLVED = "turn_resolved"
+EXPIRE = "expire"
+
+_SEGMENT_PATTERN = re.compile(r"(log|snapshot)-(\d+)\.jsonl$")
+
+
+def _number(path: str) -> int:
+    return int(_SEGMENT_PATTERN.search(path).group(2))
+
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def apply_entry(games: Dict[str, GameStateManager], entry: dict):
+    """
+    Replays one logged action onto ``games``. Entries the games already reflect, because a snapshot
+    was taken after they were written, are skipped by version.
+    """
+    game_id = entry["game_id"]
+    if entry["type"] == CREATE:
+        if game_id not in games:
+            game = GameStateManager(PlayerInfo(player_name=entry["player_name"], faction=entry["faction"]))
+            game.uid = entry["uid"]
+            game.created_at = entry["created_at"]
+            games[game_id] = game
+        return
+
+    game = games.get(game_id)
+    if game is None:
+        return
+
+    if entry["type"] == EXPIRE:
+        # Evicted by the reaper, unchanged since the version it saw
+        if entry["version"] == game.version:
+            del games[game_id]
+        return
+
+    if entry["type"] == TURN_RESOLVED:
+        # Written right after the action that resolved the turn, so it only double-checks the replay
+        if entry["version"] == game.version and entry["new_page"] != game.current_player_page.page_num:
+            logger.warning("Replay of game %s diverged from the log at version %s", game_id, entry["version"])
+        return
+
+    if entry["version"] <= game.version:
+        return
+    if entry["version"] != game.version + 1:
+        logger.warning("Log is missing changes to game %s before version %s", game_id, entry["version"])
+        return
+
+    if entry["type"] == JOIN:
+        message = game.add_opponent(entry["player_name"])
+    elif entry["type"] == MOVE:
+        message = game.submit_move(Factions(entry["faction"]), entry["move_index"])
+    elif entry["type"] == DECISION:
+        message = game.submit_lost_state_decision(Factions(entry["faction"]), FleeDecision(entry["decision"]))
+    else:
+        raise ValueError(f"Unknown log entry type {entry['type']!r}")
+
+    if message.get("game_end"):
+        del games[game_id]
+
+
+class GameLog:
+    """
+    Append-only log of accepted game actions with periodic snapshots, for rebuilding the in-memory
+    store after a restart.
+
+    Appends only buffer the entry; a background thread writes and fsyncs everything buffered every
+    ``sync_interval`` seconds, so one fsync covers every action of that window and a crash loses at
+    most that window. Once ``snapshot_every`` entries have been logged since the last snapshot, the
+    log moves on to a new segment, all live games are written to a snapshot, and the segments the
+    snapshot covers are deleted. Recovery therefore loads one snapshot and replays at most about
+    ``snapshot_every`` entries, and each entry is rewritten at most once more as part of a snapshot.
+    """
+
+    def __init__(self, directory: str, sync_interval: float = 0.01, snapshot_every: int = 500000):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+
+        # Guards the buffer and the current segment; file writes are serialized by _write_lock
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._segment = 0
+        self._file = None
+        self._entries_since_snapshot = 0
+
+        self._state_source: Optional[Callable[[], Iterable[Tuple[str, dict]]]] = None
+        self._snapshotting = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def _path(self, kind: str, number: int) -> str:
+        return os.path.join(self.directory, f"{kind}-{number:08d}.jsonl")
+
+    def _files(self, kind: str) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, f"{kind}-*.jsonl")), key=_number)
+
+    def recover(self) -> Dict[str, GameStateManager]:
+        """ Rebuilds the live games from the latest snapshot and the log written after it. """
+        games: Dict[str, GameStateManager] = {}
+        snapshots = self._files("snapshot")
+        first_segment = 0
+
+        if snapshots:
+            first_segment = _number(snapshots[-1])
+            with open(snapshots[-1]) as snapshot:
+                for line in snapshot:
+                    game_id, state = json.loads(line)
+                    games[game_id] = GameStateManager.from_state(state)
+
+        segments = [path for path in self._files("log") if _number(path) >= first_segment]
+        replayed = 0
+        for path in segments:
+            with open(path) as segment:
+                for line in segment:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn write from the crash; nothing after it reached the disk either
+                        logger.warning("Ignoring the truncated tail of %s", path)
+                        break
+                    apply_entry(games, entry)
+                    replayed += 1
+
+        # Never append to a segment that may end in a torn write
+        last = max([first_segment - 1] + [_number(path) for path in segments])
+        self._segment = last + 1
+        self._entries_since_snapshot = replayed
+        logger.info("Recovered %d games, replaying %d log entries", len(games), replayed)
+        return games
+
+    def start(self, state_source: Callable[[], Iterable[Tuple[str, dict]]]):
+        """ Opens a fresh segment and starts syncing; ``state_source`` yields ``(game_id, state)`` for snapshots. """
+        self._state_source = state_source
+        self._file = open(self._path("log", self._segment), "a")
+        self._flusher = threading.Thread(target=self._run, name="game-log-flusher", daemon=True)
+        self._flusher.start()
+
+    def append(self, entry: dict):
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._buffer.append(line)
+            self._entries_since_snapshot += 1
+            due = self._entries_since_snapshot >= self.snapshot_every and not self._snapshotting.is_set()
+            if due:
+                self._snapshotting.set()
+
+        if due:
+            threading.Thread(target=self._snapshot, name="game-log-snapshot", daemon=True).start()
+
+    def _run(self):
+        while not self._stopped.wait(self.sync_interval):
+            self.flush()
+
+    def flush(self):
+        """ Writes and fsyncs everything appended so far. """
+        with self._write_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if lines:
+                self._file.write("".join(lines))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def snapshot(self):
+        """ Writes a snapshot now, whatever the number of entries logged since the last one. """
+        with self._lock:
+            if self._snapshotting.is_set():
+                return
+            self._snapshotting.set()
+        self._snapshot()
+
+    def _snapshot(self):
+        try:
+            with self._write_lock:
+                # Entries appended from here on go to the new segment; the snapshot covers all older ones
+                with self._lock:
+                    lines, self._buffer = self._buffer, []
+                    old_file = self._file
+                    self._segment += 1
+                    segment = self._segment
+                    self._file = open(self._path("log", segment), "a")
+                    self._entries_since_snapshot = 0
+                old_file.write("".join(lines))
+                old_file.flush()
+                os.fsync(old_file.fileno())
+                old_file.close()
+
+            # Games changed after the switch may already include entries of the new segment;
+            # replay skips those by version
+            path = self._path("snapshot", segment)
+            with open(path + ".tmp", "w") as snapshot:
+                for game_id, state in self._state_source():
+                    snapshot.write(json.dumps([game_id, state], separators=(",", ":")) + "\n")
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(path + ".tmp", path)
+            _fsync_directory(self.directory)
+
+            for old in self._files("log") + self._files("snapshot"):
+                if _number(old) < segment:
+                    os.remove(old)
+        except Exception:
+            logger.exception("Failed to write a game log snapshot")
+        finally:
+            self._snapshotting.clear()
+
+    def close(self):
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        self._file.close()
+
+
+def log_from_env() -> Optional[GameLog]:
+    """
+    Logs games under AOA_EVENT_LOG_DIR if it is set. Meant for the in-memory store with a single
+    worker; the SQLite store is durable on its own.
+    """
+    directory = os.environ.get("AOA_EVENT_LOG_DIR")
+    if not directory:
+        return None
+    return GameLog(
+        directory,
+        sync_interval=float(os.environ.get("AOA_EVENT_LOG_SYNC_SECONDS", 0.01)),
+        snapshot_every=int(os.environ.get("AOA_EVENT_LOG_SNAPSHOT_EVERY", 500000)),
+    )
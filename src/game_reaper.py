@@ -0,0 +1,128 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Why a game was evicted
+UNJOINED = "unjoined"
+IDLE = "idle"
+
+
+class GameReaper:
+    """
+    Evicts games nobody joined within ``open_ttl`` seconds, and games without any change for
+    ``idle_ttl`` seconds.
+
+    Every scheduled game has exactly one entry in a heap ordered by deadline. Activity only updates
+    the game's deadline in ``_deadlines``; when an entry comes due the reaper either finds the game
+    touched since, and pushes it back with its new deadline, or evicts it. Each pass therefore only
+    looks at games that are due, and ended games drop out of the heap at their old deadline.
+    """
+
+    def __init__(self, open_ttl: float = 600.0, idle_ttl: float = 1800.0, max_interval: float = 1.0):
+        self.open_ttl = open_ttl
+        self.idle_ttl = idle_ttl
+        self.max_interval = max_interval
+
+        # Guards the heap and the deadlines
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, int, str]] = []
+        # game id -> [deadline, version, is_open, heap entry sequence]
+        self._deadlines: Dict[str, list] = {}
+        self._sequence = itertools.count()
+
+        self.evictions: Dict[str, int] = {UNJOINED: 0, IDLE: 0}
+        self._expire: Optional[Callable[[str, int, str], bool]] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def touch(self, game_id: str, version: int, is_open: bool):
+        """ Restarts the game's TTL; ``version`` is the one the game had after this activity. """
+        deadline = time.monotonic() + (self.open_ttl if is_open else self.idle_ttl)
+        with self._lock:
+            scheduled = self._deadlines.get(game_id)
+            if scheduled is not None:
+                scheduled[:3] = deadline, version, is_open
+                return
+
+            sequence = next(self._sequence)
+            self._deadlines[game_id] = [deadline, version, is_open, sequence]
+            heapq.heappush(self._heap, (deadline, sequence, game_id))
+
+    def forget(self, game_id: str):
+        """ Stops tracking a game that ended; its heap entry is dropped when it comes due. """
+        with self._lock:
+            self._deadlines.pop(game_id, None)
+
+    def start(self, expire: Callable[[str, int, str], bool]):
+        """ Starts reaping; ``expire(game_id, version, reason)`` evicts a game unless it changed since ``version``. """
+        self._expire = expire
+        self._thread = threading.Thread(target=self._run, name="game-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self._next_wait()):
+            try:
+                self.reap()
+            except Exception:
+                logger.exception("Failed to reap idle games")
+
+    def _next_wait(self) -> float:
+        with self._lock:
+            if not self._heap:
+                return self.max_interval
+            return min(self.max_interval, max(0.0, self._heap[0][0] - time.monotonic()))
+
+    def _pop_due(self, now: float) -> List[Tuple[str, int, bool]]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, sequence, game_id = heapq.heappop(self._heap)
+                scheduled = self._deadlines.get(game_id)
+                if scheduled is None or scheduled[3] != sequence:
+                    # The game ended, or was recreated and has a newer entry
+                    continue
+
+                deadline, version, is_open, _ = scheduled
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline, sequence, game_id))
+                    continue
+
+                del self._deadlines[game_id]
+                due.append((game_id, version, is_open))
+        return due
+
+    def reap(self, now: Optional[float] = None) -> int:
+        """ Evicts every game past its deadline. Returns how many were evicted. """
+        evicted = 0
+        for game_id, version, is_open in self._pop_due(time.monotonic() if now is None else now):
+            reason = UNJOINED if is_open else IDLE
+            # A game changed since its last touch, e.g. by another worker, is left alone
+            if self._expire(game_id, version, reason):
+                self.evictions[reason] += 1
+                evicted += 1
+
+        if evicted:
+            logger.info("Evicted %d expired games", evicted)
+        return evicted
+
+
+def reaper_from_env() -> GameReaper:
+    """ TTLs in seconds from AOA_OPEN_GAME_TTL and AOA_IDLE_GAME_TTL. """
+    return GameReaper(
+        open_ttl=float(os.environ.get("AOA_OPEN_GAME_TTL", 600)),
+        idle_ttl=float(os.environ.get("AOA_IDLE_GAME_TTL", 1800)),
+    )
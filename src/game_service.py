@@ -1,73 +1,265 @@
-from typing import Dict
+import time
+from typing import Callable, Optional, Tuple
+
 from fastapi import HTTPException
 from src.entities.request_models import CreateGameRequest, JoinGameRequest, SubmitMoveRequest, SubmitLostRequest
-from src.state_manager import GameStateManager, PlayerState
+from src import game_events
+from src import game_log
+from src import metrics
+from src.bot import BOT_NAME, BotRunner
+from src.game_events import GameEventBroker
+from src.game_log import GameLog
+from src.game_reaper import GameReaper
+from src.game_store import GameStore, InMemoryGameStore
+from src.matchmaking import Matchmaker
+from src.open_games import decode_cursor, encode_cursor
+from src.state_manager import GameStateManager, MOVE_RECEIVED, DECISION_RECEIVED
 from src.entities.entities import PlayerInfo, Factions
 
 
 class GameManager:
-    def __init__(self):
-        self.games: Dict[str, GameStateManager] = {}
+    # Optimistic commits that lose a race re-run against the newer version this many times
+    commit_attempts = 10
 
-    def create_game(self, request: CreateGameRequest):
-        """ Creates a new game with one player. """
-        if request.game_id in self.games:
+    def __init__(self, store: Optional[GameStore] = None, log: Optional[GameLog] = None,
+                 reaper: Optional[GameReaper] = None, bots: Optional[BotRunner] = None):
+        self.store = store if store is not None else InMemoryGameStore()
+        self.events = GameEventBroker()
+        self.log = log
+        self.reaper = reaper
+        self.bots = bots
+        self.matchmaker = Matchmaker(self.create_match)
+
+        if log is not None:
+            for game_id, game in log.recover().items():
+                self.store.create(game_id, game)
+
+        if reaper is not None:
+            # Games that outlived a restart get a full TTL from now
+            for game_id, version, is_open in self.store.summaries():
+                reaper.touch(game_id, version, is_open)
+
+    def start(self):
+        """ Starts the log's flusher, the reaper and the bots, if there are any. Pair with ``close``. """
+        if self.log is not None:
+            self.log.start(self.store.states)
+
+        if self.reaper is not None:
+            self.reaper.start(self.expire_game)
+
+        if self.bots is not None:
+            self.bots.start(self.play_bot)
+            # Bot games recovered mid-turn may be waiting on the bot; the others are left as they are
+            for game_id, _, is_open in self.store.summaries():
+                if not is_open:
+                    self.bots.schedule(game_id)
+
+    def _update_game(self, game_id: str, action: Callable[[GameStateManager], dict], entry: dict,
+                     on_commit: Callable[[dict], None]) -> dict:
+        """
+        Runs ``action`` on the game and commits the result if it changed the game, logging ``entry``
+        and calling ``on_commit`` once it is stored. A game the action ended is deleted from the store
+        instead of saved.
+        """
+        start = time.perf_counter()
+        for _ in range(self.commit_attempts):
+            with self.store.checkout(game_id) as game:
+                version = game.version
+                result = action(game)
+                if game.version == version:
+                    return result
+
+                if result.get("game_end"):
+                    committed = self.store.delete(game_id, version)
+                else:
+                    committed = self.store.save(game_id, game, version)
+
+                if committed:
+                    if "new_page" in result or result.get("game_end"):
+                        metrics.TURN_SECONDS.observe(time.perf_counter() - start)
+                    if result.get("game_end"):
+                        metrics.GAMES_ENDED.labels("finished").inc()
+                    self._log_change(game_id, game, entry, result)
+                    self._schedule(game_id, game, result)
+                    on_commit(result)
+                    return result
+
+        raise HTTPException(status_code=409, detail="Game is busy, try again")
+
+    def _log_change(self, game_id: str, game: GameStateManager, entry: dict, result: dict):
+        if self.log is None:
+            return
+
+        self.log.append({**entry, "game_id": game_id, "version": game.version})
+        if "new_page" in result:
+            self.log.append({"type": game_log.TURN_RESOLVED, "game_id": game_id, "version": game.version,
+                             "new_page": result["new_page"]})
+
+    def _schedule(self, game_id: str, game: GameStateManager, result: dict):
+        if self.bots is not None and not result.get("game_end") and game.opponent.name == BOT_NAME:
+            self.bots.schedule(game_id)
+
+        if self.reaper is None:
+            return
+
+        if result.get("game_end"):
+            self.reaper.forget(game_id)
+        else:
+            self.reaper.touch(game_id, game.version, game.is_open)
+
+    def play_bot(self, game_id: str):
+        """ Makes the bot's next submission to one of its games, if it owes one. """
+        try:
+            with self.store.read(game_id) as game:
+                plan = self.bots.plan(game_id, game)
+            if plan is None:
+                return
+
+            # Searched without the game's lock, so the player is never kept waiting on it
+            request = plan()
+            if isinstance(request, SubmitLostRequest):
+                self.submit_lost_decision(request)
+            else:
+                self.submit_move(request)
+        except HTTPException:
+            # The game ended or was evicted, or stayed busy; a later change schedules the bot again
+            pass
+
+    def expire_game(self, game_id: str, version: int, reason: str) -> bool:
+        """ Evicts a game the reaper found expired, unless it changed since ``version``. """
+        try:
+            with self.store.checkout(game_id) as game:
+                if game.version != version or not self.store.delete(game_id, version):
+                    return False
+
+                if self.log is not None:
+                    self.log.append({"type": game_log.EXPIRE, "game_id": game_id, "version": version})
+                self.events.publish(game_id, game_events.GAME_END, message=f"Game expired ({reason})")
+                metrics.GAMES_ENDED.labels(reason).inc()
+                return True
+        except HTTPException:
+            # Already gone
+            return False
+
+    def close(self):
+        """ Stops the reaper and the bots and flushes the game log, if there are any. """
+        if self.reaper is not None:
+            self.reaper.stop()
+        if self.bots is not None:
+            self.bots.stop()
+        if self.log is not None:
+            self.log.close()
+
+    def _add_game(self, game_id: str, game: GameStateManager):
+        if not self.store.create(game_id, game):
             raise HTTPException(status_code=400, detail="Game already exists")
+        metrics.GAMES_CREATED.inc()
 
+        if self.reaper is not None:
+            self.reaper.touch(game_id, game.version, game.is_open)
+
+        if self.log is not None:
+            self.log.append({"type": game_log.CREATE, "game_id": game_id, "version": 0, "uid": game.uid,
+                             "created_at": game.created_at, "player_name": game.player.name,
+                             "faction": game.player.faction.value})
+            if not game.is_open:
+                self.log.append({"type": game_log.JOIN, "game_id": game_id, "version": game.version,
+                                 "player_name": game.opponent.name})
+
+    @staticmethod
+    def check_player_name(player_name: str):
+        """ Keeps players from passing as the bot. """
+        if player_name == BOT_NAME:
+            raise HTTPException(status_code=400, detail=f"{BOT_NAME} is reserved for the computer opponent")
+
+    def create_game(self, request: CreateGameRequest):
+        """ Creates a new game with one player, or with the player and the bot when ``against_bot`` is set. """
+        self.check_player_name(request.player_name)
         player_info = PlayerInfo(player_name=request.player_name, faction=Factions[request.faction.upper()])
-        self.games[request.game_id] = GameStateManager(player_info)
+        if not request.against_bot:
+            self._add_game(request.game_id, GameStateManager(player_info))
+            return {"message": "Game created", "game_id": request.game_id}
 
-        return {"message": "Game created", "game_id": request.game_id}
+        if self.bots is None:
+            raise HTTPException(status_code=400, detail="Bot opponents are turned off")
+        self.create_match(request.game_id, player_info, BOT_NAME)
+        self.bots.schedule(request.game_id)
+        return {"message": f"Game created against {BOT_NAME}", "game_id": request.game_id}
 
-    def list_available_games(self):
-        return [game_id for game_id in self.games.keys() if self.games[game_id].opponent.name == "Opponent"]
+    def create_match(self, game_id: str, player_info: PlayerInfo, opponent_name: str):
+        """ Creates a game with both players seated, so it never shows up in the lobby. """
+        game = GameStateManager(player_info)
+        game.add_opponent(opponent_name)
+        self._add_game(game_id, game)
 
-    def join_game(self, request: JoinGameRequest):
-        """ Allows an opponent to join an existing game. """
-        if request.game_id not in self.games:
-            raise HTTPException(status_code=404, detail="Game not found")
+    def list_available_games(self, faction: Optional[Factions] = None, created_after: Optional[float] = None,
+                             cursor: Optional[str] = None, limit: int = 50):
+        """ A page of games waiting for an opponent, oldest first; pass ``next_cursor`` back for the next one. """
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
 
-        game = self.games[request.game_id]
+        games, last_key = self.store.open_games(faction, created_after, after, limit)
+        return {
+            "games": [game.listing() for game in games],
+            "next_cursor": encode_cursor(last_key) if last_key else None,
+        }
 
-        # Ensure only one opponent joins
-        if game.opponent.name != "Opponent":
-            raise HTTPException(status_code=400, detail="Game is already full")
+    def join_game(self, request: JoinGameRequest):
+        """ Allows an opponent to join an existing game. """
+        self.check_player_name(request.player_name)
 
-        opposing_faction = Factions.get_opposing_faction(game.player.faction)
-        game.opponent = PlayerState(player_name=request.player_name, faction=opposing_faction)
+        def join(game: GameStateManager):
+            # Ensure only one opponent joins
+            if not game.is_open:
+                raise HTTPException(status_code=400, detail="Game is already full")
+            return game.add_opponent(request.player_name)
 
-        return {"message": f"{request.player_name} joined", "faction": opposing_faction.value}
+        entry = {"type": game_log.JOIN, "player_name": request.player_name}
+        message = self._update_game(request.game_id, join, entry, lambda message: self.events.publish(
+            request.game_id, game_events.PLAYER_JOINED, player_name=request.player_name, faction=message["faction"]
+        ))
+        return {"message": message["message"], "faction": message["faction"].value}
 
     def submit_move(self, request: SubmitMoveRequest):
         """ Submits a move for a player and resolves the turn. """
-        if request.game_id not in self.games:
-            raise HTTPException(status_code=404, detail="Game not found")
-
-        game = self.games[request.game_id]
-        message = game.submit_move(request.faction, request.move_index)
-        self._end_game(message, request.game_id)
-        return message
+        return self._update_game(
+            request.game_id,
+            lambda game: game.submit_move(request.faction, request.move_index),
+            {"type": game_log.MOVE, "faction": request.faction.value, "move_index": request.move_index},
+            lambda message: self._publish(request.game_id, request.faction, message, game_events.OPPONENT_MOVED)
+        )
 
     def submit_lost_decision(self, request: SubmitLostRequest):
         """ Submits a decision when in lost state"""
-        if request.game_id not in self.games:
-            raise HTTPException(status_code=404, detail="Game not found")
+        return self._update_game(
+            request.game_id,
+            lambda game: game.submit_lost_state_decision(request.faction, request.decision),
+            {"type": game_log.DECISION, "faction": request.faction.value, "decision": request.decision.value},
+            lambda message: self._publish(request.game_id, request.faction, message, game_events.LOST_DECISION)
+        )
 
-        game = self.games[request.game_id]
-        message = game.submit_lost_state_decision(request.faction, request.decision)
-        self._end_game(message, request.game_id)
-        return message
+    def _publish(self, game_id: str, faction: Factions, message: dict, received_event: str):
+        """ Pushes the state change behind a submission's reply, if it made one, to the game's subscribers. """
+        if message["message"] in (MOVE_RECEIVED, DECISION_RECEIVED):
+            self.events.publish(game_id, received_event, faction=faction)
+            if "tailed_direction" in message:
+                self.events.publish(game_id, game_events.TAILED_DIRECTION, faction=faction,
+                                    direction=message["tailed_direction"])
+        elif message.get("new_page") == 223:
+            self.events.publish(game_id, game_events.LOST_STATE, faction=faction, message=message["message"])
+        elif "new_page" in message:
+            self.events.publish(game_id, game_events.TURN_RESOLVED, faction=faction, new_page=message["new_page"],
+                                message=message["message"])
 
-    def _end_game(self, message: dict, game_id: str):
         if message.get("game_end"):
-            self.games.pop(game_id)
+            self.events.publish(game_id, game_events.GAME_END, faction=faction, message=message["message"])
 
     def get_current_page(self, game_id):
-        if game_id not in self.games:
-            raise HTTPException(status_code=404, detail="Game not found")
-
-        player_page_num = self.games[game_id].current_player_page.page_num
-        opponent_page_num = self.games[game_id].current_opponent_page.page_num
+        with self.store.read(game_id) as game:
+            player_page_num = game.current_player_page.page_num
+            opponent_page_num = game.current_opponent_page.page_num
 
         if player_page_num != opponent_page_num:
             raise HTTPException(status_code=500, detail="Mismatched pages")
@@ -75,16 +267,19 @@ class GameManager:
         return player_page_num
 
     def get_player_status(self, game_id, player_name):
-        if game_id not in self.games:
-            raise HTTPException(status_code=404, detail="Game not found")
+        with self.store.read(game_id) as game:
+            player_status = game.player
+            opponent_status = game.opponent
 
-        player_status = self.games[game_id].player
-        opponent_status = self.games[game_id].opponent
+            if player_status.name == player_name:
+                return repr(player_status)
 
-        if player_status.name == player_name:
-            return repr(player_status)
-
-        if opponent_status.name == player_name:
-            return repr(opponent_status)
+            if opponent_status.name == player_name:
+                return repr(opponent_status)
 
         raise HTTPException(status_code=404, detail="Player is not in the game")
+
+    def get_snapshot(self, game_id: str) -> Tuple[str, bytes]:
+        """ ETag and serialized snapshot of the game, shared by every poller of the same version. """
+        with self.store.read(game_id) as game:
+            return game.snapshot()
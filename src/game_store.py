@@ -0,0 +1,310 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from src.entities.entities import Factions
+from src.open_games import LobbyKey, OpenGame, OpenGameIndex
+from src.page_table import LOST_PAGE
+from src.state_manager import GameStateManager
+
+
+def _not_found():
+    return HTTPException(status_code=404, detail="Game not found")
+
+
+def _open_game(game_id: str, game: GameStateManager) -> OpenGame:
+    return OpenGame(game_id, game.player.faction, game.player.name, game.created_at)
+
+
+class GameStore(ABC):
+    """
+    Where live games are kept. ``checkout`` hands out a game to mutate and ``save``/``delete``
+    commit it only if nobody else committed a newer version in the meantime.
+    """
+
+    @abstractmethod
+    def __contains__(self, game_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def create(self, game_id: str, game: GameStateManager) -> bool:
+        """ Adds a new game. Returns False if the id is taken. """
+
+    @abstractmethod
+    @contextmanager
+    def checkout(self, game_id: str) -> Iterator[GameStateManager]:
+        """ Yields the game for an update, raising a 404 if it does not exist. """
+
+    @abstractmethod
+    @contextmanager
+    def read(self, game_id: str) -> Iterator[GameStateManager]:
+        """ Yields the game for reading only; it must not be mutated. """
+
+    @abstractmethod
+    def save(self, game_id: str, game: GameStateManager, expected_version: int) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, game_id: str, expected_version: int) -> bool:
+        ...
+
+    @abstractmethod
+    def open_games(self, faction: Optional[Factions] = None, created_after: Optional[float] = None,
+                   after: Optional[LobbyKey] = None, limit: int = 50) -> Tuple[List[OpenGame], Optional[LobbyKey]]:
+        """ A page of games waiting for an opponent, oldest first, and the key to continue after. """
+
+    @abstractmethod
+    def states(self) -> Iterator[Tuple[str, dict]]:
+        """ Yields ``(game_id, to_state())`` of every live game, each consistent on its own. """
+
+    @abstractmethod
+    def summaries(self) -> Iterator[Tuple[str, int, bool]]:
+        """ Yields ``(game_id, version, is_open)`` of every live game. """
+
+    @abstractmethod
+    def counts(self) -> Tuple[int, int, int]:
+        """ Numbers of live games, of open ones, and of ones in the lost state. Meant for metrics, not requests. """
+
+
+class InMemoryGameStore(GameStore):
+    """ Games live in this process and are mutated in place under their own lock. """
+
+    def __init__(self):
+        self.games: Dict[str, GameStateManager] = {}
+        # Guards membership of self.games only; each game's state is guarded by its own lock.
+        # Never take a game lock while holding this one.
+        self._registry_lock = threading.Lock()
+        self.open_games_index = OpenGameIndex()
+
+    def __contains__(self, game_id: str) -> bool:
+        return game_id in self.games
+
+    def create(self, game_id: str, game: GameStateManager) -> bool:
+        with self._registry_lock:
+            if game_id in self.games:
+                return False
+            self.games[game_id] = game
+            if game.is_open:
+                self.open_games_index.add(_open_game(game_id, game))
+        return True
+
+    @contextmanager
+    def checkout(self, game_id: str) -> Iterator[GameStateManager]:
+        """ Holds only this game's lock, so turns of unrelated games never wait on each other. """
+        game = self.games.get(game_id)
+        if game is None:
+            raise _not_found()
+
+        with game.lock:
+            # The game may have ended while we waited for its lock
+            if self.games.get(game_id) is not game:
+                raise _not_found()
+            yield game
+
+    read = checkout
+
+    def save(self, game_id: str, game: GameStateManager, expected_version: int) -> bool:
+        # The game was changed in place while its lock was held
+        if not game.is_open:
+            self.open_games_index.remove(game_id)
+        return self.games.get(game_id) is game
+
+    def delete(self, game_id: str, expected_version: int) -> bool:
+        with self._registry_lock:
+            self.games.pop(game_id, None)
+            self.open_games_index.remove(game_id)
+        return True
+
+    def open_games(self, faction: Optional[Factions] = None, created_after: Optional[float] = None,
+                   after: Optional[LobbyKey] = None, limit: int = 50) -> Tuple[List[OpenGame], Optional[LobbyKey]]:
+        return self.open_games_index.page(faction, created_after, after, limit)
+
+    def states(self) -> Iterator[Tuple[str, dict]]:
+        with self._registry_lock:
+            games = list(self.games.items())
+        for game_id, game in games:
+            with game.lock:
+                if self.games.get(game_id) is game:
+                    yield game_id, game.to_state()
+
+    def summaries(self) -> Iterator[Tuple[str, int, bool]]:
+        with self._registry_lock:
+            games = list(self.games.items())
+        for game_id, game in games:
+            yield game_id, game.version, game.is_open
+
+    def counts(self) -> Tuple[int, int, int]:
+        with self._registry_lock:
+            games = list(self.games.values())
+        # An unlocked read: a game mid-turn may be counted on either side of it
+        lost = sum(1 for game in games if game.current_player_page.page_num == LOST_PAGE)
+        return len(games), len(self.open_games_index), lost
+
+
+class SqliteGameStore(GameStore):
+    """
+    Games live in a SQLite file shared by every worker process on the box. Each game is one row
+    of compact JSON; writes are compare-and-swap on the row's version.
+    """
+    read_cache_size = 10000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # Read-only copies by game id, reused while the stored game (its uid) and version are unchanged
+        self._read_cache: "OrderedDict[str, Tuple[int, int, GameStateManager]]" = OrderedDict()
+        self._read_cache_lock = threading.Lock()
+
+        self._connection().executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS games (
+                game_id TEXT PRIMARY KEY,
+                uid INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                is_open INTEGER NOT NULL,
+                faction TEXT NOT NULL,
+                player_name TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                state TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS open_games ON games (created_at, game_id) WHERE is_open = 1;
+            CREATE INDEX IF NOT EXISTS open_games_by_faction ON games (faction, created_at, game_id) WHERE is_open = 1;
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _serialize(game: GameStateManager) -> str:
+        return json.dumps(game.to_state(), separators=(",", ":"))
+
+    def __contains__(self, game_id: str) -> bool:
+        row = self._connection().execute("SELECT 1 FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        return row is not None
+
+    def create(self, game_id: str, game: GameStateManager) -> bool:
+        cursor = self._connection().execute(
+            "INSERT OR IGNORE INTO games (game_id, uid, version, is_open, faction, player_name, created_at, state) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (game_id, game.uid, game.version, game.is_open, game.player.faction.value, game.player.name,
+             game.created_at, self._serialize(game))
+        )
+        return cursor.rowcount == 1
+
+    def _load(self, game_id: str) -> GameStateManager:
+        row = self._connection().execute("SELECT state FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            raise _not_found()
+        return GameStateManager.from_state(json.loads(row[0]))
+
+    @contextmanager
+    def checkout(self, game_id: str) -> Iterator[GameStateManager]:
+        yield self._load(game_id)
+
+    @contextmanager
+    def read(self, game_id: str) -> Iterator[GameStateManager]:
+        """
+        Shares one copy, and so one cached snapshot, per stored version across this process. A game id
+        another worker ended and reused has a new uid, so its versions never match the old game's.
+        """
+        row = self._connection().execute("SELECT uid, version FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            raise _not_found()
+
+        with self._read_cache_lock:
+            cached = self._read_cache.get(game_id)
+            if cached is not None and cached[:2] == row:
+                self._read_cache.move_to_end(game_id)
+                game = cached[2]
+            else:
+                game = None
+
+        if game is None:
+            game = self._load(game_id)
+            with self._read_cache_lock:
+                self._read_cache[game_id] = (game.uid, game.version, game)
+                if len(self._read_cache) > self.read_cache_size:
+                    self._read_cache.popitem(last=False)
+
+        yield game
+
+    def save(self, game_id: str, game: GameStateManager, expected_version: int) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE games SET version = ?, is_open = ?, state = ? WHERE game_id = ? AND version = ?",
+            (game.version, game.is_open, self._serialize(game), game_id, expected_version)
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, game_id: str, expected_version: int) -> bool:
+        cursor = self._connection().execute(
+            "DELETE FROM games WHERE game_id = ? AND version = ?", (game_id, expected_version)
+        )
+        with self._read_cache_lock:
+            self._read_cache.pop(game_id, None)
+        return cursor.rowcount == 1
+
+    def open_games(self, faction: Optional[Factions] = None, created_after: Optional[float] = None,
+                   after: Optional[LobbyKey] = None, limit: int = 50) -> Tuple[List[OpenGame], Optional[LobbyKey]]:
+        """ One range scan of a partial index holding only the open games. """
+        conditions, params = ["is_open = 1"], []
+        if faction is not None:
+            conditions.append("faction = ?")
+            params.append(faction.value)
+        if created_after is not None:
+            conditions.append("created_at >= ?")
+            params.append(created_after)
+        if after is not None:
+            conditions.append("(created_at, game_id) > (?, ?)")
+            params.extend(after)
+
+        rows = self._connection().execute(
+            f"SELECT game_id, faction, player_name, created_at FROM games WHERE {' AND '.join(conditions)} "
+            "ORDER BY created_at, game_id LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+        games = [OpenGame(game_id, Factions(faction), player_name, created_at)
+                 for game_id, faction, player_name, created_at in rows]
+
+        if len(games) > limit:
+            return games[:limit], games[limit - 1].key
+        return games, None
+
+    def states(self) -> Iterator[Tuple[str, dict]]:
+        for game_id, state in self._connection().execute("SELECT game_id, state FROM games"):
+            yield game_id, json.loads(state)
+
+    def summaries(self) -> Iterator[Tuple[str, int, bool]]:
+        for game_id, version, is_open in self._connection().execute("SELECT game_id, version, is_open FROM games"):
+            yield game_id, version, bool(is_open)
+
+    def counts(self) -> Tuple[int, int, int]:
+        live, lobby, lost = self._connection().execute(
+            "SELECT COUNT(*), TOTAL(is_open), TOTAL(json_extract(state, '$.pages[0]') = ?) FROM games", (LOST_PAGE,)
+        ).fetchone()
+        return live, int(lobby), int(lost)
+
+
+def store_from_env() -> GameStore:
+    """ Picks the backend from AOA_STATE_BACKEND ("memory" or "sqlite") and AOA_SQLITE_PATH. """
+    backend = os.environ.get("AOA_STATE_BACKEND", "memory")
+    if backend == "memory":
+        return InMemoryGameStore()
+    if backend == "sqlite":
+        return SqliteGameStore(os.environ.get("AOA_SQLITE_PATH", "games.sqlite3"))
+    raise ValueError(f"Unknown AOA_STATE_BACKEND {backend!r}")
+
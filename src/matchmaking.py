@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+import random
+import threading
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Set
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from src.entities.entities import Factions, PlayerInfo
+
+
+class Ticket:
+    """ A player waiting to be paired. ``on_match`` is called once with the match, from whichever thread made it. """
+    __slots__ = ("ticket_id", "player_name", "preference", "sequence", "on_match", "match", "queued", "cancelled")
+
+    def __init__(self, player_name: str, preference: Optional[Factions], sequence: int,
+                 on_match: Callable[[dict], None]):
+        self.ticket_id = uuid.uuid4().hex
+        self.player_name = player_name
+        self.preference = preference
+        self.sequence = sequence
+        self.on_match = on_match
+        self.match: Optional[dict] = None
+        self.queued = False
+        self.cancelled = False
+
+
+class Matchmaker:
+    """
+    Pairs players into new games as they arrive.
+
+    Waiting tickets sit in one FIFO queue per faction preference, plus one for players who will fly
+    either side. A newcomer is paired with the oldest compatible ticket at the head of at most three
+    queues, so enqueueing is O(1) however many players wait. Cancelled tickets stay queued and are
+    dropped when they reach the head. A player can only wait once at a time, so nobody is paired
+    with themselves.
+    """
+
+    # A ticket paired just as its wait ran out gets this much longer for the game to be created
+    settle_seconds = 5.0
+
+    def __init__(self, create_match: Callable[[str, PlayerInfo, str], None], max_waiting: int = 100000):
+        self.create_match = create_match
+        self.max_waiting = max_waiting
+        self._lock = threading.Lock()
+        self._queues: Dict[Optional[Factions], Deque[Ticket]] = {None: deque(), **{f: deque() for f in Factions}}
+        self._sequence = itertools.count()
+        # Names of the players with a live ticket in a queue
+        self._waiting_names: Set[str] = set()
+        self.waiting = 0
+        self.matches = 0
+        self.timeouts = 0
+
+    def _compatible_queues(self, preference: Optional[Factions]):
+        if preference is None:
+            return list(self._queues.values())
+        return [self._queues[Factions.get_opposing_faction(preference)], self._queues[None]]
+
+    def _pop_partner(self, preference: Optional[Factions]) -> Optional[Ticket]:
+        """ Oldest live ticket that can fly against ``preference``. Callers hold the lock. """
+        heads = []
+        for queue in self._compatible_queues(preference):
+            while queue and queue[0].cancelled:
+                queue.popleft()
+            if queue:
+                heads.append(queue)
+
+        if not heads:
+            return None
+        partner = min(heads, key=lambda queue: queue[0].sequence).popleft()
+        partner.queued = False
+        self._waiting_names.discard(partner.player_name)
+        self.waiting -= 1
+        return partner
+
+    def _queue(self, ticket: Ticket, front: bool = False):
+        """ Callers hold the lock. """
+        queue = self._queues[ticket.preference]
+        if front:
+            queue.appendleft(ticket)
+        else:
+            queue.append(ticket)
+        ticket.queued = True
+        self._waiting_names.add(ticket.player_name)
+        self.waiting += 1
+
+    def enqueue(self, player_name: str, preference: Optional[Factions], on_match: Callable[[dict], None]) -> Ticket:
+        """ Pairs the player right away if a compatible opponent is waiting, and queues them otherwise. """
+        with self._lock:
+            if player_name in self._waiting_names:
+                raise HTTPException(status_code=409, detail=f"{player_name} is already waiting for a match")
+            ticket = Ticket(player_name, preference, next(self._sequence), on_match)
+            partner = self._pop_partner(preference)
+            if partner is None:
+                if self.waiting >= self.max_waiting:
+                    raise HTTPException(status_code=503, detail="Matchmaking queue is full, try again later")
+                self._queue(ticket)
+                return ticket
+            self.matches += 1
+
+        # The older ticket keeps its preference and creates the game
+        partner_faction = partner.preference or (
+            Factions.get_opposing_faction(preference) if preference else random.choice(list(Factions))
+        )
+        game_id = f"match-{uuid.uuid4().hex[:12]}"
+        try:
+            self.create_match(game_id, PlayerInfo(player_name=partner.player_name, faction=partner_faction),
+                              player_name)
+        except Exception:
+            with self._lock:
+                # Nobody else saw the partner leave the queue, so put them back at its front
+                self._queue(partner, front=True)
+                self.matches -= 1
+            raise
+
+        opponent_faction = Factions.get_opposing_faction(partner_faction)
+        self._settle(partner, {"game_id": game_id, "faction": partner_faction.value, "opponent": player_name})
+        self._settle(ticket, {"game_id": game_id, "faction": opponent_faction.value, "opponent": partner.player_name})
+        return ticket
+
+    @staticmethod
+    def _settle(ticket: Ticket, match: dict):
+        ticket.match = match
+        ticket.on_match(match)
+
+    def cancel(self, ticket: Ticket) -> bool:
+        """ Withdraws a waiting ticket. Returns False if it was already paired, or on its way to be. """
+        with self._lock:
+            if not ticket.queued:
+                return False
+            ticket.queued = False
+            ticket.cancelled = True
+            self._waiting_names.discard(ticket.player_name)
+            self.waiting -= 1
+            self.timeouts += 1
+            return True
+
+    async def find_match(self, player_name: str, preference: Optional[Factions], wait_seconds: float) -> dict:
+        """ Queues the player and waits up to ``wait_seconds`` for an opponent, without holding a worker thread. """
+        loop = asyncio.get_running_loop()
+        matched = loop.create_future()
+
+        def on_match(match: dict):
+            loop.call_soon_threadsafe(lambda: matched.done() or matched.set_result(match))
+
+        # Pairing may create the game in a slow store
+        ticket = await run_in_threadpool(self.enqueue, player_name, preference, on_match)
+        try:
+            match = await asyncio.wait_for(asyncio.shield(matched), wait_seconds)
+        except asyncio.TimeoutError:
+            if self.cancel(ticket):
+                return {"status": "timeout", "ticket_id": ticket.ticket_id}
+            match = await asyncio.wait_for(matched, self.settle_seconds)
+        except asyncio.CancelledError:
+            self.cancel(ticket)
+            raise
+
+        return {"status": "matched", "ticket_id": ticket.ticket_id, **match}
@@ -0,0 +1,263 @@
+""" Counters, gauges and histograms in the Prometheus text format, served on ``/metrics``. """
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Seconds; a turn resolves in microseconds, a slow store or a busy thread pool takes milliseconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Labels) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One count per bound, plus the +Inf bucket; kept per bucket and summed when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric:
+    """
+    One metric family. Children are created per distinct label values on first use and kept;
+    recording takes one uncontended lock. A metric given ``function`` instead reads its value when
+    scraped: a number, or a dict of label values to numbers.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 function: Optional[Callable[[], object]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._children: Dict[Labels, object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _values(self) -> Iterator[Tuple[Labels, float]]:
+        if self.function is None:
+            for values, child in list(self._children.items()):
+                yield values, child.value
+            return
+
+        value = self.function()
+        if isinstance(value, dict):
+            for values, each in value.items():
+                yield (values if isinstance(values, tuple) else (values,)), each
+        else:
+            yield (), value
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """ (metric name, formatted labels, value) of every sample. """
+        for values, value in self._values():
+            yield self.name, _format_labels(self.labelnames, values), value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples()]
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        names = self.labelnames + ("le",)
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(names, values + (_format_value(bound),)), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, values), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, values), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """ Adds the metric, replacing any registered under its name. """
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "aoa_http_requests_total", "HTTP requests answered, by route, method and status.", ("route", "method", "status")
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "aoa_http_request_duration_seconds", "Time from receiving a request to starting its response, by route.",
+    ("route", "method")
+))
+TURN_SECONDS = REGISTRY.register(Histogram(
+    "aoa_turn_resolution_seconds", "Time to resolve and store a turn or lost-state decision, lock waits included."
+))
+GAMES_CREATED = REGISTRY.register(Counter("aoa_games_created_total", "Games created, matchmade ones included."))
+GAMES_ENDED = REGISTRY.register(Counter(
+    "aoa_games_ended_total", "Games that ended, by reason: finished, or the reaper's unjoined or idle.", ("reason",)
+))
+
+
+def _route(scope) -> str:
+    # Set by the router once a route matched
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request to the start of its response, so event streams count only their setup,
+    and counts responses by status. Requests are labelled with their route's path template, which
+    keeps the number of series bounded; paths no route matched share the label "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = "500"
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                HTTP_LATENCY.labels(_route(scope), scope["method"]).observe(time.perf_counter() - start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            HTTP_REQUESTS.labels(_route(scope), scope["method"], status).inc()
+
+
+def watch_service(service, registry: Registry = REGISTRY):
+    """ Registers gauges and counters read from the game service's state each time metrics are scraped. """
+    def game_counts():
+        live, lobby, lost = service.store.counts()
+        return {"playing": live - lobby, "lobby": lobby, "lost": lost}
+
+    registry.register(Gauge(
+        "aoa_games", "Live games by state: waiting in the lobby, being played, or lost (page 223, also playing).",
+        ("state",), function=game_counts
+    ))
+    matchmaker = service.matchmaker
+    registry.register(Gauge("aoa_matchmaking_waiting", "Players waiting for a match.",
+                            function=lambda: matchmaker.waiting))
+    registry.register(Counter("aoa_matchmaking_matches_total", "Pairs of players matched into a game.",
+                              function=lambda: matchmaker.matches))
+    registry.register(Counter("aoa_matchmaking_timeouts_total", "Players whose wait for a match ran out.",
+                              function=lambda: matchmaker.timeouts))
+
+    if service.reaper is not None:
+        reaper = service.reaper
+        registry.register(Counter("aoa_reaper_evictions_total", "Games evicted by the reaper, by reason.",
+                                  ("reason",), function=lambda: dict(reaper.evictions)))
+        registry.register(Gauge("aoa_reaper_scheduled_games", "Games the reaper is tracking.",
+                                function=lambda: len(reaper)))
+
+    if service.bots is not None:
+        table = service.bots.search.table
+        registry.register(Counter("aoa_bot_table_lookups_total", "Bot transposition table lookups, by result.",
+                                  ("result",), function=lambda: {"hit": table.hits, "miss": table.misses}))
+        registry.register(Gauge("aoa_bot_table_states", "States in the bot's transposition table.",
+                                function=lambda: len(table)))
@@ -0,0 +1,118 @@
+import base64
+import heapq
+import json
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.entities.entities import Factions
+
+# Lobby pages are ordered by this key, oldest game first
+LobbyKey = Tuple[float, str]
+
+
+class OpenGame(NamedTuple):
+    game_id: str
+    faction: Factions
+    player_name: str
+    created_at: float
+
+    @property
+    def key(self) -> LobbyKey:
+        return self.created_at, self.game_id
+
+    def listing(self) -> dict:
+        return {"game_id": self.game_id, "faction": self.faction.value, "player_name": self.player_name,
+                "created_at": self.created_at}
+
+
+def encode_cursor(key: LobbyKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> LobbyKey:
+    """ Raises ValueError for anything ``encode_cursor`` did not produce. """
+    try:
+        created_at, game_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(game_id)
+    except (TypeError, ValueError) as error:
+        raise ValueError(f"Invalid cursor {cursor!r}") from error
+
+
+class OpenGameIndex:
+    """
+    Games waiting for an opponent, kept up to date as games are created, joined and ended.
+
+    Each creator faction has a list of keys sorted by ``(created_at, game_id)``, so a page is one
+    bisect plus a walk over the games it returns. Removal only forgets the game; its key is skipped
+    when walked over and the list is compacted once most of it is stale.
+    """
+    compact_after = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._games: Dict[str, OpenGame] = {}
+        self._keys: Dict[Factions, List[LobbyKey]] = {faction: [] for faction in Factions}
+        self._stale: Dict[Factions, int] = {faction: 0 for faction in Factions}
+
+    def __len__(self):
+        return len(self._games)
+
+    def __contains__(self, game_id: str) -> bool:
+        return game_id in self._games
+
+    def add(self, game: OpenGame):
+        with self._lock:
+            if game.game_id in self._games:
+                self._remove(game.game_id)
+            self._games[game.game_id] = game
+            # New games nearly always sort last, which makes this an append
+            insort(self._keys[game.faction], game.key)
+
+    def remove(self, game_id: str):
+        with self._lock:
+            self._remove(game_id)
+
+    def _remove(self, game_id: str):
+        game = self._games.pop(game_id, None)
+        if game is None:
+            return
+
+        keys = self._keys[game.faction]
+        self._stale[game.faction] += 1
+        if self._stale[game.faction] > max(self.compact_after, len(keys) // 2):
+            self._keys[game.faction] = [key for key in keys if self._is_live(key)]
+            self._stale[game.faction] = 0
+
+    def _is_live(self, key: LobbyKey) -> bool:
+        game = self._games.get(key[1])
+        return game is not None and game.created_at == key[0]
+
+    def _walk(self, faction: Factions, start: LobbyKey) -> Iterator[LobbyKey]:
+        keys = self._keys[faction]
+        for idx in range(bisect_left(keys, start), len(keys)):
+            if self._is_live(keys[idx]):
+                yield keys[idx]
+
+    def page(self, faction: Optional[Factions] = None, created_after: Optional[float] = None,
+             after: Optional[LobbyKey] = None, limit: int = 50) -> Tuple[List[OpenGame], Optional[LobbyKey]]:
+        """
+        Up to ``limit`` open games created at or after ``created_after`` and sorting after the ``after``
+        key, and the key to continue from if there are more.
+        """
+        start: LobbyKey = (created_after if created_after is not None else float("-inf"), "")
+        if after is not None and after >= start:
+            # Keys are unique, so the smallest key past ``after`` is the one with a longer game id
+            start = (after[0], after[1] + "\0")
+
+        factions = [faction] if faction is not None else list(Factions)
+        with self._lock:
+            games: List[OpenGame] = []
+            for key in heapq.merge(*(self._walk(each, start) for each in factions)):
+                games.append(self._games[key[1]])
+                if len(games) > limit:
+                    break
+
+        if len(games) > limit:
+            return games[:limit], games[limit - 1].key
+        return games, None
@@ -0,0 +1,189 @@
+import logging
+import os
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+from src.artifacts import save_artifact, load_artifact
+from src.entities.entities import Factions, Distance, FireType, Page
+from src.page_manager import PageManager, get_page
+from src.page_table import (
+    get_page_table, books_digest, BUILD_DIR, FACTION_CODES, DISTANCE_CODES, FIRE_CODES, PAGE_COUNT, MOVE_COUNT,
+    LOST_PAGE
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the cell layout or the resolution rules change
+OUTCOME_TABLE_VERSION = 2
+OUTCOME_TABLE_PATH = os.path.join(BUILD_DIR, "outcomes.npy")
+
+# Result page 0 marks a move pair that leads outside the book (a transcription error in the source CSV)
+INVALID_PAGE = 0
+
+OUTCOME_DTYPE = np.dtype([
+    ("page", np.int16),
+    ("player_damage", np.float16),
+    ("opponent_damage", np.float16),
+    ("player_tail", np.bool_),
+    ("opponent_tail", np.bool_),
+])
+
+DAMAGE_BY_DISTANCE = np.array([Distance.get_damage(distance) for distance in DISTANCE_CODES], dtype=np.float16)
+_MUTUAL, _IN, _OUT = (FIRE_CODES.index(fire) for fire in (FireType.MUTUAL, FireType.IN, FireType.OUT))
+
+
+def _in_book(page_nums: np.ndarray) -> np.ndarray:
+    return (page_nums >= 1) & (page_nums <= PAGE_COUNT)
+
+
+def compute_outcomes(player_faction: Factions) -> np.ndarray:
+    """
+    Resolves every (page, player move, opponent move) triple for a game created by ``player_faction``.
+
+    The books disagree on some cross lookups, so the creator's book is the one that resolves the
+    turn, exactly as GameStateManager does. Cells are indexed ``[page_num - 1, player_move, opponent_move]``.
+    """
+    player_table = get_page_table(player_faction)
+    opponent_table = get_page_table(Factions.get_opposing_faction(player_faction))
+
+    player_moves = np.arange(MOVE_COUNT)[None, :, None]
+    opponent_moves = np.arange(MOVE_COUNT)[None, None, :]
+    player_mid = player_table.next_pages.astype(np.int32)[:, :, None]
+    opponent_mid = opponent_table.next_pages.astype(np.int32)[:, None, :]
+
+    # Only an opponent reaching page 223 alone is resolved in the opponent's book
+    use_opponent_book = (player_mid != LOST_PAGE) & (opponent_mid == LOST_PAGE)
+    by_player = player_table.next_pages[np.clip(opponent_mid, 1, PAGE_COUNT) - 1, player_moves]
+    by_opponent = opponent_table.next_pages[np.clip(player_mid, 1, PAGE_COUNT) - 1, opponent_moves]
+    result = np.where(use_opponent_book, by_opponent, by_player).astype(np.int32)
+
+    valid = np.where(use_opponent_book, _in_book(player_mid), _in_book(opponent_mid)) & _in_book(result)
+    result = np.where(valid, result, INVALID_PAGE)
+    row = np.clip(result, 1, PAGE_COUNT) - 1
+
+    player_fire = player_table.fire[row]
+    opponent_fire = opponent_table.fire[row]
+    damage = DAMAGE_BY_DISTANCE[player_table.distance[row]]
+    mutual = (player_fire == _MUTUAL) | (opponent_fire == _MUTUAL)
+    player_hit = (player_fire == _IN) | (opponent_fire == _OUT)
+    opponent_hit = (player_fire == _OUT) | (opponent_fire == _IN)
+    fought = valid & (result != LOST_PAGE)
+
+    outcomes = np.zeros(result.shape, dtype=OUTCOME_DTYPE)
+    outcomes["page"] = result
+    outcomes["player_damage"] = np.where(fought, damage * (mutual.astype(np.float16) + player_hit), 0)
+    outcomes["opponent_damage"] = np.where(fought, damage * (mutual.astype(np.float16) + opponent_hit), 0)
+    outcomes["player_tail"] = valid & player_table.tail[row]
+    outcomes["opponent_tail"] = valid & opponent_table.tail[row]
+    return outcomes
+
+
+def build_outcome_tables() -> np.ndarray:
+    """ Stacks both creators' tables, indexed ``[FACTION_CODES.index(creator), page_num - 1, ...]``. """
+    return np.stack([compute_outcomes(faction) for faction in FACTION_CODES])
+
+
+def save_outcome_tables(path: str = OUTCOME_TABLE_PATH) -> np.ndarray:
+    outcomes = build_outcome_tables()
+    save_artifact(path, outcomes, OUTCOME_TABLE_VERSION, books_digest())
+    return outcomes
+
+
+def load_outcome_tables(path: str = OUTCOME_TABLE_PATH) -> np.ndarray:
+    """ Memory-maps the build artifact, rebuilding in memory when it is missing or stale. """
+    outcomes = load_artifact(path, OUTCOME_TABLE_VERSION, books_digest())
+    if outcomes is None:
+        logger.warning("No usable outcome table at %s, rebuilding in memory", path)
+        outcomes = build_outcome_tables()
+
+    return outcomes
+
+
+@lru_cache(maxsize=None)
+def get_outcome_table(player_faction: Factions) -> np.ndarray:
+    """ Read-only outcome cells for games created by ``player_faction``, shared by the whole process. """
+    return get_outcome_tables()[FACTION_CODES.index(player_faction)]
+
+
+@lru_cache(maxsize=None)
+def get_outcome_tables() -> np.ndarray:
+    """ Both creators' tables, indexed ``[FACTION_CODES.index(creator), page_num - 1, player_move, opponent_move]``. """
+    outcomes = load_outcome_tables()
+    outcomes.flags.writeable = False
+    return outcomes
+
+
+def _reference_damage(player_page: Page, opponent_page: Page) -> Tuple[float, float]:
+    """ The damage rules as GameStateManager applied them page by page, kept as the verification oracle. """
+    damage = Distance.get_damage(player_page.distance)
+    player_damage = opponent_damage = 0.0
+
+    if player_page.fire == FireType.MUTUAL or opponent_page.fire == FireType.MUTUAL:
+        player_damage += damage
+        opponent_damage += damage
+
+    if player_page.fire == FireType.OUT or opponent_page.fire == FireType.IN:
+        opponent_damage += damage
+
+    if player_page.fire == FireType.IN or opponent_page.fire == FireType.OUT:
+        player_damage += damage
+
+    return player_damage, opponent_damage
+
+
+def _check(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+
+
+def verify_outcomes(outcomes: np.ndarray) -> int:
+    """
+    Cross-checks every cell against PageManager.find_result and the page-by-page damage and tailing
+    rules. Returns the number of cells checked, raising AssertionError on the first mismatch.
+    """
+    checked = 0
+    for faction_code, player_faction in enumerate(FACTION_CODES):
+        opponent_faction = Factions.get_opposing_faction(player_faction)
+        player_pages = PageManager(player_faction)
+        opponent_pages = PageManager(opponent_faction)
+
+        for page_num in range(1, PAGE_COUNT + 1):
+            for player_move in range(MOVE_COUNT):
+                for opponent_move in range(MOVE_COUNT):
+                    cell = outcomes[faction_code, page_num - 1, player_move, opponent_move]
+                    where = f"{player_faction.value} page {page_num} moves ({player_move}, {opponent_move})"
+                    player_mid = player_pages.find_result(page_num, player_move)
+                    opponent_mid = opponent_pages.find_result(page_num, opponent_move)
+
+                    try:
+                        if player_mid == LOST_PAGE:
+                            expected = player_pages.find_result(opponent_mid, player_move)
+                        elif opponent_mid == LOST_PAGE:
+                            expected = opponent_pages.find_result(player_mid, opponent_move)
+                        else:
+                            expected = player_pages.find_result(opponent_mid, player_move)
+                    except IndexError:
+                        expected = INVALID_PAGE
+                    if not 1 <= expected <= PAGE_COUNT:
+                        expected = INVALID_PAGE
+
+                    _check(cell["page"] == expected, f"{where}: page {cell['page']} != {expected}")
+                    checked += 1
+                    if expected == INVALID_PAGE:
+                        continue
+
+                    player_page = get_page(player_faction, expected)
+                    opponent_page = get_page(opponent_faction, expected)
+                    if expected == LOST_PAGE:
+                        player_damage = opponent_damage = 0.0
+                    else:
+                        player_damage, opponent_damage = _reference_damage(player_page, opponent_page)
+
+                    _check(float(cell["player_damage"]) == player_damage, f"{where}: player damage")
+                    _check(float(cell["opponent_damage"]) == opponent_damage, f"{where}: opponent damage")
+                    _check(bool(cell["player_tail"]) == player_page.tail, f"{where}: player tail")
+                    _check(bool(cell["opponent_tail"]) == opponent_page.tail, f"{where}: opponent tail")
+
+    return checked
@@ -0,0 +1,155 @@
+""" Resized, recompressed variants of the page images, built once by ``python -m src.build build-page-images``. """
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from src.entities.entities import Factions
+from src.page_table import BUILD_DIR, DATA_DIR, PAGE_COUNT
+
+PAGE_IMAGES_DIR = os.path.join(DATA_DIR, "page_images")
+PAGE_IMAGE_PATH = os.path.join(PAGE_IMAGES_DIR, "{faction}", "{faction}_{page_num}.jpg")
+VARIANTS_DIR = os.path.join(BUILD_DIR, "page_images")
+MANIFEST_PATH = os.path.join(VARIANTS_DIR, "manifest.json")
+PAGE_IMAGES_VERSION = 1
+
+# The books are scanned at about 720px wide; the game shows them at most that large
+VARIANT_WIDTHS = (320, 480, 720)
+# Pillow format name by file extension
+VARIANT_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+# What ``variant_name`` produces, and so all a build may delete from its output directory
+VARIANT_NAME = re.compile(rf"[0-9a-f]{{16}}-[0-9]+\.(?:{'|'.join(VARIANT_FORMATS)})")
+
+
+def _content_hash(path: str) -> str:
+    with open(path, "rb") as image_file:
+        return hashlib.sha256(image_file.read()).hexdigest()[:16]
+
+
+@lru_cache(maxsize=2048)
+def _cached_content_hash(path: str, mtime_ns: int) -> str:
+    """ Keyed on the modification time too, so a replaced scan is hashed again. """
+    return _content_hash(path)
+
+
+def variant_name(content_hash: str, width: int, extension: str) -> str:
+    return f"{content_hash}-{width}.{extension}"
+
+
+def _build_variants(source: str, output_dir: str, widths: Tuple[int, ...], quality: int) -> dict:
+    """ Writes the variants of one image that are not on disk yet. Returns its manifest entry. """
+    from PIL import Image
+
+    content_hash = _content_hash(source)
+    with Image.open(source) as image:
+        size = image.size
+
+    for width in sorted({min(width, size[0]) for width in widths}):
+        missing = [
+            extension for extension in VARIANT_FORMATS
+            if not os.path.exists(os.path.join(output_dir, variant_name(content_hash, width, extension)))
+        ]
+        if not missing:
+            continue
+
+        height = round(size[1] * width / size[0])
+        with Image.open(source) as image:
+            # Lets the JPEG decoder skip detail the target size cannot show
+            image.draft("RGB", (width, height))
+            resized = image.convert("RGB").resize((width, height), Image.LANCZOS)
+
+        for extension in missing:
+            path = os.path.join(output_dir, variant_name(content_hash, width, extension))
+            resized.save(path + ".tmp", VARIANT_FORMATS[extension], quality=quality, method=6, optimize=True)
+            os.replace(path + ".tmp", path)
+
+    return {"hash": content_hash, "width": size[0], "height": size[1]}
+
+
+def page_image_sources() -> Iterable[Tuple[str, str]]:
+    for faction in Factions:
+        for page_num in range(1, PAGE_COUNT + 1):
+            path = PAGE_IMAGE_PATH.format(faction=faction.value, page_num=page_num)
+            if os.path.exists(path):
+                yield f"{faction.value}/{page_num}", path
+
+
+def build_page_images(widths: Tuple[int, ...] = VARIANT_WIDTHS, quality: int = 80,
+                      workers: Optional[int] = None) -> dict:
+    """
+    Builds every variant missing from VARIANTS_DIR, where the server and the asset pack read them, and
+    writes the manifest. Variants are named by the content hash of their source, so unchanged images are
+    never re-encoded.
+    """
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    keys, sources = zip(*page_image_sources())
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        entries = pool.map(_build_variants, sources, [VARIANTS_DIR] * len(sources), [widths] * len(sources),
+                           [quality] * len(sources), chunksize=8)
+        images = dict(zip(keys, entries))
+
+    manifest = {"version": PAGE_IMAGES_VERSION, "widths": sorted(widths), "formats": list(VARIANT_FORMATS),
+                "images": images}
+    with open(MANIFEST_PATH, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    # Variants of images that have since changed; anything else in the directory is left alone
+    wanted = {
+        variant_name(entry["hash"], min(width, entry["width"]), extension)
+        for entry in images.values() for width in widths for extension in VARIANT_FORMATS
+    }
+    for name in os.listdir(VARIANTS_DIR):
+        if VARIANT_NAME.fullmatch(name) and name not in wanted:
+            os.remove(os.path.join(VARIANTS_DIR, name))
+
+    return manifest
+
+
+@lru_cache(maxsize=None)
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[dict]:
+    """ The build manifest, or None if the variants were not built. """
+    if not os.path.exists(path):
+        return None
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    return manifest if manifest.get("version") == PAGE_IMAGES_VERSION else None
+
+
+def page_image(faction: Factions, page_num: int, width: Optional[int] = None,
+               extension: str = "webp") -> Optional[Tuple[str, str]]:
+    """
+    Path and content hash of the smallest variant at least ``width`` pixels wide, or of the largest
+    one. Falls back to the original scan when no variants were built. None if there is no such page.
+    """
+    manifest = load_manifest()
+    key = f"{faction.value}/{page_num}"
+    if manifest is None or key not in manifest["images"]:
+        path = PAGE_IMAGE_PATH.format(faction=faction.value, page_num=page_num)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        return path, _cached_content_hash(path, mtime_ns)
+
+    entry = manifest["images"][key]
+    widths = sorted({min(each, entry["width"]) for each in manifest["widths"]})
+    chosen = next((each for each in widths if width is not None and each >= width), widths[-1])
+    name = variant_name(entry["hash"], chosen, extension)
+    return os.path.join(VARIANTS_DIR, name), f"{entry['hash']}-{chosen}"
+
+
+def variant_sizes(manifest: dict) -> Dict[str, int]:
+    """ Total bytes per variant width and format, for the build report. """
+    totals: Dict[str, int] = {}
+    for entry in manifest["images"].values():
+        for width in manifest["widths"]:
+            for extension in manifest["formats"]:
+                width_used = min(width, entry["width"])
+                path = os.path.join(VARIANTS_DIR, variant_name(entry["hash"], width_used, extension))
+                label = f"{width}px {extension}"
+                totals[label] = totals.get(label, 0) + os.path.getsize(path)
+    return totals
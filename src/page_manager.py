@@ -1,45 +1,62 @@
-from typing import List
+from functools import lru_cache
+from typing import Tuple
 
-import pandas as pd
-
-from src.entities.entities import Page, Factions, Movement, DetailedMovement
+from src.entities.entities import Page, Factions, Movement
 from src.entities.move_defaults import DEFAULT_MOVE_LIST
+from src.page_table import get_page_table, PAGE_COUNT, START_PAGE
 
 
-class PageManager:
+def build_page(faction: Factions, page_num: int) -> Page:
+    """ Builds a page from the shared book table. Prefer the memoized ``get_page``. """
+    page_table = get_page_table(faction)
+    next_pages = page_table.next_pages[page_num-1]
+
+    # The defaults are already validated, so copying them skips a second validation pass
+    moves = tuple(
+        default_move.model_copy(update={"next_page": int(next_pages[idx])})
+        for idx, default_move in enumerate(DEFAULT_MOVE_LIST)
+    )
+
+    return Page(
+        faction=faction,
+        page_num=page_num,
+        distance=page_table.page_distance(page_num),
+        tail=page_table.page_tail(page_num),
+        fire=page_table.page_fire(page_num),
+        moves=moves
+    )
 
-    def __init__(self, faction: Factions):
-        self.faction = faction
-        self.move_file_path = f"../data/aoa_{faction}.csv"
-        self.move_df = pd.read_csv(self.move_file_path)
 
-    @staticmethod
-    def load_moves(page_row) -> List[Movement]:
-        move_list = []
+@lru_cache(maxsize=None)
+def get_page(faction: Factions, page_num: int) -> Page:
+    """ Returns the shared, frozen page instance, building it on first touch. """
+    return build_page(faction, page_num)
 
-        for idx, default_move in enumerate(DEFAULT_MOVE_LIST):
-            move = DetailedMovement(
-                next_page=page_row[f'm_{idx}'],
-                **default_move.dict(exclude_none=True)
-            )
 
-            move_list.append(move)
+def warm_page_cache():
+    """ Builds every page of both books up front so no request pays for it. """
+    for faction in Factions:
+        for page_num in range(1, PAGE_COUNT + 1):
+            get_page(faction, page_num)
 
-        return move_list
 
-    def load_page(self, page_num: int = 170) -> Page:
-        page_row = self.move_df.iloc[page_num-1]
+class PageManager:
+
+    def __init__(self, faction: Factions):
+        self.faction = faction
+        self.page_table = get_page_table(faction)
+
+    def load_moves(self, page_num: int) -> Tuple[Movement, ...]:
+        return self.load_page(page_num).moves
 
-        return Page(
-            faction=self.faction,
-            page_num=page_num,
-            distance=page_row['distance'],
-            tail=page_row['tail'],
-            fire=page_row['fire'],
-            moves=self.load_moves(page_row)
-        )
+    def load_page(self, page_num: int = START_PAGE) -> Page:
+        return get_page(self.faction, page_num)
 
     def find_result(self, mid_page_num, movement_index) -> int:
-        mid_page_row = self.move_df.iloc[mid_page_num-1]
-        return int(mid_page_row[f'm_{movement_index}'])
+        return self.page_table.next_page(mid_page_num, movement_index)
+
 
+@lru_cache(maxsize=None)
+def get_page_manager(faction: Factions) -> PageManager:
+    """ Page managers hold no per-game state, so every player of a faction shares one. """
+    return PageManager(faction)
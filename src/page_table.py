@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from src.artifacts import save_artifact, load_artifact
+from src.entities.entities import Factions, Distance, FireType
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+BOOK_PATH = os.path.join(DATA_DIR, "aoa_{faction}.csv")
+BUILD_DIR = os.path.join(DATA_DIR, "build")
+COMPILED_BOOKS_PATH = os.path.join(BUILD_DIR, "books.npy")
+
+PAGE_COUNT = 223
+MOVE_COUNT = 26
+LOST_PAGE = 223
+START_PAGE = 170
+
+# Bump whenever BOOK_DTYPE or the column coding changes
+COMPILED_BOOKS_VERSION = 1
+
+# Column codes are positions in these tuples
+FACTION_CODES = tuple(Factions)
+DISTANCE_CODES = tuple(Distance)
+FIRE_CODES = tuple(FireType)
+
+# One record per page; the compiled file holds one row of records per faction, in FACTION_CODES order
+BOOK_DTYPE = np.dtype([
+    ("next_pages", np.int16, (MOVE_COUNT,)),
+    ("distance", np.int8),
+    ("tail", np.bool_),
+    ("fire", np.int8),
+])
+
+
+class PageTable:
+    """ Compact, read-only view of one faction's book. Row ``page_num - 1`` holds that page. """
+    __slots__ = ("faction", "next_pages", "distance", "tail", "fire")
+
+    def __init__(self, faction: Factions, next_pages: np.ndarray, distance: np.ndarray, tail: np.ndarray,
+                 fire: np.ndarray):
+        self.faction = faction
+        self.next_pages = next_pages
+        self.distance = distance
+        self.tail = tail
+        self.fire = fire
+
+        for column in (self.next_pages, self.distance, self.tail, self.fire):
+            column.flags.writeable = False
+
+    @classmethod
+    def from_csv(cls, faction: Factions) -> "PageTable":
+        """ Parses the source book. Needs pandas, so the server only does this without compiled books. """
+        import pandas as pd
+
+        move_df = pd.read_csv(BOOK_PATH.format(faction=faction.value))
+        distance_codes = {distance.value: code for code, distance in enumerate(DISTANCE_CODES)}
+        fire_codes = {fire.value: code for code, fire in enumerate(FIRE_CODES)}
+
+        return cls(
+            faction=faction,
+            next_pages=move_df[[f"m_{idx}" for idx in range(MOVE_COUNT)]].to_numpy(dtype=np.int16),
+            distance=move_df["distance"].map(distance_codes).to_numpy(dtype=np.int8),
+            tail=move_df["tail"].to_numpy(dtype=np.bool_),
+            fire=move_df["fire"].map(fire_codes).to_numpy(dtype=np.int8),
+        )
+
+    @classmethod
+    def from_records(cls, faction: Factions, records: np.ndarray) -> "PageTable":
+        return cls(
+            faction=faction,
+            next_pages=records["next_pages"],
+            distance=records["distance"],
+            tail=records["tail"],
+            fire=records["fire"],
+        )
+
+    def to_records(self) -> np.ndarray:
+        records = np.zeros(PAGE_COUNT, dtype=BOOK_DTYPE)
+        for field in BOOK_DTYPE.names:
+            records[field] = getattr(self, field)
+        return records
+
+    def next_page(self, page_num: int, move_index: int) -> int:
+        return int(self.next_pages[page_num - 1, move_index])
+
+    def page_distance(self, page_num: int) -> Distance:
+        return DISTANCE_CODES[self.distance[page_num - 1]]
+
+    def page_tail(self, page_num: int) -> bool:
+        return bool(self.tail[page_num - 1])
+
+    def page_fire(self, page_num: int) -> FireType:
+        return FIRE_CODES[self.fire[page_num - 1]]
+
+
+def books_digest() -> str:
+    """ SHA-256 over both source books, used to tell stale build artifacts apart. """
+    digest = hashlib.sha256()
+    for faction in FACTION_CODES:
+        with open(BOOK_PATH.format(faction=faction.value), "rb") as book:
+            digest.update(book.read())
+    return digest.hexdigest()
+
+
+def compile_books(path: str = COMPILED_BOOKS_PATH) -> np.ndarray:
+    """ Compiles both CSV books into the memory-mappable layout described by BOOK_DTYPE. """
+    books = np.stack([PageTable.from_csv(faction).to_records() for faction in FACTION_CODES])
+    save_artifact(path, books, COMPILED_BOOKS_VERSION, books_digest())
+    return books
+
+
+@lru_cache(maxsize=None)
+def _compiled_books() -> Optional[np.ndarray]:
+    return load_artifact(COMPILED_BOOKS_PATH, COMPILED_BOOKS_VERSION, books_digest())
+
+
+@lru_cache(maxsize=None)
+def get_page_table(faction: Factions) -> PageTable:
+    """ Loads a faction's book once per process; every caller shares the same table. """
+    books = _compiled_books()
+    if books is None:
+        logger.warning("No compiled books at %s, parsing the CSV (run 'python -m src.build compile-books')",
+                       COMPILED_BOOKS_PATH)
+        return PageTable.from_csv(faction)
+
+    return PageTable.from_records(faction, books[FACTION_CODES.index(faction)])
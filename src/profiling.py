@@ -0,0 +1,212 @@
+""" Opt-in profiling of a sample of requests: cProfile stats and tracemalloc snapshots, dumped as files. """
+import cProfile
+import functools
+import inspect
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+from typing import List, Optional
+
+from fastapi.routing import APIRoute
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), "aoa-profiles")
+# Frames kept per allocation in tracemalloc snapshots
+TRACE_FRAMES = 10
+
+
+class _Sample:
+    """ One sampled request, and the profile of its endpoint once it ran. """
+    __slots__ = ("profile",)
+
+    def __init__(self):
+        self.profile: Optional[cProfile.Profile] = None
+
+
+_sample: ContextVar[Optional[_Sample]] = ContextVar("profiling_sample", default=None)
+
+
+def _profiler_active() -> bool:
+    """ Whether a profiler already runs: anywhere in the process from 3.12 on, else in this thread. """
+    if sys.version_info >= (3, 12):
+        return sys.monitoring.get_tool(sys.monitoring.PROFILER_ID) is not None
+    return sys.getprofile() is not None
+
+
+def _start_profile(sample: _Sample) -> Optional[cProfile.Profile]:
+    """ Starts the sample's profile, or returns None if another profiler runs and the request goes unprofiled. """
+    if _profiler_active():
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another tool started profiling since the check
+        return None
+    sample.profile = profile
+    return profile
+
+
+class Profiler:
+    """
+    Profiles each request with probability ``sample_rate`` and dumps its endpoint's cProfile stats,
+    and with ``trace_memory`` a tracemalloc snapshot of what the request allocated and kept, into
+    ``directory``. Requests shorter than ``min_duration`` seconds are not kept. Only the newest
+    ``max_dumps`` requests' files are kept.
+
+    One profiler runs at a time: ``ProfiledRoute`` enables it where the endpoint runs, in the thread
+    pool for sync endpoints and on the event loop for async ones, where it also sees whatever else
+    the loop ran meanwhile. A sampled request arriving while another is profiled, or while some
+    other profiler is active, is served without being profiled. A sample rate of 0 leaves one
+    comparison per request and per endpoint call.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, sample_rate: float = 0.0, trace_memory: bool = False,
+                 min_duration: float = 0.0, max_dumps: int = 200):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.trace_memory = trace_memory
+        self.min_duration = min_duration
+        self.max_dumps = max_dumps
+        # Held by the one request being profiled
+        self._busy = threading.Lock()
+        self._started_tracing = False
+
+    def settings(self) -> dict:
+        return {"sample_rate": self.sample_rate, "trace_memory": self.trace_memory,
+                "min_duration_ms": self.min_duration * 1000, "directory": self.directory}
+
+    def _start_tracing(self):
+        # Left alone if it was started some other way, e.g. by PYTHONTRACEMALLOC
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            self._started_tracing = True
+
+    def _stop_tracing(self) -> tracemalloc.Snapshot:
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    def dumps(self) -> List[dict]:
+        """ The dumped files, newest first. """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        return [{"name": entry.name, "bytes": entry.stat().st_size, "created_at": entry.stat().st_mtime}
+                for entry in entries]
+
+    def dump_path(self, name: str) -> Optional[str]:
+        """ Path of a dumped file, or None if there is no such file. """
+        path = os.path.join(self.directory, os.path.basename(name))
+        return path if os.path.isfile(path) else None
+
+    def _save(self, label: str, elapsed: float, sample: _Sample, snapshot: Optional[tracemalloc.Snapshot]):
+        os.makedirs(self.directory, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-" \
+               f"{re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')}-{elapsed * 1000:.0f}ms"
+
+        if sample.profile is not None and sample.profile.getstats():
+            pstats.Stats(sample.profile).dump_stats(os.path.join(self.directory, stem + ".prof"))
+        if snapshot is not None:
+            snapshot.dump(os.path.join(self.directory, stem + ".tracemalloc"))
+
+        # One request leaves up to two files
+        for stale in self.dumps()[2 * self.max_dumps:]:
+            os.remove(os.path.join(self.directory, stale["name"]))
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if not profiler.sample_rate or scope["type"] != "http" or random.random() >= profiler.sample_rate:
+            await self.app(scope, receive, send)
+            return
+        if not profiler._busy.acquire(blocking=False):
+            # Another request is being profiled; profiles of overlapping requests would clash
+            await self.app(scope, receive, send)
+            return
+
+        sample = _Sample()
+        token = _sample.set(sample)
+        trace_memory = profiler.trace_memory
+        if trace_memory:
+            profiler._start_tracing()
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - start
+            _sample.reset(token)
+            snapshot = profiler._stop_tracing() if trace_memory else None
+            profiler._busy.release()
+
+            if elapsed >= profiler.min_duration and (sample.profile is not None or snapshot is not None):
+                route = scope.get("route")
+                label = f"{scope['method']} {route.path if route is not None else scope['path']}"
+                try:
+                    profiler._save(label, elapsed, sample, snapshot)
+                except OSError:
+                    logger.exception("Failed to save the profile of %s", label)
+
+
+def _profiled(endpoint):
+    """ Profiles an endpoint where it runs, the thread pool or the event loop, when its request was sampled. """
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def run_async(*args, **kwargs):
+            sample = _sample.get()
+            profile = _start_profile(sample) if sample is not None else None
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+        return run_async
+
+    @functools.wraps(endpoint)
+    def run(*args, **kwargs):
+        sample = _sample.get()
+        profile = _start_profile(sample) if sample is not None else None
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+    return run
+
+
+class ProfiledRoute(APIRoute):
+    """ Route class that profiles the endpoints of sampled requests. """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+
+def profiler_from_env() -> Profiler:
+    """
+    Off unless AOA_PROFILE_SAMPLE_RATE is above 0. AOA_PROFILE_TRACE_MEMORY=1 adds tracemalloc
+    snapshots, AOA_PROFILE_MIN_MS drops faster requests and AOA_PROFILE_DIR sets where files go.
+    """
+    return Profiler(
+        directory=os.environ.get("AOA_PROFILE_DIR", PROFILE_DIR),
+        sample_rate=float(os.environ.get("AOA_PROFILE_SAMPLE_RATE", 0)),
+        trace_memory=os.environ.get("AOA_PROFILE_TRACE_MEMORY") == "1",
+        min_duration=float(os.environ.get("AOA_PROFILE_MIN_MS", 0)) / 1000,
+    )
@@ -0,0 +1,243 @@
+""" Headless self-play simulator for balance studies. Run ``python -m src.simulator --help`` from the repo root. """
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional
+
+import numpy as np
+
+from src.batch_engine import BatchEngine, TurnResult, GameStatus, PLAYER, OPPONENT, DECISION_CODES
+from src.entities.entities import Factions, FleeDecision
+from src.outcome_table import get_outcome_tables, INVALID_PAGE
+from src.page_table import FACTION_CODES, MOVE_COUNT
+
+_CHASE = DECISION_CODES.index(FleeDecision.CHASE)
+_FLEE = DECISION_CODES.index(FleeDecision.FLEE)
+
+
+class RandomPolicy:
+    """ Uniformly random moves; a coin flip when lost. """
+
+    def choose_moves(self, engine: BatchEngine, game_ids, side: int, turns, rng: np.random.Generator):
+        return rng.integers(0, MOVE_COUNT, len(game_ids))
+
+    def choose_decisions(self, engine: BatchEngine, game_ids, side: int, rng: np.random.Generator):
+        return rng.integers(0, len(DECISION_CODES), len(game_ids))
+
+
+class GreedyPolicy:
+    """ Picks the move with the best damage trade against a uniformly random opponent; chases unless behind. """
+
+    def choose_moves(self, engine: BatchEngine, game_ids, side: int, turns, rng: np.random.Generator):
+        return _greedy_moves()[side, engine.creator[game_ids], engine.page[game_ids] - 1]
+
+    def choose_decisions(self, engine: BatchEngine, game_ids, side: int, rng: np.random.Generator):
+        health = engine.health[game_ids]
+        return np.where(health[:, side] >= health[:, 1 - side], _CHASE, _FLEE)
+
+
+class ScriptedPolicy:
+    """ Flies a fixed loop of manoeuvres and always gives chase. """
+    script = np.array([12, 16, 21, 9, 13, 12, 19, 24])
+
+    def choose_moves(self, engine: BatchEngine, game_ids, side: int, turns, rng: np.random.Generator):
+        return self.script[turns[game_ids] % len(self.script)]
+
+    def choose_decisions(self, engine: BatchEngine, game_ids, side: int, rng: np.random.Generator):
+        return np.full(len(game_ids), _CHASE)
+
+
+POLICIES = {
+    "random": RandomPolicy,
+    "greedy": GreedyPolicy,
+    "scripted": ScriptedPolicy,
+}
+
+
+@lru_cache(maxsize=None)
+def _greedy_moves() -> np.ndarray:
+    """ Best expected-damage move per ``[side, creator, page - 1]``; moves leading off the book are avoided. """
+    outcomes = get_outcome_tables()
+    trade = outcomes["opponent_damage"].astype(np.float32) - outcomes["player_damage"].astype(np.float32)
+    invalid = outcomes["page"] == INVALID_PAGE
+
+    player_score = np.where(invalid, -10.0, trade).mean(axis=3)
+    opponent_score = np.where(invalid, -10.0, -trade).mean(axis=2)
+    return np.stack([player_score.argmax(axis=2), opponent_score.argmax(axis=2)]).astype(np.int8)
+
+
+class SimulationStats:
+    """ Totals for a set of games; chunks from different workers are merged with ``merge``. """
+
+    def __init__(self):
+        self.games = 0
+        self.unfinished = 0
+        self.wins: Dict[str, int] = {faction.value: 0 for faction in Factions}
+        self.half_wins: Dict[str, int] = {faction.value: 0 for faction in Factions}
+        self.both_down = 0
+        self.both_fled = 0
+        self.lost_states = 0
+        self.games_with_lost_state = 0
+        self.invalid_moves = 0
+        self.turn_histogram = np.zeros(0, dtype=np.int64)
+
+    def merge(self, other: "SimulationStats"):
+        self.games += other.games
+        self.unfinished += other.unfinished
+        for faction in self.wins:
+            self.wins[faction] += other.wins[faction]
+            self.half_wins[faction] += other.half_wins[faction]
+        self.both_down += other.both_down
+        self.both_fled += other.both_fled
+        self.lost_states += other.lost_states
+        self.games_with_lost_state += other.games_with_lost_state
+        self.invalid_moves += other.invalid_moves
+
+        size = max(len(self.turn_histogram), len(other.turn_histogram))
+        self.turn_histogram = (np.pad(self.turn_histogram, (0, size - len(self.turn_histogram)))
+                               + np.pad(other.turn_histogram, (0, size - len(other.turn_histogram))))
+
+    def turn_percentile(self, percentile: float) -> int:
+        cumulative = np.cumsum(self.turn_histogram)
+        return int(np.searchsorted(cumulative, cumulative[-1] * percentile / 100)) if len(cumulative) else 0
+
+    def summary(self) -> dict:
+        turns = np.arange(len(self.turn_histogram))
+        played = max(self.games, 1)
+        return {
+            "games": self.games,
+            "unfinished": self.unfinished,
+            "win_rate": {faction: wins / played for faction, wins in self.wins.items()},
+            "half_win_rate": {faction: wins / played for faction, wins in self.half_wins.items()},
+            "both_down_rate": self.both_down / played,
+            "both_fled_rate": self.both_fled / played,
+            "lost_states_per_game": self.lost_states / played,
+            "games_with_lost_state": self.games_with_lost_state / played,
+            "invalid_moves_per_game": self.invalid_moves / played,
+            "average_turns": float((turns * self.turn_histogram).sum() / max(self.turn_histogram.sum(), 1)),
+            "turns_p50": self.turn_percentile(50),
+            "turns_p90": self.turn_percentile(90),
+            "turns_p99": self.turn_percentile(99),
+        }
+
+
+def simulate_chunk(games: int, allies_policy: str, german_policy: str, seed: np.random.SeedSequence,
+                   max_turns: int) -> SimulationStats:
+    """ Plays ``games`` complete games to the end (or ``max_turns``) and tallies them. """
+    rng = np.random.default_rng(seed)
+    policies = {
+        FACTION_CODES.index(Factions.ALLIES): POLICIES[allies_policy](),
+        FACTION_CODES.index(Factions.GERMAN): POLICIES[german_policy](),
+    }
+
+    engine = BatchEngine(capacity=games)
+    creators = rng.integers(0, len(FACTION_CODES), games).astype(np.int8)
+    game_ids = engine.add_games_by_code(creators)
+    side_factions = np.stack([creators, 1 - creators], axis=1)
+
+    turns = np.zeros(engine.capacity, dtype=np.int32)
+    lost_states = np.zeros(engine.capacity, dtype=np.int32)
+    stats = SimulationStats()
+    stats.games = games
+
+    for _ in range(max_turns):
+        playing = game_ids[engine.status[game_ids] == GameStatus.PLAYING]
+        lost = game_ids[engine.status[game_ids] == GameStatus.LOST]
+        if not len(playing) and not len(lost):
+            break
+
+        for side in (PLAYER, OPPONENT):
+            for faction_code, policy in policies.items():
+                movers = playing[side_factions[playing, side] == faction_code]
+                engine.submit_moves(movers, side, policy.choose_moves(engine, movers, side, turns, rng))
+                deciders = lost[side_factions[lost, side] == faction_code]
+                engine.submit_decisions(deciders, side, policy.choose_decisions(engine, deciders, side, rng))
+
+        resolved = engine.resolve()
+        turns[resolved.game_ids] += 1
+        results = resolved.results
+        lost_states[resolved.game_ids[results == TurnResult.LOST_EACH_OTHER]] += 1
+        stats.invalid_moves += int(np.count_nonzero(results == TurnResult.INVALID_MOVES))
+        stats.both_down += int(np.count_nonzero(results == TurnResult.BOTH_DOWN))
+        stats.both_fled += int(np.count_nonzero(results == TurnResult.BOTH_FLED))
+
+        winners = {
+            TurnResult.PLAYER_WON: (stats.wins, PLAYER),
+            TurnResult.OPPONENT_WON: (stats.wins, OPPONENT),
+            TurnResult.PLAYER_HALF_WIN: (stats.half_wins, PLAYER),
+            TurnResult.OPPONENT_HALF_WIN: (stats.half_wins, OPPONENT),
+        }
+        for result, (tally, side) in winners.items():
+            winning_factions = side_factions[resolved.game_ids[results == result], side]
+            for faction_code, count in enumerate(np.bincount(winning_factions, minlength=len(FACTION_CODES))):
+                tally[FACTION_CODES[faction_code].value] += int(count)
+
+    stats.unfinished = int(np.count_nonzero(engine.status[game_ids] != GameStatus.ENDED))
+    stats.lost_states = int(lost_states[game_ids].sum())
+    stats.games_with_lost_state = int(np.count_nonzero(lost_states[game_ids]))
+    stats.turn_histogram = np.bincount(turns[game_ids])
+    return stats
+
+
+def run_simulation(games: int, allies_policy: str = "random", german_policy: str = "random", seed: int = 0,
+                   workers: Optional[int] = None, chunk_size: int = 20000, max_turns: int = 500) -> SimulationStats:
+    """
+    Splits the games into fixed-size chunks with their own seeds, so the totals for a given seed
+    do not depend on how many workers played them.
+    """
+    chunk_games = [min(chunk_size, games - start) for start in range(0, games, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_games))
+    jobs = [
+        (count, allies_policy, german_policy, chunk_seed, max_turns)
+        for count, chunk_seed in zip(chunk_games, seeds)
+    ]
+
+    stats = SimulationStats()
+    if workers == 1:
+        for job in jobs:
+            stats.merge(simulate_chunk(*job))
+        return stats
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_stats in pool.map(simulate_chunk, *zip(*jobs)):
+            stats.merge(chunk_stats)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--allies", choices=POLICIES, default="random", help="Policy flown by the allies")
+    parser.add_argument("--german", choices=POLICIES, default="random", help="Policy flown by the germans")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes to fan out to")
+    parser.add_argument("--chunk-size", type=int, default=20000, help="Games per seeded chunk")
+    parser.add_argument("--max-turns", type=int, default=500, help="Games still going after this are abandoned")
+    parser.add_argument("--json", help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = run_simulation(args.games, args.allies, args.german, args.seed, args.workers, args.chunk_size,
+                           args.max_turns)
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        "allies_policy": args.allies,
+        "german_policy": args.german,
+        "seed": args.seed,
+        "seconds": elapsed,
+        "games_per_second": stats.games / elapsed,
+        **stats.summary(),
+    }
+    print(json.dumps(summary, indent=2))
+
+    if args.json:
+        with open(args.json, "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,32 @@
+import json
 import random
+import threading
+import time
+import uuid
 from typing import Optional, Tuple
 
 from src.entities.endgame_messages import ENDGAME_MESSAGES
-from src.entities.entities import PlayerInfo, STATUS_TEMPLATE, FireType, Factions, FleeDecision, Distance
-from src.entities.health_status import PLAYER_HEALTH_DESCRIPTIONS
-from src.page_manager import PageManager
+from src.entities.entities import PlayerInfo, STATUS_TEMPLATE, FireType, Factions, FleeDecision
+from src.entities.health_status import describe_health
+from src.outcome_table import get_outcome_table, INVALID_PAGE
+from src.page_manager import get_page_manager
+
+MOVE_RECEIVED = "Move received, waiting for opponent"
+DECISION_RECEIVED = "Decision received, waiting for opponent"
+
+
+def _with_side(pair: tuple, side: int, value) -> tuple:
+    return (value, pair[1]) if side == 0 else (pair[0], value)
 
 
 class PlayerState:
+    __slots__ = ("name", "faction", "health", "page_manager")
+
     def __init__(self, player_name: str, faction: Factions):
         self.name = player_name
         self.faction = faction
         self.health = 6.0
-        self.page_manager = PageManager(self.faction)
+        self.page_manager = get_page_manager(self.faction)
 
     def take_damage(self, amount: float):
         self.health = max(0.0, self.health - amount)
@@ -21,20 +35,33 @@ class PlayerState:
         return self.health > 0
 
     def __repr__(self):
-        # Get the first applicable description
-        description = next(desc for hp, desc in PLAYER_HEALTH_DESCRIPTIONS if self.health >= hp)
-        return f"{self.name} ({self.faction.value})\n\n{description}"
+        return f"{self.name} ({self.faction.value})\n\n{describe_health(self.health)}"
 
 
 class GameStateManager:
+    # Slotted, with pages and page managers shared between games, so a live game costs a few hundred bytes
+    __slots__ = (
+        "lock", "uid", "version", "last_message", "_snapshot", "created_at", "is_open", "player", "opponent",
+        "current_player_page", "current_opponent_page", "outcomes", "moves", "lost_state_decisions", "tailing_player",
+        "tailed_player", "tailed_page",
+    )
     null_move: Tuple[Optional[int], Optional[int]] = (None, None)
     null_lost_state: Optional[FleeDecision] = None
-    tailing_player = None
-    tailed_player = None
-    tailed_page = None
+    no_moves = (null_move, null_move)
+    no_decisions = (null_lost_state, null_lost_state)
 
     def __init__(self, player_info: PlayerInfo):
-        """ Initializes the game state, tracking both players. """
+        """ Initializes the game state, tracking both players. Callers serialize access through ``lock``. """
+        self.lock = threading.Lock()
+        # Bumped on every accepted change; the uid keeps versions of a reused game id apart
+        self.uid = uuid.uuid4().int >> 80
+        self.version = 0
+        self.last_message = "Game created"
+        self._snapshot: Optional[Tuple[int, str, bytes]] = None
+        self.created_at = time.time()
+        # Whether the game is still waiting for an opponent to join
+        self.is_open = True
+
         self.player = PlayerState(**player_info.model_dump())
         self.opponent = PlayerState(
             player_name="Opponent",
@@ -43,16 +70,75 @@ class GameStateManager:
 
         self.current_player_page = self.player.page_manager.load_page()
         self.current_opponent_page = self.opponent.page_manager.load_page()
-
-        self.moves = {
-            self.player.faction: self.null_move,
-            self.opponent.faction: self.null_move
+        self.outcomes = get_outcome_table(self.player.faction)
+
+        # Pending moves and lost-state decisions, player's first. Kept as tuples so that games with
+        # nothing pending all share the same empty pair
+        self.moves = self.no_moves
+        self.lost_state_decisions = self.no_decisions
+
+        self.tailing_player = None
+        self.tailed_player = None
+        self.tailed_page = None
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.uid:012x}.{self.version}"'
+
+    def to_state(self) -> dict:
+        """ Compact, JSON-ready form of the game for state stores shared between processes. """
+        sides = (self.player, self.opponent)
+        tailing = sides.index(self.tailing_player) if self.tailing_player else None
+
+        return {
+            "uid": self.uid,
+            "version": self.version,
+            "last_message": self.last_message,
+            "created_at": self.created_at,
+            "open": self.is_open,
+            "players": [[side.name, side.faction.value, side.health] for side in sides],
+            "pages": [self.current_player_page.page_num, self.current_opponent_page.page_num],
+            "moves": self.moves,
+            "decisions": self.lost_state_decisions,
+            "tailing": tailing,
         }
 
-        self.lost_state_decisions = {
-            self.player.faction: self.null_lost_state,
-            self.opponent.faction: self.null_lost_state
-        }
+    @classmethod
+    def from_state(cls, state: dict) -> "GameStateManager":
+        (player_name, player_faction, player_health), (opponent_name, _, opponent_health) = state["players"]
+        game = cls(PlayerInfo(player_name=player_name, faction=player_faction))
+        sides = (game.player, game.opponent)
+
+        game.uid = state["uid"]
+        game.version = state["version"]
+        game.last_message = state["last_message"]
+        game.created_at = state["created_at"]
+        game.is_open = state["open"]
+        game.opponent.name = opponent_name
+        game.player.health = player_health
+        game.opponent.health = opponent_health
+        game.current_player_page = game.player.page_manager.load_page(state["pages"][0])
+        game.current_opponent_page = game.opponent.page_manager.load_page(state["pages"][1])
+        game.moves = tuple(tuple(move) for move in state["moves"])
+        game.lost_state_decisions = tuple(
+            FleeDecision(decision) if decision else None for decision in state["decisions"]
+        )
+
+        if state["tailing"] is not None:
+            game.tailing_player = sides[state["tailing"]]
+            game.tailed_player = sides[1 - state["tailing"]]
+            game.tailed_page = (game.current_player_page, game.current_opponent_page)[1 - state["tailing"]]
+
+        return game
+
+    def add_opponent(self, player_name: str) -> dict:
+        """ Seats the second player in an open game. """
+        self.opponent = PlayerState(player_name=player_name, faction=self.opponent.faction)
+        self.is_open = False
+        return self.record_change({"message": f"{player_name} joined", "faction": self.opponent.faction})
+
+    def _side(self, faction: Factions) -> int:
+        return 0 if faction == self.player.faction else 1
 
     def submit_move(self, faction: Factions, move_index: int):
         """ Stores a submitted move and processes turn if both players have submitted. """
@@ -64,7 +150,7 @@ class GameStateManager:
         if self.tailing_player:
             if faction == self.tailing_player.faction:
                 # Tailing player can only submit after the tailed player
-                if self.moves[self.tailed_player.faction] == self.null_move:
+                if self.moves[self._side(self.tailed_player.faction)] == self.null_move:
                     return {"message": "Waiting for the tailed player to move first"}
 
         if self.player.faction == faction:
@@ -72,72 +158,95 @@ class GameStateManager:
         else:
             mid_page = self.current_opponent_page.moves[move_index].next_page
 
-        self.moves[faction] = (move_index, mid_page)
+        self.moves = _with_side(self.moves, self._side(faction), (move_index, mid_page))
 
         if self.tailed_player:
 
             if faction == self.tailed_player.faction:
                 # Get the direction of the tailed player's move
-                tailed_move_index, _ = self.moves[self.tailed_player.faction]
+                tailed_move_index, _ = self.moves[self._side(self.tailed_player.faction)]
                 tailed_direction = self.tailed_page.moves[tailed_move_index].direction.value
 
                 direction_message = {
                     "tailed_direction": tailed_direction
                 }
 
-        if self.null_move not in self.moves.values():
-            return self._process_turn()
-        return {"message": "Move received, waiting for opponent", **direction_message}
+        if self.null_move not in self.moves:
+            return self.record_change(self._process_turn())
+        return self.record_change({"message": MOVE_RECEIVED, **direction_message})
 
     def submit_lost_state_decision(self, faction: Factions, decision: FleeDecision):
         if self.current_player_page.page_num != 223 or self.current_opponent_page.page_num != 223:
             return {"message": "You aren't lost! Please submit a movement!"}
 
-        self.lost_state_decisions[faction] = decision
-
-        if None not in self.lost_state_decisions.values():
-            return self._resolve_lost_state()
-
-        return {"message": "Decision received, waiting for opponent"}
+        self.lost_state_decisions = _with_side(self.lost_state_decisions, self._side(faction), decision)
+
+        if None not in self.lost_state_decisions:
+            return self.record_change(self._resolve_lost_state())
+
+        return self.record_change({"message": DECISION_RECEIVED})
+
+    def record_change(self, message: dict) -> dict:
+        """ Marks an accepted change to the game, remembering its message for snapshots. """
+        self.version += 1
+        self.last_message = message["message"]
+        return message
+
+    def snapshot(self) -> Tuple[str, bytes]:
+        """ Returns the ETag and JSON body of the current state, serializing each version at most once. """
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            tailing = self.tailing_player.faction.value if self.tailing_player else None
+            body = json.dumps({
+                "version": self.version,
+                "page_number": self.current_player_page.page_num,
+                "players": [
+                    {"name": player.name, "faction": player.faction.value, "health": player.health}
+                    for player in (self.player, self.opponent)
+                ],
+                "tailing_faction": tailing,
+                "last_message": self.last_message,
+            }).encode()
+            self._snapshot = (self.version, self.etag, body)
+
+        return self._snapshot[1], self._snapshot[2]
 
     def _process_turn(self):
-        """ Resolves turn based on both players' moves, handling Page 223 cases. """
-        player_faction = self.player.faction
-        opponent_faction = self.opponent.faction
-
-        player_move_index, player_mid_page = self.moves[player_faction]
-        opponent_move_index, opponent_mid_page = self.moves[opponent_faction]
-
-        # Handle Page 223 case
-        if player_mid_page == 223:
-            result_page = self.player.page_manager.find_result(opponent_mid_page, player_move_index)
-        elif opponent_mid_page == 223:
-            result_page = self.opponent.page_manager.find_result(player_mid_page, opponent_move_index)
-        else:
-            # Normal case: resolve result page using opponent's mid-page
-            result_page = self.player.page_manager.find_result(opponent_mid_page, player_move_index)
+        """ Resolves turn based on both players' moves with one read of the outcome table. """
+        (player_move_index, _), (opponent_move_index, _) = self.moves
+
+        # Page 223 cases are already folded into the table
+        outcome = self.outcomes[self.current_player_page.page_num - 1, player_move_index, opponent_move_index]
+        result_page = int(outcome["page"])
 
         # Reset moves for next turn
-        self.moves = {player_faction: self.null_move, opponent_faction: self.null_move}
+        self.moves = self.no_moves
+
+        if result_page == INVALID_PAGE:
+            return {
+                "message": "Those moves lead off the edge of the book! Both players must choose again.",
+                "new_page": self.current_player_page.page_num
+            }
 
         # If result page is 223, enter the special state
         if result_page == 223:
             self.current_player_page = self.player.page_manager.load_page(result_page)
             self.current_opponent_page = self.opponent.page_manager.load_page(result_page)
             self._determine_tailing()
-            self.lost_state_decisions = {player_faction: self.null_lost_state, opponent_faction: self.null_lost_state}
+            self.lost_state_decisions = self.no_decisions
             return {"message": "Players lost each other! Choose to chase or flee.", "new_page": 223}
 
         # Update player states
-        self._resolve_turn(result_page)
+        end_message = self._resolve_turn(result_page, outcome)
+        if end_message:
+            return {**end_message, "new_page": result_page}
 
         return {"message": "Turn resolved", "new_page": result_page}
 
-    def _resolve_turn(self, result_page):
+    def _resolve_turn(self, result_page, outcome):
         self.current_player_page = self.player.page_manager.load_page(result_page)
         self.current_opponent_page = self.opponent.page_manager.load_page(result_page)
 
-        self._deal_damage()
+        self._deal_damage(outcome)
 
         player_alive = self.player.is_alive()
         opponent_alive = self.opponent.is_alive()
@@ -153,21 +262,9 @@ class GameStateManager:
 
         self._determine_tailing()
 
-    def _deal_damage(self):
-        damage = Distance.get_damage(self.current_player_page.distance)
-
-        if self.current_player_page.fire == FireType.NONE and self.current_opponent_page.fire == FireType.NONE:
-            pass
-
-        if self.current_player_page.fire == FireType.MUTUAL or self.current_opponent_page.fire == FireType.MUTUAL:
-            self.player.take_damage(damage)
-            self.opponent.take_damage(damage)
-
-        if self.current_player_page.fire == FireType.OUT or self.current_opponent_page.fire == FireType.IN:
-            self.opponent.take_damage(damage)
-
-        if self.current_player_page.fire == FireType.IN or self.current_opponent_page.fire == FireType.OUT:
-            self.player.take_damage(damage)
+    def _deal_damage(self, outcome):
+        self.player.take_damage(float(outcome["player_damage"]))
+        self.opponent.take_damage(float(outcome["opponent_damage"]))
 
     def _determine_tailing(self):
         player_is_tailing = self.current_player_page.tail
@@ -188,8 +285,7 @@ class GameStateManager:
             self.tailed_page = None
 
     def _resolve_lost_state(self):
-        player_decision = self.lost_state_decisions[self.player.faction]
-        opponent_decision = self.lost_state_decisions[self.opponent.faction]
+        player_decision, opponent_decision = self.lost_state_decisions
 
         if player_decision == FleeDecision.FLEE and opponent_decision == FleeDecision.FLEE:
             return {"message": "Both players fled. The game ends in a draw.", "game_end": True}
@@ -203,7 +299,8 @@ class GameStateManager:
         if player_decision == FleeDecision.CHASE and opponent_decision == FleeDecision.CHASE:
             self.current_player_page = self.player.page_manager.load_page()
             self.current_opponent_page = self.opponent.page_manager.load_page()
-            return {"message": "Both players chose to chase! The game resets at page 170."}
+            self.tailing_player = self.tailed_player = self.tailed_page = None
+            return {"message": "Both players chose to chase! The game resets at page 170.", "new_page": 170}
 
         return {"message": "Unexpected error in resolving lost state."}
 
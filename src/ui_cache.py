@@ -0,0 +1,72 @@
+""" Static parts of the playing page, computed once per process and shared by every session through Streamlit's caches.
+
+They live outside the page script because Streamlit re-executes the script on every rerun, which would
+redefine, and rehash the source of, every cached function each time.
+"""
+import streamlit as st
+
+from src.api_client import get_client
+from src.asset_pack import get_asset_pack
+from src.entities.entities import Factions
+from src.page_images import page_image
+
+# The page column is about 720px wide at its largest
+PAGE_IMG_WIDTH = 720
+ICON_WIDTH = 50
+# Widget key of each move button; Streamlit gives the button's container the class st-key-<key>
+MOVE_KEY = "move_{index}"
+
+
+@st.cache_resource
+def load_assets():
+    """ The asset pack, mapped once per process; the browser loads images straight from the API and caches them. """
+    return get_asset_pack()
+
+
+@st.cache_data
+def page_css() -> str:
+    """
+    Layout rules, plus the move icons: each move button's container draws its tile of the sprite atlas
+    above the button, so the grid needs no element per icon.
+    """
+    rules = [
+        ".block-container { max-width: 1300px !important; }",
+        # Let buttons wrap and fill their column, with readable text
+        "div.stButton > button { white-space: normal !important; width: 100% !important; "
+        "font-size: 10px !important; }",
+    ]
+
+    assets = load_assets()
+    atlas = assets.icon_atlas if assets else None
+    if atlas:
+        height = round(atlas["tile_height"] * ICON_WIDTH / atlas["tile_width"])
+        atlas_url = get_client().asset_url(atlas["name"])
+        background = f"url({atlas_url}) 0 0 / {ICON_WIDTH * len(atlas['icons'])}px {height}px"
+        selectors = [f".st-key-{MOVE_KEY.format(index=index)}::before" for index in atlas["icons"]]
+        rules.append(
+            f"{', '.join(selectors)} {{ content: ''; display: block; width: {ICON_WIDTH}px; height: {height}px; "
+            f"margin-bottom: 8px; background: {background}; }}"
+        )
+        rules += [
+            f"{selector} {{ background-position: -{position * ICON_WIDTH}px 0; }}"
+            for position, selector in enumerate(selectors)
+        ]
+    return "<style>\n" + "\n".join(rules) + "\n</style>"
+
+
+@st.cache_data
+def atlas_icons() -> frozenset:
+    """ Indexes of the move icons the atlas has a tile for. """
+    assets = load_assets()
+    return frozenset(assets.icon_atlas["icons"]) if assets and assets.icon_atlas else frozenset()
+
+
+@st.cache_data
+def page_image_source(faction: str, page_number: int):
+    """ URL of the pre-resized page image in the asset pack, or the path of a loose file without one. """
+    assets = load_assets()
+    page_asset = assets.page_asset(Factions(faction), page_number, PAGE_IMG_WIDTH) if assets else None
+    if page_asset:
+        return get_client().asset_url(page_asset)
+    page_img = page_image(Factions(faction), page_number, PAGE_IMG_WIDTH)
+    return page_img[0] if page_img else None
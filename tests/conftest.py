@@ -0,0 +1,11 @@
+import pytest
+
+from src.game_store import InMemoryGameStore, SqliteGameStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    """ Each backend in turn. """
+    if request.param == "sqlite":
+        return SqliteGameStore(str(tmp_path / "games.sqlite3"))
+    return InMemoryGameStore()
@@ -0,0 +1,100 @@
+import random
+
+import numpy as np
+import pytest
+
+from src.batch_engine import BatchEngine, DECISION_CODES, GameStatus, OPPONENT, PLAYER, Tailing, TurnResult
+from src.entities.entities import Factions, FleeDecision, PlayerInfo
+from src.page_table import LOST_PAGE, START_PAGE
+from src.state_manager import GameStateManager
+
+GAMES = 3000
+MAX_TURNS = 200
+
+
+def _tailing(game: GameStateManager) -> Tailing:
+    if game.tailing_player is None:
+        return Tailing.NONE
+    return Tailing.PLAYER if game.tailing_player.faction == game.player.faction else Tailing.OPPONENT
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_game_state_manager(seed):
+    """ Random games played through both engines stay identical turn by turn, lost states included. """
+    rng = random.Random(seed)
+    creators = [rng.choice(list(Factions)) for _ in range(GAMES // 3)]
+    games = []
+    for creator in creators:
+        game = GameStateManager(PlayerInfo(player_name="player", faction=creator))
+        game.add_opponent("opponent")
+        games.append(game)
+
+    engine = BatchEngine(len(games))
+    game_ids = engine.add_games(creators)
+    live = list(range(len(games)))
+
+    for _ in range(MAX_TURNS):
+        if not live:
+            break
+        ids = np.array([game_ids[index] for index in live])
+        lost = np.array([games[index].current_player_page.page_num == LOST_PAGE for index in live])
+        ended = []
+
+        moves = np.array([[rng.randrange(26), rng.randrange(26)] for _ in live], dtype=np.int8)
+        decisions = [[FleeDecision.CHASE if rng.random() < 0.7 else FleeDecision.FLEE for _ in range(2)]
+                     for _ in live]
+        for position, index in enumerate(live):
+            game = games[index]
+            if lost[position]:
+                game.submit_lost_state_decision(game.player.faction, decisions[position][PLAYER])
+                result = game.submit_lost_state_decision(game.opponent.faction, decisions[position][OPPONENT])
+            else:
+                # The tailed player moves first; order does not change the outcome otherwise
+                first, second = (OPPONENT, PLAYER) if _tailing(game) == Tailing.PLAYER else (PLAYER, OPPONENT)
+                sides = (game.player.faction, game.opponent.faction)
+                game.submit_move(sides[first], int(moves[position, first]))
+                result = game.submit_move(sides[second], int(moves[position, second]))
+            if result.get("game_end"):
+                ended.append(index)
+
+        moving = ids[~lost]
+        engine.submit_moves(moving, PLAYER, moves[~lost, PLAYER])
+        engine.submit_moves(moving, OPPONENT, moves[~lost, OPPONENT])
+        codes = np.array([[DECISION_CODES.index(decision) for decision in pair] for pair in decisions], dtype=np.int8)
+        engine.submit_decisions(ids[lost], PLAYER, codes[lost, PLAYER])
+        engine.submit_decisions(ids[lost], OPPONENT, codes[lost, OPPONENT])
+        engine.resolve()
+
+        for position, index in enumerate(live):
+            game, game_id = games[index], game_ids[index]
+            where = f"game {index}"
+            assert engine.page[game_id] == game.current_player_page.page_num, where
+            assert engine.page[game_id] == game.current_opponent_page.page_num, where
+            if index in ended:
+                continue
+            assert tuple(engine.health[game_id]) == (game.player.health, game.opponent.health), where
+            assert engine.tailing[game_id] == _tailing(game), where
+
+        ended_ids = {int(game_ids[index]) for index in ended}
+        engine_ended = {int(game_id) for game_id in ids if engine.status[game_id] == GameStatus.ENDED}
+        assert engine_ended == ended_ids
+        live = [index for index in live if index not in ended]
+
+
+def test_chase_reset_clears_tailing():
+    """ Both chasing restarts at page 170 untailed, the state the bot values a chase by. """
+    engine = BatchEngine(1)
+    game_ids = engine.add_games([Factions.GERMAN])
+    engine.page[game_ids] = LOST_PAGE
+    engine.status[game_ids] = GameStatus.LOST
+    engine.tailing[game_ids] = Tailing.PLAYER
+
+    chase = np.array([DECISION_CODES.index(FleeDecision.CHASE)], dtype=np.int8)
+    engine.submit_decisions(game_ids, PLAYER, chase)
+    engine.submit_decisions(game_ids, OPPONENT, chase)
+    resolved = engine.resolve()
+
+    assert resolved.results.tolist() == [TurnResult.CHASE_RESET]
+    assert engine.page[game_ids[0]] == START_PAGE
+    assert engine.tailing[game_ids[0]] == Tailing.NONE
+    assert engine.status[game_ids[0]] == GameStatus.PLAYING
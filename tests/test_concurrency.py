@@ -0,0 +1,27 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.concurrent_games import play_game
+from src.game_service import GameManager
+
+GAMES = 100
+TURNS = 6
+
+
+@pytest.fixture
+def frequent_switches():
+    """ Switches threads far more often than usual to shake out races. """
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_every_turn_resolves_once(store, frequent_switches):
+    """ Both players of every game submit each turn at once, through a pool the size of Starlette's. """
+    service = GameManager(store)
+    with ThreadPoolExecutor(40) as requests, ThreadPoolExecutor(GAMES) as players:
+        games = [players.submit(play_game, service, requests, f"game-{index}", TURNS, index) for index in range(GAMES)]
+        assert sum(game.result() for game in games) == 0
@@ -0,0 +1,187 @@
+import pytest
+from fastapi import HTTPException
+
+from src.entities.entities import Factions, FleeDecision, PlayerInfo
+from src.entities.request_models import CreateGameRequest, JoinGameRequest, SubmitLostRequest, SubmitMoveRequest
+from src.game_service import GameManager
+from src.game_store import SqliteGameStore
+from src.page_table import LOST_PAGE
+from src.state_manager import GameStateManager, MOVE_RECEIVED
+
+
+def _game(player_name: str = "first", faction: Factions = Factions.GERMAN) -> GameStateManager:
+    return GameStateManager(PlayerInfo(player_name=player_name, faction=faction))
+
+
+def _joined(service: GameManager, game_id: str, faction: Factions = Factions.GERMAN):
+    service.create_game(CreateGameRequest(game_id=game_id, player_name="first", faction=faction.value))
+    service.join_game(JoinGameRequest(game_id=game_id, player_name="second"))
+
+
+def test_create_refuses_a_taken_id(store):
+    assert store.create("game", _game())
+    assert not store.create("game", _game())
+    assert "game" in store
+
+
+def test_save_commits_the_checked_out_version(store):
+    store.create("game", _game())
+    with store.checkout("game") as game:
+        version = game.version
+        game.add_opponent("second")
+        assert store.save("game", game, version)
+
+    with store.read("game") as game:
+        assert game.version == version + 1
+        assert game.opponent.name == "second"
+
+
+def test_save_loses_to_a_delete(store):
+    store.create("game", _game())
+    with store.checkout("game") as game:
+        version = game.version
+        game.add_opponent("second")
+        assert store.delete("game", version)
+        assert not store.save("game", game, version)
+    assert "game" not in store
+
+
+def test_stale_copy_loses_the_compare_and_swap(tmp_path):
+    """ Only the SQLite store hands out copies; the in-memory one mutates games under their lock. """
+    store = SqliteGameStore(str(tmp_path / "games.sqlite3"))
+    store.create("game", _game())
+    with store.checkout("game") as first, store.checkout("game") as second:
+        version = first.version
+        first.add_opponent("second")
+        second.add_opponent("third")
+        assert store.save("game", first, version)
+        assert not store.save("game", second, version)
+        assert not store.delete("game", version)
+
+    with store.read("game") as game:
+        assert game.opponent.name == "second"
+
+
+def test_read_cache_drops_a_game_whose_id_was_reused(tmp_path):
+    """ A worker must not serve its cached copy of a game another worker ended and created anew. """
+    path = str(tmp_path / "games.sqlite3")
+    first_worker, second_worker = SqliteGameStore(path), SqliteGameStore(path)
+    first_service, second_service = GameManager(first_worker), GameManager(second_worker)
+
+    first_service.create_game(CreateGameRequest(game_id="game", player_name="alice", faction=Factions.GERMAN.value))
+    first_service.join_game(JoinGameRequest(game_id="game", player_name="bob"))
+    with first_worker.read("game") as game:
+        assert game.opponent.name == "bob"
+        version = game.version
+
+    assert second_worker.delete("game", version)
+    second_service.create_game(CreateGameRequest(game_id="game", player_name="carol", faction=Factions.GERMAN.value))
+    second_service.join_game(JoinGameRequest(game_id="game", player_name="dave"))
+
+    with first_worker.read("game") as game:
+        assert game.version == version
+        assert (game.player.name, game.opponent.name) == ("carol", "dave")
+    assert "dave" in first_service.get_player_status("game", "dave")
+
+
+def test_checkout_of_a_missing_game_is_a_404(store):
+    with pytest.raises(HTTPException) as raised:
+        with store.checkout("missing"):
+            pass
+    assert raised.value.status_code == 404
+
+
+def _losing_saves(store, monkeypatch, losses: int):
+    """ Makes the first ``losses`` commits lose, as if another worker committed first. Returns the attempt count. """
+    attempts = []
+    save = store.save
+
+    def losing_save(game_id, game, expected_version):
+        attempts.append(expected_version)
+        return len(attempts) > losses and save(game_id, game, expected_version)
+    monkeypatch.setattr(store, "save", losing_save)
+    return attempts
+
+
+def test_update_retries_a_lost_commit(store, monkeypatch):
+    service = GameManager(store)
+    _joined(service, "game")
+    attempts = _losing_saves(store, monkeypatch, 2)
+
+    # A move can be applied again to a game the lost attempts already changed in place
+    result = service.submit_move(SubmitMoveRequest(game_id="game", faction=Factions.GERMAN, move_index=3))
+    assert result["message"] == MOVE_RECEIVED
+    assert len(attempts) == 3
+    with store.read("game") as game:
+        assert game.moves[0][0] == 3
+
+
+def test_update_answers_409_when_every_commit_loses(store, monkeypatch):
+    service = GameManager(store)
+    _joined(service, "game")
+    with store.read("game") as game:
+        version = game.version
+    attempts = _losing_saves(store, monkeypatch, GameManager.commit_attempts)
+
+    with pytest.raises(HTTPException) as raised:
+        service.submit_move(SubmitMoveRequest(game_id="game", faction=Factions.GERMAN, move_index=0))
+    assert raised.value.status_code == 409
+    assert len(attempts) == GameManager.commit_attempts
+    if isinstance(store, SqliteGameStore):
+        # The in-memory store changed the game in place; only copies can be left untouched
+        with store.read("game") as game:
+            assert game.version == version
+            assert game.moves == game.no_moves
+
+
+def test_ended_game_is_deleted(store):
+    service = GameManager(store)
+    _joined(service, "game")
+    with store.checkout("game") as game:
+        version = game.version
+        game.current_player_page = game.player.page_manager.load_page(LOST_PAGE)
+        game.current_opponent_page = game.opponent.page_manager.load_page(LOST_PAGE)
+        game.version += 1
+        assert store.save("game", game, version)
+
+    for faction in Factions:
+        result = service.submit_lost_decision(
+            SubmitLostRequest(game_id="game", faction=faction, decision=FleeDecision.FLEE)
+        )
+    assert result["game_end"]
+    assert "game" not in store
+    with pytest.raises(HTTPException) as raised:
+        service.get_snapshot("game")
+    assert raised.value.status_code == 404
+
+
+def test_open_games_listing(store):
+    service = GameManager(store)
+    for index in range(5):
+        faction = Factions.GERMAN if index % 2 == 0 else Factions.ALLIES
+        service.create_game(CreateGameRequest(game_id=f"open-{index}", player_name=f"p{index}", faction=faction.value))
+    service.join_game(JoinGameRequest(game_id="open-2", player_name="second"))
+
+    listed = [game["game_id"] for game in service.list_available_games()["games"]]
+    assert listed == ["open-0", "open-1", "open-3", "open-4"]
+
+    german = service.list_available_games(faction=Factions.GERMAN)["games"]
+    assert [game["game_id"] for game in german] == ["open-0", "open-4"]
+
+    pages, cursor = [], None
+    while True:
+        page = service.list_available_games(cursor=cursor, limit=3)
+        pages.append([game["game_id"] for game in page["games"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == [["open-0", "open-1", "open-3"], ["open-4"]]
+
+    with store.read("open-3") as game:
+        created_at = game.created_at
+    after = service.list_available_games(created_after=created_at)["games"]
+    assert [game["game_id"] for game in after] == ["open-3", "open-4"]
+
+    with pytest.raises(HTTPException) as raised:
+        service.list_available_games(cursor="not a cursor")
+    assert raised.value.status_code == 400
@@ -0,0 +1,43 @@
+import pytest
+from fastapi import HTTPException
+
+from src.entities.entities import Factions
+from src.matchmaking import Matchmaker
+
+
+@pytest.fixture
+def matchmaker():
+    games = []
+    matchmaker = Matchmaker(lambda game_id, player_info, opponent_name: games.append(
+        (player_info.player_name, opponent_name)
+    ))
+    matchmaker.games = games
+    return matchmaker
+
+
+def test_pairs_compatible_players(matchmaker):
+    matches = []
+    first = matchmaker.enqueue("first", Factions.GERMAN, matches.append)
+    assert first.queued
+    matchmaker.enqueue("second", None, matches.append)
+
+    assert matchmaker.games == [("first", "second")]
+    assert [match["faction"] for match in matches] == ["german", "allies"]
+    assert matchmaker.waiting == 0
+
+
+def test_a_player_cannot_wait_twice(matchmaker):
+    matchmaker.enqueue("same", None, lambda match: None)
+    with pytest.raises(HTTPException) as raised:
+        matchmaker.enqueue("same", None, lambda match: None)
+    assert raised.value.status_code == 409
+    assert matchmaker.games == []
+    assert matchmaker.waiting == 1
+
+
+def test_a_cancelled_player_can_queue_again(matchmaker):
+    ticket = matchmaker.enqueue("same", None, lambda match: None)
+    assert matchmaker.cancel(ticket)
+    assert matchmaker.enqueue("same", None, lambda match: None).queued
+    matchmaker.enqueue("other", None, lambda match: None)
+    assert matchmaker.games == [("same", "other")]
@@ -0,0 +1,8 @@
+from src.outcome_table import get_outcome_tables, verify_outcomes
+from src.page_table import MOVE_COUNT, PAGE_COUNT
+
+
+def test_every_cell_matches_the_books():
+    """ The whole table, both creators, against PageManager.find_result and the page-by-page rules. """
+    outcomes = get_outcome_tables()
+    assert verify_outcomes(outcomes) == 2 * PAGE_COUNT * MOVE_COUNT * MOVE_COUNT